@@ -18,6 +18,7 @@ import streamlit as st
 import time
 import random
 import os
+from contextlib import nullcontext
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -26,12 +27,26 @@ from src.ui.styling import apply_base_styles, apply_modern_supermarket_style
 from src.ui.layout import (
     display_logo, display_chat_container, create_chat_input, 
     display_welcome_suggestions, display_followup_suggestions, 
-    display_footer
+    display_footer, get_draft_input, show_search_spinner
 )
-from src.data.product_data import load_csv_data
+from src.data import offer_store
+from src.data.disk_cache import get_response, put_response
 from src.ai.client import init_client, get_available_models
+from src.ai.model_router import route_query
+from src.data.context_format import context_format_for
+from src.ai.offer_id_answers import OUTPUT_MODE_IDS, output_mode_for, parse_offer_id_answer, render_offer_id_answer
 from src.ai.context import process_query
-from src.ai.hallucination import detect_hallucinations
+from src.ai.structured_answers import answer_structured_query
+from src.ai.prefetch import schedule_prefetch, take_prefetched
+from src.ai.prompt_cache import build_messages, usage_from_response, record_usage
+from src.ai.query_log import log_query
+from src.ai.cache_warmer import schedule_warmup
+from src.ai.token_accounting import measure_prompt, check_context_length, record_request
+from src.ai.admission import get_admission_controller
+from src.ai.stream_guard import STREAM_GUARD_ENABLED, STREAM_GUARD_RETRIES, StreamGuard, StreamHallucination, tighten_context
+from src.ai.single_flight import get_single_flight, messages_fingerprint, normalize_text
+from src.ai.hallucination import detect_hallucinations, hallucination_check_applies
+from src.ai.fact_check import fact_check_response
 from src.utils.helpers import initialize_session_state, ensure_directories, copy_csv_if_missing
 from src.ui.market_toggles import render_market_toggles, render_recipe_toggle
 
@@ -54,6 +69,15 @@ initialize_session_state(st.session_state)
 # OpenAI-Client initialisieren
 client = init_client()
 
+# Kontextformat (beschriftet oder kompakt, siehe context_format.py) und Ausgabemodus
+# (HTML oder Angebots-IDs, siehe offer_id_answers.py) des bevorzugten Modells
+model_variants = get_available_models()
+context_format = context_format_for(model_variants[0])
+output_mode = output_mode_for(model_variants[0])
+
+# Neuer Datenstand (Start oder neuer Feed): häufigste Anfragen im Hintergrund vorrechnen
+schedule_warmup(offer_store.get_offer_store(), client)
+
 # Logo und Seitentitel anzeigen
 display_logo()
 
@@ -70,6 +94,10 @@ recipe_mode = render_recipe_toggle()
 user_input_field_disabled = st.session_state.get('ki_processing', False)
 user_input = create_chat_input(disabled=user_input_field_disabled)
 
+# Kontext im Hintergrund vorberechnen, sobald Eingabetext und Marktauswahl feststehen
+if not user_input and not user_input_field_disabled:
+    schedule_prefetch(st.session_state, get_draft_input(), selected_markets, recipe_mode, context_format=context_format, output_mode=output_mode)
+
 # A. Verarbeitung einer NEUEN Benutzereingabe (wenn nicht schon KI verarbeitet)
 if user_input and not st.session_state.get('ki_processing', False):
     st.session_state.current_processing_prompt = user_input
@@ -80,126 +108,243 @@ if user_input and not st.session_state.get('ki_processing', False):
     st.session_state["key_counter"] += 1
     st.session_state["submit_text"] = None  # Wichtig, um erneute Eingabe nach Rerun zu verhindern
     
+    # Spätestens jetzt die Vorberechnung starten, sie läuft während des Reruns weiter
+    schedule_prefetch(st.session_state, user_input, selected_markets, recipe_mode, debounce=False, context_format=context_format, output_mode=output_mode)
+    
     st.rerun()
 
 # B. KI-Verarbeitung durchführen, wenn der Status dafür gesetzt ist
 if st.session_state.get('ki_processing', False) and st.session_state.get("current_processing_prompt") is not None:
     prompt = st.session_state.current_processing_prompt
     full_response = "" # Initialisierung für den Fall, dass try fehlschlägt bevor full_response zugewiesen wird
+    turn_started = time.monotonic()
+
+    # Datenstand einmal für den gesamten Durchlauf festlegen und an alle Schritte weiterreichen
+    store = offer_store.get_offer_store()
 
-    try:
-        # Hole systemnachricht und kontext, unter Berücksichtigung der ausgewählten Märkte und des Rezept-Modus
-        system_prompt, context_message, products_context = process_query(prompt, selected_markets, recipe_mode)
+    # Einfache Nachschlage-Anfragen ("Was kostet Milch bei Lidl?") werden ohne KI direkt aus den Angebotsdaten beantwortet
+    structured_answer = None
+    offer_id_answer = None # Antwort des Modells im Ausgabemodus "ids"
+    response_to_store = None # Neue Antwort des Modells für den persistenten Cache (Schlüssel, Antwort)
+    unknown_offer_ids = []
+    if not recipe_mode:
+        try:
+            structured_answer = answer_structured_query(prompt, selected_markets, store)
+        except Exception:
+            structured_answer = None # Bei Fehlern übernimmt wie bisher die KI
+
+    if structured_answer is not None:
+        full_response = structured_answer
+    else:
+        try:
+            # Modell, Antwortbudget und Temperatur nach der Komplexität der Anfrage wählen
+            # (Größe des Suchergebnisses, erkannte Absicht, Rezept-Modus; siehe data/Modelle.json)
+            routing = route_query(prompt, selected_markets, recipe_mode, model_variants, store)
+            model_variants = routing.models
+            context_format, output_mode = context_format_for(model_variants[0]), output_mode_for(model_variants[0])
+
+            # Hole systemnachricht und kontext, unter Berücksichtigung der ausgewählten Märkte und des Rezept-Modus
+            # (vorzugsweise aus der Vorberechnung im Hintergrund)
+            # Gleichzeitige identische Anfragen anderer Sitzungen teilen sich eine Suche
+            prefetched = take_prefetched(st.session_state, prompt, selected_markets, recipe_mode, store, context_format, output_mode)
+            system_prompt, context_message, products_context = prefetched or get_single_flight().do(
+                ("kontext", store.version, normalize_text(prompt), tuple(sorted(selected_markets or [])), recipe_mode, context_format, output_mode),
+                lambda: process_query(prompt, selected_markets, recipe_mode, store, context_format, output_mode)
+            )
         
-        # Erstelle die Nachrichtenliste mit garantierter Systemnachricht
-        messages_with_context = [system_prompt, context_message]
-        # Füge bisherige Nachrichten hinzu (ohne alte Systemnachrichten)
-        messages_with_context.extend([m for m in st.session_state.messages if m["role"] != "system"])
-        # Füge die AKTUELLE Benutzernachricht hinzu, damit die KI weiß, was gerade gefragt wurde
-        messages_with_context.append({"role": "user", "content": prompt})
+            # Erstelle die Nachrichtenliste: statischer Systemprompt und Chatverlauf zuerst (vom Anbieter cachebar),
+            # danach der anfrageabhängige Kontext und die AKTUELLE Benutzernachricht
+            messages_with_context = build_messages(system_prompt, context_message, st.session_state.messages, prompt)
+            # Prompt-Tokens je Bestandteil zählen (für Kontextfenster-Warnung und Kostenabrechnung)
+            prompt_budget = measure_prompt(system_prompt, context_message, st.session_state.messages, prompt)
         
-        # Zeige Ladeanimation
-        with spinner_placeholder:
-            st.markdown("""
-            <div class="search-spinner-box">
-                <div class="loader-container">
-                    <span class="search-icon">🔍</span> 
-                    <span class="loading-text">Suche läuft</span>
-                    <span class="loading-dots">...</span>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            # Zeige Ladeanimation
+            with spinner_placeholder:
+                show_search_spinner(spinner_placeholder)
+            
+                success = False
+                error_messages = []
+            
+                time.sleep(1.5) 
             
-            model_variants = get_available_models()
-            success = False
-            error_messages = []
+                # Läuft dieselbe Anfrage (gleiches Modell, gleicher Verlauf, Kontext und Frage) bereits in einer
+                # anderen Sitzung, wird deren Antwort-Stream mitgelesen. Das belegt keinen Platz für Modellaufrufe.
+                first_response_key = (model_variants[0]["id"], routing.max_tokens, routing.temperature, messages_fingerprint(messages_with_context))
+                shared_stream = get_single_flight().follow(first_response_key)
+                following = shared_stream is not None
             
-            time.sleep(1.5) 
+                # Gleiche Anfrage auf demselben Datenstand schon früher beantwortet (auch vor einem Neustart)?
+                cached_response = None if following else get_response(store, first_response_key)
             
-            for model in model_variants:
-                model_name = model["id"]
-                retry_count = 0
-                max_retries = 2
+                # Platz für den Modellaufruf anfordern: Die Anzahl gleichzeitiger Aufrufe im Prozess ist begrenzt,
+                # wartende Anfragen sehen ihre Position in der Warteschlange
+                with (nullcontext(True) if following or cached_response is not None else get_admission_controller().slot(
+                    on_wait=lambda position: show_search_spinner(spinner_placeholder, position)
+                )) as admitted:
+                    if admitted:
+                        show_search_spinner(spinner_placeholder)
+                        guard_retries = STREAM_GUARD_RETRIES
+                        for model in model_variants:
+                            model_name = model["id"]
+                            # Ausweichmodelle mit anderem Kontextformat oder Ausgabemodus erhalten einen neu aufgebauten Kontext
+                            if (context_format_for(model), output_mode_for(model)) != (context_format, output_mode):
+                                context_format, output_mode = context_format_for(model), output_mode_for(model)
+                                system_prompt, context_message, products_context = process_query(prompt, selected_markets, recipe_mode, store, context_format, output_mode)
+                                messages_with_context = build_messages(system_prompt, context_message, st.session_state.messages, prompt)
+                                prompt_budget = measure_prompt(system_prompt, context_message, st.session_state.messages, prompt)
+                            overflow_warning = check_context_length(prompt_budget, model)
+                            if overflow_warning:
+                                print(f"Warnung: {overflow_warning}")
+                                if os.getenv("DEBUG", "False").lower() in ["true", "1", "t", "yes"]:
+                                    st.warning(overflow_warning)
+                            retry_count = 0
+                            max_retries = 2
+                            last_error = None
                 
-                while retry_count <= max_retries and not success:
-                    try:
-                        if retry_count > 0:
-                            time.sleep(2)
+                            while retry_count <= max_retries and not success:
+                                try:
+                                    # Nach einem Abbruch durch die Halluzinationsprüfung sofort erneut anfragen
+                                    if retry_count > 0 and not isinstance(last_error, StreamHallucination):
+                                        time.sleep(2)
                         
-                        stream = client.chat.completions.create(
-                            model=model_name,
-                            messages=[
-                                {"role": m["role"], "content": m["content"]} 
-                                for m in messages_with_context
-                            ],
-                            extra_headers={
-                                "HTTP-Referer": "https://sparfuchs.streamlit.app/",
-                                "X-Title": "SparFuchs.de"
-                            },
-                            temperature=0.2,
-                            max_tokens=12000,
-                            stream=True
-                        )
+                                    response_key = (model_name, routing.max_tokens, routing.temperature, messages_fingerprint(messages_with_context))
+                                    new_response = None
+                                    if cached_response is not None:
+                                        # Gespeicherte Antwort aus einem früheren Lauf auf demselben Datenstand
+                                        full_response, cached_response = cached_response, None
+                                    else:
+                                        # Identische Anfragen teilen sich einen Stream, nur der erste ruft das Modell auf.
+                                        # Mitleser ohne eigenen Platz folgen auch bei Wiederholungen nur dem Leader.
+                                        if following:
+                                            stream = shared_stream or get_single_flight().follow(response_key)
+                                            if stream is None:
+                                                raise RuntimeError("Die geteilte Anfrage einer anderen Sitzung ist fehlgeschlagen")
+                                        else:
+                                            stream = get_single_flight().stream(
+                                                response_key,
+                                                lambda: client.chat.completions.create(
+                                                    model=model_name,
+                                                    messages=messages_with_context,
+                                                    extra_headers={
+                                                        "HTTP-Referer": "https://sparfuchs.streamlit.app/",
+                                                        "X-Title": "SparFuchs.de"
+                                                    },
+                                                    temperature=routing.temperature,
+                                                    max_tokens=routing.max_tokens,
+                                                    stream=True,
+                                                    stream_options={"include_usage": True}
+                                                )
+                                            )
+                                        shared_stream = None
                         
-                        response_content_parts = []
-                        for chunk in stream:
-                            content = chunk.choices[0].delta.content
-                            if content is not None:
-                                response_content_parts.append(content)
-                        full_response = "".join(response_content_parts) # full_response hier zusammensetzen
+                                        # Fettgedruckte Produktnamen schon während des Streamings prüfen (nicht im Ausgabemodus "ids")
+                                        guard = StreamGuard(prompt, store) if (
+                                            STREAM_GUARD_ENABLED and not recipe_mode and output_mode != OUTPUT_MODE_IDS) else None
                         
-                        success = True
-                        break 
-                    except Exception as e:
-                        error_messages.append(f"Fehler mit {model_name}: {str(e)}")
-                        retry_count += 1
+                                        response_content_parts = []
+                                        usage = None
+                                        for chunk in stream:
+                                            # Der letzte Chunk enthält nur den Token-Verbrauch und keine choices
+                                            if getattr(chunk, "usage", None) is not None:
+                                                usage = chunk.usage
+                                            if not chunk.choices:
+                                                continue
+                                            content = chunk.choices[0].delta.content
+                                            if content is not None:
+                                                response_content_parts.append(content)
+                                                if guard is not None and guard.feed(content):
+                                                    # Bestätigte Halluzination: Stream abbrechen, statt die Antwort zu Ende zu bezahlen
+                                                    stream.close()
+                                                    break
+                                        full_response = "".join(response_content_parts) # full_response hier zusammensetzen
+                                        # Mitgelesene Antworten verbrauchen keine Tokens und werden nicht verbucht
+                                        if stream.leader:
+                                            prompt_usage = usage_from_response(usage, model_name, system_prompt)
+                                            record_usage(st.session_state, prompt_usage)
+                                            record_request(st.session_state, model, prompt_budget, prompt_usage, full_response)
+                                            # Vollständige Antworten nach den abschließenden Prüfungen persistent speichern
+                                            if not (guard is not None and guard.tripped):
+                                                new_response = (response_key, full_response)
+
+                                        # Abgebrochene Antwort: mit strengerem Kontext erneut anfragen. Sind keine Versuche mehr
+                                        # übrig, ersetzt die abschließende Prüfung die Antwort durch den Entschuldigungstext.
+                                        if guard is not None and guard.tripped:
+                                            print(f"Halluzination im Stream erkannt ({model_name}): {guard.unknown_names}")
+                                            if guard_retries > 0:
+                                                guard_retries -= 1
+                                                context_message = tighten_context(context_message, guard.unknown_names)
+                                                messages_with_context = build_messages(system_prompt, context_message, st.session_state.messages, prompt)
+                                                prompt_budget = measure_prompt(system_prompt, context_message, st.session_state.messages, prompt)
+                                                raise StreamHallucination(guard.unknown_names)
+
+                                    # Im Ausgabemodus "ids" werden die Angebote lokal aus der Angebotstabelle gerendert
+                                    if output_mode == OUTPUT_MODE_IDS and not recipe_mode:
+                                        offer_id_answer = parse_offer_id_answer(full_response)
+                                        if offer_id_answer is None:
+                                            raise ValueError("Die Antwort enthält kein gültiges JSON mit Angebots-IDs")
+                                        full_response, unknown_offer_ids = render_offer_id_answer(offer_id_answer, store)
+                        
+                                    response_to_store = new_response
+                                    success = True
+                                    break 
+                                except Exception as e:
+                                    error_messages.append(f"Fehler mit {model_name}: {str(e)}")
+                                    last_error = e
+                                    retry_count += 1
                 
-                if success:
-                    break
+                            if success:
+                                break
             
-            if not success:
-                debug_mode = os.getenv("DEBUG", "False").lower() in ["true", "1", "t", "yes"]
-                if debug_mode:
-                    error_details = "\n\n".join(error_messages)
-                    full_response = f"Entschuldigung, ich konnte Ihre Anfrage nicht bearbeiten. Technische Details:\n\n{error_details}"
-                else:
-                    full_response = "Entschuldigung, ich konnte Ihre Anfrage nicht bearbeiten. Bitte versuchen Sie es später erneut."
+                if not admitted:
+                    full_response = "Im Moment sind sehr viele Anfragen gleichzeitig in Bearbeitung. Bitte versuchen Sie es in ein paar Sekunden erneut."
+                elif not success:
+                    debug_mode = os.getenv("DEBUG", "False").lower() in ["true", "1", "t", "yes"]
+                    if debug_mode:
+                        error_details = "\n\n".join(error_messages)
+                        full_response = f"Entschuldigung, ich konnte Ihre Anfrage nicht bearbeiten. Technische Details:\n\n{error_details}"
+                    else:
+                        full_response = "Entschuldigung, ich konnte Ihre Anfrage nicht bearbeiten. Bitte versuchen Sie es später erneut."
         
-        spinner_placeholder.empty()
+            spinner_placeholder.empty()
         
-    except Exception as e:
-        spinner_placeholder.empty() # Sicherstellen, dass Spinner auch bei äußerem Fehler geleert wird
-        debug_mode = os.getenv("DEBUG", "False").lower() in ["true", "1", "t", "yes"]
-        if debug_mode:
-            full_response = f"Entschuldigung, ein unerwarteter Fehler ist aufgetreten: {str(e)}"
-        else:
-            full_response = "Entschuldigung, ein unerwarteter Fehler ist aufgetreten. Bitte versuchen Sie es später erneut."
+        except Exception as e:
+            spinner_placeholder.empty() # Sicherstellen, dass Spinner auch bei äußerem Fehler geleert wird
+            debug_mode = os.getenv("DEBUG", "False").lower() in ["true", "1", "t", "yes"]
+            if debug_mode:
+                full_response = f"Entschuldigung, ein unerwarteter Fehler ist aufgetreten: {str(e)}"
+            else:
+                full_response = "Entschuldigung, ein unerwarteter Fehler ist aufgetreten. Bitte versuchen Sie es später erneut."
     
     # Überprüfe, ob die Antwort halluzinierte Produkte enthält
-    df = load_csv_data()
-    is_category_query = False
-    kategorie_begriffe = ["getränke", "obst", "gemüse", "lebensmittel", "produkte", "angebote", "tiefkühlkost", 
-                          "backwaren", "milchprodukte", "fleisch", "wurst", "kategorie", "alle"]
-    produkt_begriffe = ["rum", "vodka", "whiskey", "whisky", "bier", "wein", "sekt", "chips", "schokolade", "kaffee", 
-                       "nudeln", "reis", "milch", "käse", "joghurt", "fleisch", "wurst", "gemüse", "obst",
-                       "cola", "fanta", "sprite", "limonade", "wasser", "havana"]
-    is_product_query = False
-    for begriff in produkt_begriffe:
-        if begriff in prompt.lower(): # prompt ist hier definiert
-            is_product_query = True
-            break
-    for begriff in kategorie_begriffe:
-        if begriff in prompt.lower(): # prompt ist hier definiert
-            is_category_query = True
-            break
-    
-    if not (recipe_mode or ((is_category_query or is_product_query) and not ("kein" in full_response.lower() and "nicht" in full_response.lower()))):
-        if detect_hallucinations(full_response, df):
-            full_response = (
-                "Entschuldigung, ich kann zu dieser Anfrage keine genauen Informationen finden. "
-                "Ich kann nur Informationen zu Produkten geben, die tatsächlich in den aktuellen Angeboten von Aldi und Lidl vorhanden sind.\n\n"
-                "**Hinweis:** Bitte versuchen Sie eine andere Anfrage zu Produkten, die in den aktuellen Angeboten enthalten sein könnten."
-            )
+    hallucination_response = (
+        "Entschuldigung, ich kann zu dieser Anfrage keine genauen Informationen finden. "
+        "Ich kann nur Informationen zu Produkten geben, die tatsächlich in den aktuellen Angeboten von Aldi und Lidl vorhanden sind.\n\n"
+        "**Hinweis:** Bitte versuchen Sie eine andere Anfrage zu Produkten, die in den aktuellen Angeboten enthalten sein könnten."
+    )
+
+    # Im Ausgabemodus "ids" ist die Halluzinationsprüfung eine Existenzprüfung der genannten IDs
+    # (unbekannte IDs wurden beim Rendern bereits ausgelassen)
+    if offer_id_answer is not None and unknown_offer_ids:
+        print(f"Unbekannte Angebots-IDs in der Antwort: {unknown_offer_ids}")
+        if len(unknown_offer_ids) == len(offer_id_answer.offer_ids):
+            full_response = hallucination_response
+
+    if structured_answer is None and offer_id_answer is None and not recipe_mode and hallucination_check_applies(prompt, full_response):
+        if detect_hallucinations(full_response, store=store):
+            full_response = hallucination_response
+
+    # Preise, Gültigkeit und Supermarkt der genannten Angebote mit den Angebotsdaten abgleichen
+    # (im Ausgabemodus "ids" stammen sie bereits aus der Angebotstabelle)
+    if structured_answer is None and offer_id_answer is None and full_response:
+        fact_check = fact_check_response(full_response, store=store)
+        if fact_check.corrections:
+            print(f"Faktenprüfung: {len(fact_check.corrections)} Angaben korrigiert: "
+                  + ", ".join(f"{c.name} {c.field} {c.stated} -> {c.actual}" for c in fact_check.corrections))
+        full_response = fact_check.text
+
+    # Nur Antworten speichern, die nicht als Halluzination verworfen wurden
+    if response_to_store is not None and full_response != hallucination_response:
+        put_response(store, *response_to_store)
     
     # Benutzernachricht zum Chat hinzufügen, direkt vor der KI-Antwort
     if st.session_state.get("current_processing_prompt"): # Sicherstellen, dass der Prompt noch da ist
@@ -208,6 +353,9 @@ if st.session_state.get('ki_processing', False) and st.session_state.get("curren
     if full_response: # Auch Fehlerantworten werden hinzugefügt, um den Nutzer zu informieren
         st.session_state.messages.append({"role": "assistant", "content": full_response})
     
+    # Anfrage für das Vorwärmen nach dem nächsten Datenstand protokollieren
+    log_query(prompt, selected_markets, recipe_mode, time.monotonic() - turn_started)
+
     # Verarbeitung abgeschlossen
     if "current_processing_prompt" in st.session_state:
         del st.session_state.current_processing_prompt
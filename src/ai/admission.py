@@ -0,0 +1,156 @@
+"""
+Zugangskontrolle für KI-Anfragen.
+
+Jede Streamlit-Sitzung ruft das Sprachmodell in ihrem eigenen Script-Thread auf.
+Damit bei vielen gleichzeitigen Anfragen nicht alle Sitzungen zugleich in die
+Ratenbegrenzung des Anbieters laufen, begrenzt dieses Modul die Anzahl gleichzeitiger
+Modellaufrufe pro Prozess. Weitere Anfragen warten in einer Warteschlange (in
+Ankunftsreihenfolge) und sehen ihre Position. Ist die Warteschlange voll oder dauert
+das Warten zu lange, erhält die Sitzung sofort eine "Bitte später erneut"-Antwort.
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+import streamlit as st
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+# Maximale Anzahl gleichzeitiger Modellaufrufe pro Prozess
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("SPARFUCHS_MAX_LLM_CALLS", "4"))
+
+# Maximale Anzahl wartender Anfragen, darüber wird sofort abgelehnt
+MAX_QUEUE_DEPTH = int(os.getenv("SPARFUCHS_MAX_LLM_QUEUE", "20"))
+
+# Maximale Wartezeit in der Warteschlange in Sekunden
+MAX_QUEUE_WAIT_SECONDS = 30
+
+# Intervall, in dem wartende Anfragen ihre Position aktualisieren
+QUEUE_POLL_SECONDS = 0.5
+
+@dataclass
+class AdmissionStats:
+    """
+    Kennzahlen der Zugangskontrolle.
+
+    Attributes:
+        active (int): Laufende Modellaufrufe
+        queue_depth (int): Aktuell wartende Anfragen
+        max_queue_depth (int): Höchste beobachtete Warteschlangenlänge
+        admitted (int): Zugelassene Anfragen
+        rejected (int): Wegen voller Warteschlange sofort abgelehnte Anfragen
+        timed_out (int): Nach Ablauf der Wartezeit abgelehnte Anfragen
+    """
+    active: int = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    admitted: int = 0
+    rejected: int = 0
+    timed_out: int = 0
+
+class AdmissionController:
+    """
+    Begrenzt gleichzeitige Modellaufrufe und vergibt freie Plätze in Ankunftsreihenfolge.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_LLM_CALLS, max_queue_depth: int = MAX_QUEUE_DEPTH):
+        self.max_concurrent = max(max_concurrent, 1)
+        self.max_queue_depth = max_queue_depth
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._stats = AdmissionStats()
+
+    def stats(self) -> AdmissionStats:
+        """
+        Liefert eine Kopie der aktuellen Kennzahlen.
+        """
+        with self._condition:
+            return AdmissionStats(**vars(self._stats))
+
+    def acquire(self, timeout: float = MAX_QUEUE_WAIT_SECONDS, on_wait=None) -> bool:
+        """
+        Wartet auf einen freien Platz für einen Modellaufruf.
+
+        Args:
+            timeout (float): Maximale Wartezeit in Sekunden
+            on_wait (callable | None): Wird während des Wartens mit der Position in der
+                                       Warteschlange (1 = als Nächstes) aufgerufen
+
+        Returns:
+            bool: True, wenn der Platz vergeben wurde (danach release() aufrufen),
+                  False bei voller Warteschlange oder abgelaufener Wartezeit
+        """
+        ticket = object()
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if len(self._queue) >= self.max_queue_depth:
+                self._stats.rejected += 1
+                return False
+            self._queue.append(ticket)
+            self._stats.queue_depth = len(self._queue)
+            self._stats.max_queue_depth = max(self._stats.max_queue_depth, len(self._queue))
+
+            # Bricht on_wait ab (z.B. StopException/RerunException von Streamlit, wenn die Sitzung endet),
+            # muss das Ticket die Warteschlange verlassen, sonst blockiert es alle späteren Anfragen
+            try:
+                last_position = None
+                while self._queue[0] is not ticket or self._stats.active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._queue.remove(ticket)
+                        self._stats.queue_depth = len(self._queue)
+                        self._stats.timed_out += 1
+                        self._condition.notify_all()
+                        return False
+                    position = self._queue.index(ticket) + 1
+                    if on_wait is not None and position != last_position:
+                        last_position = position
+                        # Rückruf ohne gehaltene Sperre, damit die Oberfläche andere Threads nicht blockiert
+                        self._condition.release()
+                        try:
+                            on_wait(position)
+                        finally:
+                            self._condition.acquire()
+                        continue
+                    self._condition.wait(min(remaining, QUEUE_POLL_SECONDS))
+            except BaseException:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                self._stats.queue_depth = len(self._queue)
+                self._condition.notify_all()
+                raise
+
+            self._queue.popleft()
+            self._stats.queue_depth = len(self._queue)
+            self._stats.active += 1
+            self._stats.admitted += 1
+            self._condition.notify_all()
+            return True
+
+    def release(self) -> None:
+        """
+        Gibt einen mit acquire() erhaltenen Platz wieder frei.
+        """
+        with self._condition:
+            self._stats.active = max(self._stats.active - 1, 0)
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, timeout: float = MAX_QUEUE_WAIT_SECONDS, on_wait=None):
+        """
+        Kontextmanager um einen Modellaufruf; liefert True, wenn der Aufruf stattfinden darf.
+        """
+        admitted = self.acquire(timeout=timeout, on_wait=on_wait)
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self.release()
+
+@st.cache_resource
+def get_admission_controller() -> AdmissionController:
+    """
+    Liefert die prozessweit geteilte Zugangskontrolle.
+    """
+    return AdmissionController()
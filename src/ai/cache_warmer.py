@@ -0,0 +1,224 @@
+"""
+Vorwärmen der Zwischenspeicher mit den häufigsten Anfragen.
+
+Nach einem neuen Datenstand (Start des Prozesses oder neuer Feed, z.B. montags) sind
+Suchergebnisse, Kontexte und gespeicherte Antworten des alten Stands nicht mehr gültig,
+gerade dann, wenn die meisten Anfragen kommen. Sobald app.py einen noch nicht gewärmten
+Datenstand sieht, rechnet ein Hintergrund-Thread deshalb die häufigsten Anfragen aus dem
+Anfrageprotokoll (query_log.py) über denselben Weg wie ein Chat-Durchlauf vor:
+strukturierte Antwort bzw. Modellwahl und Kontext (process_query). Das füllt den
+Speicher für Suchergebnisse und Kontexte sowie den persistenten Cache.
+
+Mit SPARFUCHS_WARM_LLM werden zusätzlich die Antworten des Modells für die erste Frage
+einer Sitzung (ohne Verlauf) abgerufen und im persistenten Cache gespeichert, sofern sie
+die Halluzinationsprüfung bestehen. Das kostet Tokens und ist deshalb abgeschaltet.
+
+Aufruf ohne App (z.B. direkt nach dem Feed-Import):
+    python -m src.ai.cache_warmer [--llm] [--top N]
+"""
+from __future__ import annotations
+import argparse
+import os
+import threading
+import time
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+from .admission import get_admission_controller
+from .client import get_available_models, init_client
+from .context import process_query
+from .hallucination import detect_hallucinations, hallucination_check_applies
+from .model_router import route_query
+from .offer_id_answers import OUTPUT_MODE_IDS, output_mode_for, parse_offer_id_answer
+from .prompt_cache import build_messages, usage_from_response
+from .query_log import top_queries
+from .single_flight import get_single_flight, messages_fingerprint, normalize_text
+from .structured_answers import answer_structured_query
+from .token_accounting import measure_prompt, record_request
+from ..data import offer_store
+from ..data.context_format import context_format_for
+from ..data.disk_cache import get_response, put_response
+
+# Ob nach einem neuen Datenstand automatisch vorgewärmt wird
+CACHE_WARMING_ENABLED = os.getenv("SPARFUCHS_CACHE_WARMING", "true").lower() in ["true", "1", "t", "yes"]
+
+# Anzahl der häufigsten Anfragen, die vorgerechnet werden
+WARM_TOP_QUERIES = int(os.getenv("SPARFUCHS_WARM_TOP", "50"))
+
+# Ob auch die Antworten des Modells abgerufen werden (verbraucht Tokens)
+WARM_LLM = os.getenv("SPARFUCHS_WARM_LLM", "false").lower() in ["true", "1", "t", "yes"]
+
+@dataclass
+class WarmupResult:
+    """
+    Ergebnis eines Vorwärm-Durchlaufs.
+
+    Attributes:
+        version (str): Der gewärmte Datenstand (OfferStore.version)
+        queries (int): Vorgerechnete Anfragen
+        structured (int): Davon ohne KI beantwortet (strukturierte Antworten)
+        responses (int): Neu gespeicherte Antworten des Modells
+        cached_responses (int): Bereits gespeicherte Antworten des Modells
+        failed (int): Anfragen, bei denen ein Fehler auftrat
+        seconds (float): Dauer in Sekunden
+    """
+    version: str
+    queries: int = 0
+    structured: int = 0
+    responses: int = 0
+    cached_responses: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+class _WarmupState:
+    """
+    Die bereits gewärmten bzw. gerade gewärmten Datenstände dieses Prozesses.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.versions = set()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sparfuchs-warmup")
+
+@st.cache_resource
+def _get_warmup_state() -> _WarmupState:
+    return _WarmupState()
+
+def _warm_response(client, store, prompt: str, routing, system_prompt: dict, context_message: dict,
+                   context_format: str, output_mode: str, recipe_mode: bool) -> bool | None:
+    """
+    Ruft die Antwort des bevorzugten Modells ab und speichert sie unter demselben Schlüssel wie app.py.
+
+    Returns:
+        bool | None: True, wenn eine neue Antwort gespeichert wurde, False, wenn schon eine vorlag,
+                     None, wenn keine Antwort gespeichert werden konnte
+    """
+    model = routing.models[0]
+    if (context_format_for(model), output_mode_for(model)) != (context_format, output_mode):
+        return None
+    messages = build_messages(system_prompt, context_message, [], prompt)
+    key = (model["id"], routing.max_tokens, routing.temperature, messages_fingerprint(messages))
+    if get_response(store, key) is not None:
+        return False
+
+    # Vorwärmen nimmt keinen Platz ein, wenn Anfragen warten oder die Modellaufrufe ausgelastet sind
+    admission = get_admission_controller()
+    admission_stats = admission.stats()
+    if admission_stats.queue_depth > 0 or admission_stats.active >= admission.max_concurrent:
+        return None
+    with admission.slot() as admitted:
+        if not admitted:
+            return None
+        completion = client.chat.completions.create(
+            model=model["id"],
+            messages=messages,
+            extra_headers={
+                "HTTP-Referer": "https://sparfuchs.streamlit.app/",
+                "X-Title": "SparFuchs.de"
+            },
+            temperature=routing.temperature,
+            max_tokens=routing.max_tokens,
+        )
+    response = completion.choices[0].message.content or ""
+    record_request({}, model, measure_prompt(system_prompt, context_message, [], prompt),
+                   usage_from_response(getattr(completion, "usage", None), model["id"], system_prompt), response)
+
+    # Nur Antworten speichern, die app.py nicht verwerfen würde
+    if output_mode == OUTPUT_MODE_IDS and not recipe_mode:
+        if parse_offer_id_answer(response) is None:
+            return None
+    elif not recipe_mode and hallucination_check_applies(prompt, response) and detect_hallucinations(response, store=store):
+        return None
+    put_response(store, key, response)
+    return True
+
+def warm_caches(store=None, limit: int = WARM_TOP_QUERIES, llm: bool = WARM_LLM, client=None) -> WarmupResult:
+    """
+    Rechnet die häufigsten Anfragen aus dem Anfrageprotokoll auf einem Datenstand vor.
+
+    Args:
+        store (OfferStore | None): Der zu wärmende Datenstand (Standard: der aktuelle)
+        limit (int): Anzahl der häufigsten Anfragen
+        llm (bool): Ob auch die Antworten des Modells abgerufen und gespeichert werden
+        client: Der OpenAI-Client für llm (Standard: init_client())
+
+    Returns:
+        WarmupResult: Die Kennzahlen des Durchlaufs
+    """
+    store = store if store is not None else offer_store.get_offer_store()
+    result = WarmupResult(store.version)
+    started = time.monotonic()
+    models = get_available_models()
+    if llm and client is None:
+        client = init_client()
+
+    for query in top_queries(limit):
+        prompt, selected_markets, recipe_mode = query.prompt, query.selected_markets, query.recipe_mode
+        try:
+            result.queries += 1
+            if not recipe_mode and answer_structured_query(prompt, selected_markets, store) is not None:
+                result.structured += 1
+                continue
+            routing = route_query(prompt, selected_markets, recipe_mode, models, store)
+            context_format, output_mode = context_format_for(routing.models[0]), output_mode_for(routing.models[0])
+            # Gleicher Schlüssel wie in app.py: gleichzeitige Anfragen von Sitzungen teilen sich die Suche
+            system_prompt, context_message, _ = get_single_flight().do(
+                ("kontext", store.version, normalize_text(prompt), tuple(sorted(selected_markets)), recipe_mode, context_format, output_mode),
+                lambda: process_query(prompt, selected_markets, recipe_mode, store, context_format, output_mode)
+            )
+            if llm and client is not None:
+                stored = _warm_response(client, store, prompt, routing, system_prompt, context_message,
+                                        context_format, output_mode, recipe_mode)
+                result.responses += stored is True
+                result.cached_responses += stored is False
+        except Exception as e:
+            result.failed += 1
+            print(f"Vorwärmen von '{prompt}' fehlgeschlagen: {e}")
+
+    result.seconds = time.monotonic() - started
+    return result
+
+def _run_warmup(store, client) -> None:
+    result = warm_caches(store, client=client)
+    print(f"Cache für {result.version} vorgewärmt: {result.queries} Anfragen ({result.structured} strukturiert, "
+          f"{result.responses} neue und {result.cached_responses} vorhandene Antworten, {result.failed} Fehler) "
+          f"in {result.seconds:.1f} s")
+
+def schedule_warmup(store, client=None) -> bool:
+    """
+    Startet das Vorwärmen im Hintergrund, wenn der Datenstand in diesem Prozess noch nicht gewärmt wurde.
+
+    Args:
+        store (OfferStore): Der Angebotsspeicher des Durchlaufs
+        client: Der OpenAI-Client für SPARFUCHS_WARM_LLM
+
+    Returns:
+        bool: True, wenn ein Vorwärm-Durchlauf gestartet wurde
+    """
+    if not CACHE_WARMING_ENABLED or store.empty:
+        return False
+    state = _get_warmup_state()
+    with state.lock:
+        if store.version in state.versions:
+            return False
+        state.versions.add(store.version)
+    state.executor.submit(_run_warmup, store, client)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Rechnet die häufigsten Anfragen aus dem Anfrageprotokoll vor.")
+    parser.add_argument("--llm", action="store_true", help="Auch die Antworten des Modells abrufen und speichern")
+    parser.add_argument("--top", type=int, default=WARM_TOP_QUERIES, help="Anzahl der häufigsten Anfragen")
+    args = parser.parse_args()
+    load_dotenv()
+
+    result = warm_caches(limit=args.top, llm=args.llm)
+    print(f"{result.queries} Anfragen vorgerechnet ({result.structured} strukturiert, {result.failed} Fehler) in {result.seconds:.1f} s")
+    if args.llm:
+        print(f"Antworten: {result.responses} neu gespeichert, {result.cached_responses} bereits vorhanden")
+
+if __name__ == "__main__":
+    main()
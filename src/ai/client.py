@@ -10,6 +10,8 @@ import httpx
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from .model_router import load_model_registry
+
 def init_client():
     """
     Initialisiert und konfiguriert den OpenAI-Client für OpenRouter.
@@ -75,20 +77,27 @@ def init_client():
                 traceback.print_exc()
                 raise RuntimeError("Konnte OpenAI-Client nicht initialisieren")
 
+# Eingebaute Modelle, falls die Modellregistrierung fehlt (siehe model_router.py)
+DEFAULT_MODELS = [
+    {
+        "id": "x-ai/grok-3-mini-beta",
+        "name": "xAI: Grok 3 Mini Beta",
+        "context_length": 131072,
+        "is_free": True,
+        # Preise in USD je Million Tokens (für kostenpflichtige Modelle die Listenpreise von OpenRouter)
+        "pricing": {"prompt": 0.0, "completion": 0.0},
+        "provider": { "sort": "throughput", "name": "OpenRouter"}
+    }
+]
+
 def get_available_models():
     """
     Gibt eine Liste der verfügbaren Modelle und ihre Eigenschaften zurück.
     
+    Die Modelle stammen aus der Modellregistrierung (data/Modelle.json), ohne sie gilt DEFAULT_MODELS.
+    
     Returns:
         list: Liste von Dictionaries mit Modellnamen und Eigenschaften
     """
-    # Vordefinierte Liste der bekannten Modelle, die wir bevorzugt verwenden
-    return [
-        {
-            "id": "x-ai/grok-3-mini-beta",
-            "name": "xAI: Grok 3 Mini Beta",
-            "context_length": 4000,
-            "is_free": True,
-            "provider": { "sort": "throughput", "name": "OpenRouter"}
-        }
-    ] 
\ No newline at end of file
+    # Liste der bekannten Modelle, die wir bevorzugt verwenden
+    return load_model_registry().models or DEFAULT_MODELS
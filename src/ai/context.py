@@ -4,8 +4,13 @@ Kontextgenerierung für KI-Anfragen.
 Dieses Modul enthält Funktionen für die Erstellung von optimierten Kontexten
 für KI-Anfragen basierend auf Benutzeranfragen und Produktdaten.
 """
+from __future__ import annotations
 import re
-from ..data.product_data import get_filtered_products_context, load_recipes, load_csv_data
+from ..data.product_data import get_filtered_products_context, get_validity_window, load_recipes
+from ..data import offer_store
+from ..data.context_format import DEFAULT_CONTEXT_FORMAT
+from .offer_id_answers import DEFAULT_OUTPUT_MODE, OUTPUT_MODE_IDS, get_offer_id_system_prompt
+from ..utils.text_normalization import normalize_phrase
 from ..utils.ingredient_parser import extract_main_ingredients
 import pandas as pd
 
@@ -130,7 +135,8 @@ def get_recipe_system_prompt():
     }
     return system_prompt
 
-def process_query(prompt: str, selected_markets: list[str], recipe_mode: bool):
+def process_query(prompt: str, selected_markets: list[str], recipe_mode: bool, store=None,
+                  context_format: str = DEFAULT_CONTEXT_FORMAT, output_mode: str = DEFAULT_OUTPUT_MODE):
     """
     Verarbeitet eine Benutzeranfrage und bereitet den Kontext für die KI-Antwort vor.
     
@@ -141,6 +147,11 @@ def process_query(prompt: str, selected_markets: list[str], recipe_mode: bool):
         prompt (str): Die Anfrage des Benutzers
         selected_markets (list[str]): Die vom Benutzer ausgewählten Supermärkte.
         recipe_mode (bool): Gibt an, ob der Rezeptfinder-Modus aktiv ist.
+        store (OfferStore | None): Der Angebotsspeicher dieses Durchlaufs (siehe offer_store.get_offer_store).
+            Wird einmal aufgelöst und an alle Suchen weitergereicht.
+        context_format (str): Kodierung der Angebote im Kontext (siehe context_format.py)
+        output_mode (str): Ausgabemodus des Modells; bei "ids" antwortet es mit Angebots-IDs
+            (siehe offer_id_answers.py). Im Rezeptmodus gilt immer das HTML-Format.
         
     Returns:
         tuple: (system_prompt, context_message, products_context)
@@ -149,27 +160,32 @@ def process_query(prompt: str, selected_markets: list[str], recipe_mode: bool):
                - products_context: Gefilterte Produktdaten als Text
     """
     try:
+        # Ein Datenstand für die gesamte Anfrage
+        store = store if store is not None else offer_store.get_offer_store()
+
         # Systemprompt
+        with_ids = output_mode == OUTPUT_MODE_IDS and not recipe_mode
         if recipe_mode:
             system_prompt = get_recipe_system_prompt()
+        elif with_ids:
+            system_prompt = get_offer_id_system_prompt()
         else:
             system_prompt = get_system_prompt()
         
         # Kontext aus der CSV-Datei holen (gefiltert basierend auf der Anfrage und ausgewählten Märkten)
-        products_context = get_filtered_products_context(prompt, selected_markets)
+        products_context = get_filtered_products_context(prompt, selected_markets, store, context_format, with_ids)
         
         # Rezeptkontext hinzufügen, wenn der Modus aktiv ist
         raw_data_context = "" # Wird für Debugging oder spezifische Anzeige verwendet
         
         if recipe_mode:
             recipes_df = load_recipes()
-            angebote_df = load_csv_data() # Geändert: load_processed_data zu load_csv_data
             
             context_message_content = "Es konnten keine Rezeptdaten geladen werden oder es wurden keine passenden Rezepte für deine Anfrage gefunden." # Standardnachricht
             
             if recipes_df.empty:
                 context_message_content = "Ich konnte leider keine Rezepte-Datenbank laden."
-            elif angebote_df.empty:
+            elif store.empty:
                 context_message_content = "Ich konnte Rezepte laden, aber leider keine Angebots-Datenbank. Daher kann ich keine Angebote zu den Zutaten suchen."
             else:
                 # Extrahiere Schlüsselwörter aus dem Prompt (mind. 3 Zeichen)
@@ -235,48 +251,36 @@ def process_query(prompt: str, selected_markets: list[str], recipe_mode: bool):
                     if not all_main_ingredients_from_found_recipes:
                         angebote_fuer_zutaten_text += "Es konnten keine Hauptzutaten aus den Rezepten extrahiert werden, um nach Angeboten zu suchen.\n"
                     else:
-                        # Angebotsdaten filtern, falls Märkte ausgewählt wurden
-                        if selected_markets:
-                            angebote_df_filtered_markets = angebote_df[angebote_df['Supermarkt'].isin(selected_markets)].copy()
-                        else:
-                            angebote_df_filtered_markets = angebote_df.copy()
+                        # Angebotsdaten der ausgewählten Märkte aus dem partitionierten Speicher
+                        # (nur Angebote, die im Gültigkeitszeitraum der Anfrage gültig sind)
+                        valid_rows = store.valid_rows(*get_validity_window(prompt, store))
+                        angebote_df_filtered_markets = store.frame(selected_markets, valid_rows)
 
                         if angebote_df_filtered_markets.empty and selected_markets:
                             angebote_fuer_zutaten_text += f"Ich habe keine Angebote in den ausgewählten Märkten ({', '.join(selected_markets)}) gefunden.\n"
                         elif angebote_df_filtered_markets.empty:
                              angebote_fuer_zutaten_text += "Ich habe aktuell keine Angebote in meiner Datenbank.\n"
                         else:
-                            # Datumsspalten korrekt formatieren, falls sie nicht bereits Strings sind
-                            for col in ['Startdatum', 'Enddatum']:
-                                if col in angebote_df_filtered_markets.columns and not pd.api.types.is_string_dtype(angebote_df_filtered_markets[col]):
-                                    try:
-                                        angebote_df_filtered_markets[col] = pd.to_datetime(angebote_df_filtered_markets[col]).dt.strftime('%d.%m.%Y')
-                                    except Exception:
-                                        # Fallback, falls Konvertierung fehlschlägt, als String belassen
-                                        angebote_df_filtered_markets[col] = angebote_df_filtered_markets[col].astype(str)
-                            
                             offers_for_prompt = []
                             missing_ingredients_offers = list(all_main_ingredients_from_found_recipes) # Kopie für die Verfolgung
 
                             for zutat in sorted(list(all_main_ingredients_from_found_recipes)):
-                                zutat_lower = zutat.lower()
-                                # Suche in Produktname, Kategorie, Unterkategorie
-                                # pd.Series.str.contains() erwartet, dass die Spalte String-Typ ist. Konvertiere bei Bedarf.
-                                # Wir stellen sicher, dass Spalten existieren und Strings sind, bevor wir .str.contains verwenden
-                                produkt_mask = pd.Series(False, index=angebote_df_filtered_markets.index)
-                                if 'Produktname' in angebote_df_filtered_markets.columns and pd.api.types.is_string_dtype(angebote_df_filtered_markets['Produktname']):
-                                    produkt_mask |= angebote_df_filtered_markets['Produktname'].str.contains(zutat_lower, case=False, na=False)
-                                
-                                kategorie_mask = pd.Series(False, index=angebote_df_filtered_markets.index)
-                                if 'Kategorie' in angebote_df_filtered_markets.columns and pd.api.types.is_string_dtype(angebote_df_filtered_markets['Kategorie']):
-                                    kategorie_mask |= angebote_df_filtered_markets['Kategorie'].str.contains(zutat_lower, case=False, na=False)
-                                
-                                unterkategorie_mask = pd.Series(False, index=angebote_df_filtered_markets.index)
-                                if 'Unterkategorie' in angebote_df_filtered_markets.columns and pd.api.types.is_string_dtype(angebote_df_filtered_markets['Unterkategorie']):
-                                    unterkategorie_mask |= angebote_df_filtered_markets['Unterkategorie'].str.contains(zutat_lower, case=False, na=False)
-                                
-                                combined_mask = produkt_mask | kategorie_mask | unterkategorie_mask
-                                passende_angebote = angebote_df_filtered_markets[combined_mask]
+                                # Suche in Produktname, Kategorie, Unterkategorie über die Suchindizes der ausgewählten Märkte
+                                zutat_phrase = normalize_phrase(zutat)
+                                if not zutat_phrase:
+                                    continue
+                                passende_angebote = store.rows_to_frame(store.find_rows({zutat_phrase}, selected_markets, valid_rows))
+
+                                # Datumsspalten korrekt formatieren, falls sie nicht bereits Strings sind
+                                # (auf einer Kopie, der gemeinsame Angebotsspeicher bleibt unverändert)
+                                for col in ['Startdatum', 'Enddatum']:
+                                    if col in passende_angebote.columns and not pd.api.types.is_string_dtype(passende_angebote[col]):
+                                        passende_angebote = passende_angebote.copy()
+                                        try:
+                                            passende_angebote[col] = pd.to_datetime(passende_angebote[col]).dt.strftime('%d.%m.%Y')
+                                        except Exception:
+                                            # Fallback, falls Konvertierung fehlschlägt, als String belassen
+                                            passende_angebote[col] = passende_angebote[col].astype(str)
 
                                 if not passende_angebote.empty:
                                     found_any_offer_for_ingredients = True
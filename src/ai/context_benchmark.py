@@ -0,0 +1,109 @@
+"""
+Vergleich der Kontextformate (siehe context_format.py).
+
+Für eine feste Liste typischer Anfragen wird der Kontext in jedem Format erzeugt und
+seine Tokenzahl gezählt. Mit --live wird jede Anfrage zusätzlich an das Modell
+gestellt und die Antwort mit Halluzinationserkennung und Faktenprüfung gegen die
+Angebotsdaten geprüft (Treue der Antwort).
+
+Aufruf:
+    python -m src.ai.context_benchmark [--live] [--model MODELL-ID]
+"""
+from __future__ import annotations
+import argparse
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+from .client import get_available_models, init_client
+from .context import process_query
+from .fact_check import fact_check_response
+from .hallucination import verify_spans
+from .prompt_cache import build_messages
+from .token_accounting import count_tokens
+from ..data import offer_store
+from ..data.context_format import CONTEXT_FORMATS
+
+# Typische Anfragen (Produkt, Kategorie, Markt, günstigstes Angebot, heute)
+BENCHMARK_QUERIES = [
+    "Welche Nudeln gibt es im Angebot?",
+    "Was kostet Milch bei Lidl?",
+    "Zeig mir Getränke bei Aldi",
+    "Welches Bier ist am günstigsten?",
+    "Was gibt es heute an Obst?",
+    "Ich suche Käse und Wurst",
+    "Gibt es Schokolade bei Penny?",
+    "Welche Angebote gibt es diese Woche?",
+]
+
+@dataclass
+class BenchmarkResult:
+    """
+    Ergebnis einer Anfrage in einem Kontextformat.
+
+    Attributes:
+        query (str): Die Anfrage
+        context_format (str): Das Kontextformat
+        context_tokens (int): Tokens der Kontextnachricht
+        checked (int | None): Geprüfte Angebotsblöcke der Antwort (nur mit --live)
+        wrong_fields (int | None): Abweichende Preise, Daten oder Märkte (nur mit --live)
+        unknown_spans (int | None): Nicht in den Daten gefundene Produktnamen (nur mit --live)
+    """
+    query: str
+    context_format: str
+    context_tokens: int
+    checked: int | None = None
+    wrong_fields: int | None = None
+    unknown_spans: int | None = None
+
+def run_benchmark(queries: list[str], live: bool = False, model: dict | None = None) -> list[BenchmarkResult]:
+    """
+    Misst alle Anfragen in allen Kontextformaten auf demselben Datenstand.
+    """
+    store = offer_store.get_offer_store()
+    client = init_client() if live else None
+    results = []
+    for query in queries:
+        for context_format in CONTEXT_FORMATS:
+            system_prompt, context_message, _ = process_query(query, [], False, store, context_format)
+            result = BenchmarkResult(query, context_format, count_tokens(context_message["content"]))
+            if live:
+                response = client.chat.completions.create(
+                    model=model["id"],
+                    messages=build_messages(system_prompt, context_message, [], query),
+                    temperature=0.2,
+                    max_tokens=4000,
+                )
+                answer = response.choices[0].message.content or ""
+                fact_check = fact_check_response(answer, store=store)
+                result.checked = fact_check.checked
+                result.wrong_fields = len(fact_check.corrections) + len(fact_check.unresolved)
+                result.unknown_spans = sum(verdict.is_hallucination for verdict in verify_spans(answer, store=store))
+            results.append(result)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Vergleicht Tokenzahl und Antworttreue der Kontextformate.")
+    parser.add_argument("--live", action="store_true", help="Anfragen an das Modell stellen und Antworten prüfen")
+    parser.add_argument("--model", help="Modell-ID (Standard: das bevorzugte Modell)")
+    args = parser.parse_args()
+    load_dotenv()
+
+    models = get_available_models()
+    model = next((candidate for candidate in models if candidate["id"] == args.model), models[0])
+    results = run_benchmark(BENCHMARK_QUERIES, live=args.live, model=model)
+
+    print(f"{'Anfrage':<40} {'Format':<12} {'Tokens':>7}" + ("  Blöcke  Fehler  Unbekannt" if args.live else ""))
+    for result in results:
+        line = f"{result.query[:40]:<40} {result.context_format:<12} {result.context_tokens:>7}"
+        if args.live:
+            line += f"  {result.checked:>6}  {result.wrong_fields:>6}  {result.unknown_spans:>9}"
+        print(line)
+
+    totals = {context_format: sum(r.context_tokens for r in results if r.context_format == context_format)
+              for context_format in CONTEXT_FORMATS}
+    baseline = totals[CONTEXT_FORMATS[0]] or 1
+    print("Summe: " + ", ".join(f"{name} {tokens} Tokens ({tokens / baseline:.0%})" for name, tokens in totals.items()))
+
+if __name__ == "__main__":
+    main()
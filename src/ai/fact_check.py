@@ -0,0 +1,215 @@
+"""
+Abgleich von Preisen, Gültigkeit und Supermarkt in KI-Antworten.
+
+Die Systemprompts verlangen für jedes Angebot einen Block der Form
+
+    **Produktname** (Details): 1,99 €<br>
+    <strong class="meta-info">Gültig:</strong> 19.05.2025 bis 24.05.2025<br>
+    <strong class="meta-info">Supermarkt:</strong> Aldi
+
+Dieses Modul liest alle solchen Blöcke in einem Durchgang aus der Antwort, ordnet sie
+über den Namensindex der Halluzinationserkennung den Angeboten zu und vergleicht Preis,
+Gültigkeitszeitraum und Supermarkt mit der Angebotstabelle. Abweichungen werden
+korrigiert, wenn das gemeinte Angebot eindeutig ist, sonst mit einem Hinweis markiert.
+"""
+from __future__ import annotations
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from .hallucination import RE_SPAN_CLEANUP, VERDICT_EXACT, VERDICT_PARTIAL, get_store_name_index, resolve_name
+from .structured_answers import format_date, format_price
+
+# Datum im Antwortformat (TT.MM.JJJJ) oder wie in den Daten (JJJJ-MM-TT)
+_DATE = r"\d{1,2}\.\d{1,2}\.\d{4}|\d{4}-\d{2}-\d{2}"
+
+# Trenner zwischen den Zeilen eines Blocks (<br>, Zeilenumbrüche, Leerzeichen)
+_LINE_BREAK = r"(?:\s|<br\s*/?>)+"
+
+# Ein Angebotsblock im Antwortformat der Systemprompts
+RE_OFFER_BLOCK = re.compile(
+    r"\*\*(?P<name>[^*\n]+)\*\*[^\n:]*:\s*(?P<price>\d+(?:[.,]\d{1,2})?)\s*€[^\n<]*" + _LINE_BREAK +
+    r"(?:<strong[^>]*>)?\s*Gültig:?\s*(?:</strong>)?\s*(?P<start>" + _DATE + r")\s*(?:bis|-|–)\s*(?P<end>" + _DATE + r")[^\n<]*" + _LINE_BREAK +
+    r"(?:<strong[^>]*>)?\s*Supermarkt:?\s*(?:</strong>)?\s*(?P<market>[A-Za-zÄÖÜäöüß]+)"
+)
+
+# Preise gelten als gleich, wenn sie weniger als einen halben Cent auseinanderliegen
+PRICE_TOLERANCE = 0.005
+
+# Geprüfte Felder und ihre Bezeichnung in Korrekturen
+FIELD_PRICE = "Preis"
+FIELD_START = "Startdatum"
+FIELD_END = "Enddatum"
+FIELD_MARKET = "Supermarkt"
+
+# Spalten der Angebotstabelle, die für den Abgleich gelesen werden
+CHECKED_COLUMNS = ['Preis_EUR', 'Startdatum', 'Enddatum', 'Supermarkt']
+
+@dataclass
+class FieldCorrection:
+    """
+    Eine korrigierte Angabe in einer Antwort.
+
+    Attributes:
+        name (str): Der Produktname aus der Antwort
+        field (str): Das Feld (FIELD_PRICE, FIELD_START, FIELD_END oder FIELD_MARKET)
+        stated (str): Der Wert laut Antwort
+        actual (str): Der Wert laut Angebotstabelle
+        offer_id: Die Angebots-ID, nach der korrigiert wurde
+    """
+    name: str
+    field: str
+    stated: str
+    actual: str
+    offer_id: object = None
+
+@dataclass
+class FactCheckResult:
+    """
+    Ergebnis des Abgleichs einer Antwort.
+
+    Attributes:
+        text (str): Die Antwort mit korrigierten Angaben
+        checked (int): Anzahl geprüfter Angebotsblöcke
+        corrections (list[FieldCorrection]): Die vorgenommenen Korrekturen
+        unresolved (list[str]): Produktnamen mit Abweichungen, die nicht eindeutig korrigierbar waren
+    """
+    text: str
+    checked: int = 0
+    corrections: list = field(default_factory=list)
+    unresolved: list = field(default_factory=list)
+
+def _to_price(value) -> float | None:
+    try:
+        return float(str(value).strip().replace(",", "."))
+    except ValueError:
+        return None
+
+def _to_date(value):
+    text = str(value).strip()
+    try:
+        return datetime.strptime(text, "%d.%m.%Y" if "." in text else "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+def _field_matches(offer, stated: dict) -> dict:
+    """
+    Vergleicht die Angaben eines Blocks mit einem Angebot (Feld -> stimmt überein).
+
+    Nicht vergleichbare Werte (z.B. Textpreise wie 'Frischepreis im Markt') gelten als übereinstimmend.
+    """
+    actual_price = _to_price(offer.get('Preis_EUR'))
+    actual_start = _to_date(offer.get('Startdatum'))
+    actual_end = _to_date(offer.get('Enddatum'))
+    return {
+        FIELD_PRICE: actual_price is None or stated[FIELD_PRICE] is None or abs(actual_price - stated[FIELD_PRICE]) < PRICE_TOLERANCE,
+        FIELD_START: actual_start is None or actual_start == stated[FIELD_START],
+        FIELD_END: actual_end is None or actual_end == stated[FIELD_END],
+        FIELD_MARKET: str(offer.get('Supermarkt', '')).casefold() == stated[FIELD_MARKET].casefold(),
+    }
+
+def _pick_offer(matches: list[dict]) -> int | None:
+    """
+    Wählt das gemeinte Angebot aus den Kandidaten eines Blocks oder None, wenn es nicht eindeutig ist.
+
+    Bevorzugt werden Angebote im genannten Supermarkt, dann solche mit passendem Preis,
+    dann solche mit passendem Zeitraum.
+    """
+    pool = list(range(len(matches)))
+    for fields in ((FIELD_MARKET,), (FIELD_PRICE,), (FIELD_START, FIELD_END)):
+        narrowed = [position for position in pool if all(matches[position][f] for f in fields)]
+        if narrowed:
+            pool = narrowed
+        if len(pool) == 1:
+            return pool[0]
+    return None
+
+def _format_actual(offer, field_name: str) -> str:
+    if field_name == FIELD_PRICE:
+        return format_price(offer.get('Preis_EUR')).removesuffix(" €")
+    if field_name == FIELD_START:
+        return format_date(offer.get('Startdatum'))
+    if field_name == FIELD_END:
+        return format_date(offer.get('Enddatum'))
+    return str(offer.get('Supermarkt'))
+
+def fact_check_response(response: str, store) -> FactCheckResult:
+    """
+    Gleicht Preis, Gültigkeit und Supermarkt aller Angebotsblöcke einer Antwort mit den Angebotsdaten ab.
+
+    Der Aufwand ist linear in der Länge der Antwort und der Anzahl passender Angebote je Block;
+    aus dem Angebotsspeicher werden nur einmal die Kandidaten geholt, nicht der ganze Katalog.
+
+    Args:
+        response (str): Die Antwort des KI-Modells
+        store (OfferStore): Der Angebotsspeicher des Durchlaufs
+
+    Returns:
+        FactCheckResult: Die ggf. korrigierte Antwort und die Abweichungen
+    """
+    result = FactCheckResult(text=response)
+    blocks = list(RE_OFFER_BLOCK.finditer(response))
+    if not blocks or store.empty:
+        return result
+
+    # Blöcke den Angeboten zuordnen und alle Kandidaten mit einem einzigen Zugriff auf die Tabelle laden
+    index = get_store_name_index(store)
+    resolved = []
+    for block in blocks:
+        name = RE_SPAN_CLEANUP.sub('', block.group('name')).strip()
+        status, offer_ids = resolve_name(name, index)
+        if status in (VERDICT_EXACT, VERDICT_PARTIAL):
+            resolved.append((block, name, status, offer_ids))
+        # Unbekannte Namen behandelt die Halluzinationserkennung
+    wanted = list({offer_id for *_, ids in resolved for offer_id in ids})
+    candidates = store.rows_to_frame(wanted)
+    offers = candidates[[column for column in CHECKED_COLUMNS if column in candidates.columns]].to_dict('index')
+
+    replacements = []
+    groups = {FIELD_PRICE: 'price', FIELD_START: 'start', FIELD_END: 'end', FIELD_MARKET: 'market'}
+    for block, name, status, offer_ids in resolved:
+        result.checked += 1
+        stated = {
+            FIELD_PRICE: _to_price(block.group('price')),
+            FIELD_START: _to_date(block.group('start')),
+            FIELD_END: _to_date(block.group('end')),
+            FIELD_MARKET: block.group('market'),
+        }
+        candidate_ids = [offer_id for offer_id in offer_ids if offer_id in offers]
+        matches = [_field_matches(offers[offer_id], stated) for offer_id in candidate_ids]
+        if not matches or any(all(fields.values()) for fields in matches):
+            continue
+
+        position = _pick_offer(matches)
+        if position is not None and status == VERDICT_PARTIAL and not (
+                matches[position][FIELD_PRICE] or (matches[position][FIELD_START] and matches[position][FIELD_END])):
+            # Bei unvollständigem Namen nur korrigieren, wenn außer dem Markt noch Preis oder Zeitraum passen
+            position = None
+        if position is None:
+            result.unresolved.append(name)
+            continue
+        offer_id = candidate_ids[position]
+        for field_name, matched in matches[position].items():
+            if matched:
+                continue
+            actual = _format_actual(offers[offer_id], field_name)
+            group = groups[field_name]
+            replacements.append((block.start(group), block.end(group), actual))
+            result.corrections.append(FieldCorrection(name, field_name, block.group(group), actual, offer_id))
+
+    if replacements:
+        parts, last = [], 0
+        for start, end, value in sorted(replacements):
+            parts.append(response[last:start])
+            parts.append(value)
+            last = end
+        parts.append(response[last:])
+        result.text = "".join(parts)
+
+    if result.unresolved:
+        names = ", ".join(dict.fromkeys(result.unresolved))
+        result.text += (
+            f"\n\n**Hinweis:** Die Angaben zu {names} weichen von den aktuellen Angebotsdaten ab. "
+            "Bitte prüfe Preis und Gültigkeit im Markt."
+        )
+    return result
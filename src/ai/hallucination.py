@@ -3,89 +3,279 @@ Halluzinationserkennung für KI-Antworten.
 
 Dieses Modul enthält Funktionen zur Erkennung von KI-Halluzinationen,
 um sicherzustellen, dass nur tatsächlich vorhandene Produkte in den Antworten enthalten sind.
+
+Alle fettgedruckten Stellen einer Antwort werden in einem Durchgang extrahiert und
+über einen vorberechneten Namensindex aufgelöst: eine Hash-Menge der normalisierten
+Produktnamen und ein Index Wortstamm -> Angebots-IDs. Jede Stelle erhält ein Urteil
+mit den passenden Angebots-IDs, das auch für weitere Prüfungen (z.B. Preise) genutzt
+werden kann.
 """
+from __future__ import annotations
 import re
+import pandas as pd
+import streamlit as st
+from dataclasses import dataclass, field
+
+from ..utils.text_normalization import normalize_phrase, query_terms, split_compound
+
+# Fettgedruckte Stelle samt dem Text bis zur nächsten fettgedruckten Stelle bzw. zum Zeilenende
+# (dort steht im Antwortformat der Preis). Der Rest wird nur vorausschauend gelesen, damit
+# finditer() auch weitere Stellen derselben Zeile findet.
+RE_BOLD_SPAN = re.compile(r"\*\*(?P<span>.+?)\*\*(?=(?P<rest>(?:(?!\*\*)[^\n])*))")
+
+# Bereinigung einer Stelle in einem Schritt: Klammerzusätze, Preis bzw. Text nach Doppelpunkt, Satzzeichen am Ende
+RE_SPAN_CLEANUP = re.compile(r"\s*\([^)]*\)|\s*:.*$|[\s.,;!?*]+$")
+
+# Preisangabe direkt nach der fettgedruckten Stelle (': 1,99 €', ' 1.99€')
+RE_SPAN_PRICE = re.compile(r"(\d+(?:[.,]\d{1,2})?)\s*€")
+
+# Hinweise, bei denen die Antwort ausdrücklich keine Produkte nennt
+NOT_FOUND_PHRASES = ("keine informationen", "nicht gefunden", "keine aktuellen angebote")
+
+# Gliederungselemente der Antwortformate (Systemprompts), die fett gesetzt werden
+STRUCTURE_LABELS = {
+    normalize_phrase(label) for label in (
+        "Preisvergleich", "Hinweis", "Gültig", "Supermarkt", "Rezeptname", "Zutaten",
+        "Zubereitung", "Nährwerte", "Video", "Passende Angebote für Hauptzutaten",
+    )
+}
+
+# Allgemeine Begriffe, die fettgedruckt vorkommen dürfen, ohne ein Produkt zu sein
+GENERAL_TERMS = [
+    'aldi', 'lidl', 'supermarkt', 'angebot', 'preis', 'euro', 'gültig', 'von', 'bis', 'startdatum',
+    'enddatum', 'preisvergleich', 'getränke', 'lebensmittel', 'hier sind', 'aktuell', 'im angebot',
+    'rum', 'vodka', 'whiskey', 'bier', 'wein', 'gin', 'likör', 'spirituosen', 'alkohol',
+    'mineralwasser', 'cola', 'saft', 'ja', 'nein', 'leider', 'finden', 'diese', 'woche', 'club', 'havana',
+]
+
+# Begriffe, an denen Kategorie- bzw. Produktanfragen erkannt werden. Deren Antworten werden nur geprüft,
+# wenn sie auf fehlende Angebote hinweisen ("kein" und "nicht")
+CATEGORY_QUERY_TERMS = ["getränke", "obst", "gemüse", "lebensmittel", "produkte", "angebote", "tiefkühlkost",
+                        "backwaren", "milchprodukte", "fleisch", "wurst", "kategorie", "alle"]
+PRODUCT_QUERY_TERMS = ["rum", "vodka", "whiskey", "whisky", "bier", "wein", "sekt", "chips", "schokolade", "kaffee",
+                       "nudeln", "reis", "milch", "käse", "joghurt", "fleisch", "wurst", "gemüse", "obst",
+                       "cola", "fanta", "sprite", "limonade", "wasser", "havana"]
+
+# Stellen bis zu dieser Länge (bereinigt) werden nicht geprüft
+MIN_CHECKED_SPAN_LENGTH = 4
 
-def detect_hallucinations(response, df):
+# Urteile je fettgedruckter Stelle
+VERDICT_EXACT = "exakt"          # Normalisierter Name eines Angebots
+VERDICT_PARTIAL = "teilweise"    # Alle Wortstämme kommen gemeinsam in mindestens einem Angebot vor
+VERDICT_TERM = "begriff"         # Kategorie, Markt oder allgemeiner Begriff, kein bestimmtes Angebot
+VERDICT_STRUCTURE = "gliederung" # Gliederungselement des Antwortformats oder nicht prüfbar (zu kurz)
+VERDICT_UNKNOWN = "unbekannt"    # Nicht in den Angebotsdaten: mögliche Halluzination
+
+@dataclass
+class ProductNameIndex:
+    """
+    Vorberechneter Index über die Produktnamen für die Prüfung von KI-Antworten.
+
+    Attributes:
+        names (dict[str, tuple]): Normalisierter Produktname -> Angebots-IDs
+        tokens (dict[str, frozenset]): Wortstamm aus Produktnamen -> Angebots-IDs
+        terms (frozenset): Wortstämme aus Kategorien, Unterkategorien, Märkten und GENERAL_TERMS
+    """
+    names: dict = field(default_factory=dict)
+    tokens: dict = field(default_factory=dict)
+    terms: frozenset = frozenset()
+
+    def is_known(self, stem: str) -> bool:
+        return stem in self.tokens or stem in self.terms
+
+@dataclass
+class SpanVerdict:
+    """
+    Urteil über eine fettgedruckte Stelle einer Antwort.
+
+    Attributes:
+        span (str): Der fettgedruckte Text
+        name (str): Der bereinigte Text (ohne Klammerzusätze und Preis)
+        status (str): Eines der VERDICT_*-Urteile
+        offer_ids (tuple): Die passenden Angebots-IDs (Index-Labels des Katalogs)
+        price (str | None): Der direkt nach der Stelle genannte Preis, z.B. '1,99'
+    """
+    span: str
+    name: str
+    status: str
+    offer_ids: tuple = ()
+    price: str | None = None
+
+    @property
+    def is_hallucination(self) -> bool:
+        return self.status == VERDICT_UNKNOWN
+
+def build_name_index(df: pd.DataFrame) -> ProductNameIndex:
+    """
+    Baut den Namensindex über die Angebotsdaten auf.
+
+    Args:
+        df (DataFrame): Die Angebotsdaten (Index-Labels = Angebots-IDs)
+
+    Returns:
+        ProductNameIndex: Der aufgebaute Index
+    """
+    names: dict = {}
+    tokens: dict = {}
+    if not df.empty and 'Produktname' in df.columns:
+        for offer_id, name in zip(df.index, df['Produktname']):
+            normalized = normalize_phrase(name)
+            names.setdefault(normalized, []).append(offer_id)
+            for stem in set(normalized.split()):
+                tokens.setdefault(stem, set()).add(offer_id)
+
+    terms = set()
+    for column in ('Kategorie', 'Unterkategorie', 'Supermarkt'):
+        if column in df.columns:
+            for value in df[column].dropna().unique():
+                for part in str(value).split('/'):
+                    terms.update(normalize_phrase(part).split())
+    for term in GENERAL_TERMS:
+        terms.update(normalize_phrase(term).split())
+
+    return ProductNameIndex(
+        names={name: tuple(ids) for name, ids in names.items()},
+        tokens={stem: frozenset(ids) for stem, ids in tokens.items()},
+        terms=frozenset(terms)
+    )
+
+@st.cache_resource(max_entries=4)
+def _get_store_name_index(version: str, _store) -> ProductNameIndex:
+    """
+    Liefert den Namensindex je Datenstand (Schlüssel ist OfferStore.version).
+    """
+    return build_name_index(_store.frame(None))
+
+def get_store_name_index(store) -> ProductNameIndex:
+    """
+    Liefert den Namensindex für einen Angebotsspeicher.
+
+    Der gemeinsame Speicher mehrerer Prozesse bringt den Index im Snapshot mit (siehe
+    shared_store.py), sonst wird er einmal je Datenstand aufgebaut.
+
+    Args:
+        store (OfferStore): Der Angebotsspeicher des Durchlaufs
+    """
+    name_index = getattr(store, "name_index", None)
+    if name_index is not None:
+        return name_index
+    return _get_store_name_index(store.version, store)
+
+def _span_stems(name: str, index: ProductNameIndex) -> list[str]:
+    """
+    Zerlegt eine bereinigte Stelle in Wortstämme; unbekannte Komposita werden in bekannte Bestandteile zerlegt.
+    """
+    stems = []
+    for stem in query_terms(name):
+        if not index.is_known(stem):
+            parts = split_compound(stem, index.tokens)
+            if parts and all(index.is_known(part) for part in parts):
+                stems.extend(parts)
+                continue
+        stems.append(stem)
+    return stems
+
+def resolve_name(name: str, index: ProductNameIndex) -> tuple[str, tuple]:
+    """
+    Ordnet einen bereinigten Produktnamen aus einer Antwort den Angeboten zu.
+
+    Args:
+        name (str): Der Name ohne Klammerzusätze und Preis
+        index (ProductNameIndex): Der Namensindex (siehe get_store_name_index)
+
+    Beschreibende Zusätze wie in "Gouda jung" oder "Leckere Bananen" kommen in keinem
+    Produktnamen vor. Solange mindestens die Hälfte der Wortstämme aus Produktnamen stammt
+    und diese gemeinsam in Angeboten vorkommen, gilt die Stelle trotzdem als VERDICT_PARTIAL.
+
+    Returns:
+        tuple[str, tuple]: Das Urteil (VERDICT_*) und die passenden Angebots-IDs
+    """
+    normalized = normalize_phrase(name)
+    if len(name) < MIN_CHECKED_SPAN_LENGTH or normalized in STRUCTURE_LABELS:
+        return VERDICT_STRUCTURE, ()
+    if normalized in index.names:
+        return VERDICT_EXACT, index.names[normalized]
+
+    stems = _span_stems(name, index)
+    if not stems:
+        # Nur kurze Wörter oder Zeichen (z.B. "M&M'S"): nicht sinnvoll prüfbar
+        return VERDICT_STRUCTURE, ()
+    product_stems = [stem for stem in stems if stem in index.tokens]
+    offer_ids = None
+    for stem in product_stems:
+        offer_ids = index.tokens[stem] if offer_ids is None else offer_ids & index.tokens[stem]
+        if not offer_ids:
+            break
+
+    if offer_ids and len(product_stems) == len(stems):
+        return VERDICT_PARTIAL, tuple(sorted(offer_ids))
+    if all(index.is_known(stem) for stem in stems):
+        return VERDICT_TERM, ()
+    if offer_ids and 2 * len(product_stems) >= len(stems):
+        return VERDICT_PARTIAL, tuple(sorted(offer_ids))
+    return VERDICT_UNKNOWN, ()
+
+def verify_spans(response: str, store) -> list[SpanVerdict]:
+    """
+    Prüft alle fettgedruckten Stellen einer Antwort gegen die Angebotsdaten.
+
+    Args:
+        response (str): Die Antwort des KI-Modells
+        store (OfferStore): Der Angebotsspeicher des Durchlaufs (siehe get_store_name_index)
+
+    Returns:
+        list[SpanVerdict]: Ein Urteil je fettgedruckter Stelle, in Reihenfolge des Auftretens
+    """
+    matches = list(RE_BOLD_SPAN.finditer(response))
+    if not matches:
+        return []
+
+    index = get_store_name_index(store)
+    verdicts = []
+    for match in matches:
+        span, rest = match.group('span'), match.group('rest')
+        name = RE_SPAN_CLEANUP.sub('', span).strip()
+        price_match = RE_SPAN_PRICE.search(span.split(':', 1)[1] if ':' in span else rest)
+        status, offer_ids = resolve_name(name, index)
+        verdicts.append(SpanVerdict(span, name, status, offer_ids, price_match.group(1) if price_match else None))
+    return verdicts
+
+def detect_hallucinations(response, store):
     """
     Prüft, ob die KI-Antwort möglicherweise halluzinierte Produkte enthält.
-    
+
     Die Funktion analysiert die KI-Antwort und vergleicht erwähnte Produkte mit den
-    tatsächlich in der Datenbank vorhandenen Produkten, um Halluzinationen zu erkennen.
-    
+    tatsächlich in der Datenbank vorhandenen Produkten, um Halluzinationen zu erkennen
+    (siehe verify_spans).
+
     Args:
         response (str): Die Antwort des KI-Modells
-        df (DataFrame): Der Produktdatensatz
-    
+        store (OfferStore): Der Angebotsspeicher des Durchlaufs
+
     Returns:
         bool: True, wenn die Antwort wahrscheinlich halluzinierte Produkte enthält
     """
     # Wenn die Antwort einen Hinweis enthält, dass Produkte nicht gefunden wurden
-    if "keine Informationen" in response.lower() or "nicht gefunden" in response.lower() or "keine aktuellen angebote" in response.lower():
+    if any(phrase in response.lower() for phrase in NOT_FOUND_PHRASES):
         return False
-    
-    # Extrahiere Produktnamen aus der CSV
-    produktnamen = df['Produktname'].str.lower().tolist()
-    
-    # Füge Kategorien und Unterkategorien als erlaubte Begriffe hinzu
-    kategorien = df['Kategorie'].str.lower().unique().tolist()
-    unterkategorien = []
-    for uk in df['Unterkategorie'].dropna():
-        # Unterkategorien können mehrere Begriffe mit "/" enthalten, diese aufteilen
-        if isinstance(uk, str):
-            unterkategorien.extend([u.strip().lower() for u in uk.split('/')])
-    unterkategorien = list(set(unterkategorien))  # Duplikate entfernen
-    
-    # Extrahiere alle Produktnamenteile für flexibleres Matching
-    produktteile = []
-    for name in produktnamen:
-        teile = name.split()
-        for teil in teile:
-            if len(teil) > 3:  # Nur längere Begriffe verwenden
-                produktteile.append(teil.lower())
-    produktteile = list(set(produktteile))  # Duplikate entfernen
-    
-    # Füge Supermarktnamen und weitere allgemeine Begriffe hinzu
-    allgemeine_begriffe = ['aldi', 'lidl', 'supermarkt', 'angebot', 'preis', 'euro', '€', 
-                          'gültig', 'von', 'bis', 'startdatum', 'enddatum', 'preisvergleich',
-                          'getränke', 'lebensmittel', 'hier sind', 'aktuell', 'im angebot',
-                          'rum', 'vodka', 'whiskey', 'bier', 'wein', 'gin', 'likör', 'spirituosen',
-                          'alkohol', 'mineralwasser', 'cola', 'saft', 'ja', 'nein', 'leider', 'finden',
-                          'diese', 'woche', 'club', 'havana']
-    
-    erlaubte_begriffe = produktnamen + kategorien + unterkategorien + allgemeine_begriffe + produktteile
-    
-    # Extrahiere alle fettgedruckten Texte (wahrscheinlich Produktnamen)
-    bold_products = re.findall(r'\*\*(.*?)\*\*', response)
-    
-    # Wenn es keine fettgedruckten Texte gibt (z.B. bei kategorie-basierten Anfragen ohne konkretes Produkt)
-    if not bold_products:
-        return False
-    
-    # Prüfe jeden fettgedruckten Text, ob er ein tatsächliches Produkt sein könnte
-    for product in bold_products:
-        # Entferne Zusatzinformationen in Klammern und Preis-Suffix
-        clean_product = re.sub(r'\s*\(.*?\)', '', product).split(':')[0].strip().lower()
-        
-        # Prüfe, ob das Produkt einer Variation eines CSV-Produkts ähnelt
-        found = False
-        for erlaubter_begriff in erlaubte_begriffe:
-            # Prüfe auf teilweise Übereinstimmung (z.B. "Äpfel" vs. "Bio Äpfel")
-            if clean_product in erlaubter_begriff or erlaubter_begriff in clean_product:
-                found = True
-                break
-            
-            # Bei zusammengesetzten Begriffen prüfen, ob Teile übereinstimmen
-            parts = clean_product.split()
-            for part in parts:
-                if len(part) > 3 and (part in erlaubter_begriff or erlaubter_begriff in part):
-                    found = True
-                    break
-            if found:
-                break
-        
-        if not found and len(clean_product) > 3:  # Ignoriere sehr kurze Begriffe
-            # Mögliche Halluzination gefunden
-            return True
-    
-    return False 
\ No newline at end of file
+    return any(verdict.is_hallucination for verdict in verify_spans(response, store))
+
+def hallucination_check_applies(prompt: str, response: str) -> bool:
+    """
+    Prüft, ob die Antwort auf eine Anfrage der Halluzinationserkennung unterzogen wird.
+
+    Antworten auf Kategorie- und Produktanfragen werden nur geprüft, wenn sie auf fehlende
+    Angebote hinweisen ("kein" und "nicht"), alle übrigen immer.
+
+    Args:
+        prompt (str): Die Anfrage des Benutzers
+        response (str): Die (ggf. bisherige) Antwort des KI-Modells
+
+    Returns:
+        bool: True, wenn detect_hallucinations() für diese Antwort angewendet wird
+    """
+    prompt_lower = prompt.lower()
+    is_category_query = any(begriff in prompt_lower for begriff in CATEGORY_QUERY_TERMS)
+    is_product_query = any(begriff in prompt_lower for begriff in PRODUCT_QUERY_TERMS)
+    response_lower = response.lower()
+    return not (is_category_query or is_product_query) or ("kein" in response_lower and "nicht" in response_lower)
@@ -0,0 +1,175 @@
+"""
+Auswahl von Modell, Antwortbudget und Temperatur je Anfrage.
+
+Eine Preisabfrage zu einem Produkt und eine Rezeptanfrage mit vielen Zutaten brauchen
+nicht dasselbe Modell und nicht dasselbe Antwortbudget. Der Router schätzt die
+Komplexität einer Anfrage aus der Anzahl der Angebote im Kontext, der erkannten Absicht
+(siehe structured_answers.classify_intent) und dem Rezept-Modus und wählt die erste
+passende Route aus der Modellregistrierung (data/Modelle.json bzw. SPARFUCHS_MODEL_REGISTRY).
+
+Aufbau der Registrierung:
+
+    {
+      "modelle": [{"id": ..., "name": ..., "context_length": ..., "pricing": {...}, ...}],
+      "routen": [
+        {"name": "nachschlagen", "absichten": ["preis"], "max_angebote": 10,
+         "modelle": ["modell-id", "ausweich-modell-id"], "max_tokens": 3000, "temperature": 0.1},
+        ...
+        {"name": "gross", "modelle": ["modell-id"], "max_tokens": 12000, "temperature": 0.2}
+      ]
+    }
+
+Bedingungen einer Route (alle optional): "rezept" (Rezept-Modus an/aus), "absichten"
+(erkannte Absichten, INTENT_NONE für Anfragen ohne erkannte Absicht) und "max_angebote"
+(höchstens so viele Angebote im Kontext; ein vollständiger Katalogkontext passt nie).
+"""
+from __future__ import annotations
+import json
+import os
+import streamlit as st
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .structured_answers import classify_intent
+from ..data.product_data import count_context_offers
+
+# Pfad der Modellregistrierung
+MODEL_REGISTRY_PATH = Path(os.getenv("SPARFUCHS_MODEL_REGISTRY", "data/Modelle.json"))
+
+# Absicht von Anfragen, die keiner strukturierten Absicht zugeordnet werden
+INTENT_NONE = "frei"
+
+# Standardwerte für Routen ohne eigene Angabe (bisheriges Verhalten)
+DEFAULT_MAX_TOKENS = 12000
+DEFAULT_TEMPERATURE = 0.2
+
+@dataclass
+class Route:
+    """
+    Eine Route der Modellregistrierung bzw. die für eine Anfrage gewählte Route.
+
+    Attributes:
+        name (str): Name der Route
+        model_ids (list[str]): Modell-IDs in Reihenfolge (das erste bevorzugt, die übrigen als Ausweichmodelle)
+        max_tokens (int): Antwortbudget je Modellaufruf
+        temperature (float): Temperatur je Modellaufruf
+        recipe_mode (bool | None): Bedingung Rezept-Modus (None = beliebig)
+        intents (list[str] | None): Bedingung erkannte Absicht (None = beliebig)
+        max_offers (int | None): Bedingung höchstens so viele Angebote im Kontext (None = beliebig)
+    """
+    name: str
+    model_ids: list = field(default_factory=list)
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    temperature: float = DEFAULT_TEMPERATURE
+    recipe_mode: bool | None = None
+    intents: list | None = None
+    max_offers: int | None = None
+
+    def matches(self, recipe_mode: bool, intent: str, offer_count: int | None) -> bool:
+        if self.recipe_mode is not None and self.recipe_mode != recipe_mode:
+            return False
+        if self.intents is not None and intent not in self.intents:
+            return False
+        if self.max_offers is not None and (offer_count is None or offer_count > self.max_offers):
+            return False
+        return True
+
+@dataclass
+class ModelRegistry:
+    """
+    Die geladene Modellregistrierung.
+
+    Attributes:
+        models (list[dict]): Die Modelle im Format von get_available_models()
+        routes (list[Route]): Die Routen in Prüfreihenfolge
+    """
+    models: list = field(default_factory=list)
+    routes: list = field(default_factory=list)
+
+@dataclass
+class RoutingDecision:
+    """
+    Die für eine Anfrage gewählten Einstellungen.
+
+    Attributes:
+        route (str): Name der gewählten Route
+        models (list[dict]): Die Modelle in Reihenfolge (bevorzugtes zuerst, dann Ausweichmodelle)
+        max_tokens (int): Antwortbudget je Modellaufruf
+        temperature (float): Temperatur je Modellaufruf
+        intent (str): Die erkannte Absicht (INTENT_NONE, wenn keine)
+        offer_count (int | None): Angebote im Kontext, None bei vollständigem Katalog
+    """
+    route: str
+    models: list
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    temperature: float = DEFAULT_TEMPERATURE
+    intent: str = INTENT_NONE
+    offer_count: int | None = None
+
+def _parse_route(entry: dict) -> Route:
+    return Route(
+        name=str(entry.get("name", "")),
+        model_ids=list(entry.get("modelle", [])),
+        max_tokens=int(entry.get("max_tokens", DEFAULT_MAX_TOKENS)),
+        temperature=float(entry.get("temperature", DEFAULT_TEMPERATURE)),
+        recipe_mode=entry.get("rezept"),
+        intents=entry.get("absichten"),
+        max_offers=entry.get("max_angebote"),
+    )
+
+@st.cache_data
+def _read_model_registry(path: str, mtime: float) -> ModelRegistry:
+    """
+    Liest die Registrierung einmal je Dateistand (Schlüssel ist der Änderungszeitpunkt).
+    """
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    return ModelRegistry(
+        models=list(data.get("modelle", [])),
+        routes=[_parse_route(entry) for entry in data.get("routen", [])]
+    )
+
+def load_model_registry(path: Path = MODEL_REGISTRY_PATH) -> ModelRegistry:
+    """
+    Lädt die Modellregistrierung.
+
+    Fehlt die Datei oder ist sie ungültig, wird eine leere Registrierung geliefert
+    (dann gelten die eingebauten Modelle und eine Route mit den Standardwerten).
+    """
+    try:
+        return _read_model_registry(str(path), os.path.getmtime(path))
+    except (OSError, ValueError) as e:
+        print(f"Modellregistrierung {path} nicht lesbar, verwende Standardmodelle: {e}")
+        return ModelRegistry()
+
+def route_query(prompt: str, selected_markets: list[str], recipe_mode: bool, models: list[dict],
+                store=None, registry: ModelRegistry | None = None) -> RoutingDecision:
+    """
+    Wählt Modell, Antwortbudget und Temperatur für eine Anfrage.
+
+    Args:
+        prompt (str): Die Anfrage des Benutzers
+        selected_markets (list[str]): Die ausgewählten Supermärkte
+        recipe_mode (bool): Ob der Rezept-Modus aktiv ist
+        models (list[dict]): Die verfügbaren Modelle (siehe get_available_models)
+        store (OfferStore | None): Der Angebotsspeicher dieses Durchlaufs
+        registry (ModelRegistry | None): Die Registrierung (Standard: load_model_registry())
+
+    Returns:
+        RoutingDecision: Die gewählten Einstellungen. Modelle der Route, die nicht verfügbar
+                         sind, werden übersprungen; ohne passende Route gelten alle Modelle
+                         mit den Standardwerten.
+    """
+    registry = registry if registry is not None else load_model_registry()
+    query = None if recipe_mode else classify_intent(prompt, selected_markets, store)
+    intent = query.intent if query is not None else INTENT_NONE
+    offer_count = count_context_offers(prompt, selected_markets, store)
+
+    models_by_id = {model["id"]: model for model in models}
+    for route in registry.routes:
+        if not route.matches(recipe_mode, intent, offer_count):
+            continue
+        route_models = [models_by_id[model_id] for model_id in route.model_ids if model_id in models_by_id]
+        if route_models:
+            return RoutingDecision(route.name, route_models, route.max_tokens, route.temperature, intent, offer_count)
+    return RoutingDecision("standard", list(models), intent=intent, offer_count=offer_count)
@@ -0,0 +1,134 @@
+"""
+Antworten als Liste von Angebots-IDs mit lokaler Darstellung.
+
+Im Ausgabemodus "ids" schreibt das Modell keine Produktnamen, Preise und Daten ab,
+sondern antwortet mit einem kurzen JSON-Objekt aus Einleitungssatz, den IDs der
+passenden Angebote und einem optionalen Hinweis. Die Angebotsblöcke rendert die App
+selbst aus der Angebotstabelle (im selben Format wie structured_answers.py). Das
+verkürzt die Antwort des Modells deutlich, und die Halluzinationsprüfung wird zu einer
+Prüfung, ob die genannten IDs existieren.
+
+Welcher Modus verwendet wird, lässt sich je Modell festlegen (Schlüssel "output_mode"
+in get_available_models()), sonst gilt SPARFUCHS_OUTPUT_MODE.
+"""
+from __future__ import annotations
+import json
+import os
+import re
+from dataclasses import dataclass, field
+
+from .structured_answers import render_offer
+
+# Ausgabemodi des Modells
+OUTPUT_MODE_HTML = "html"
+OUTPUT_MODE_IDS = "ids"
+OUTPUT_MODES = (OUTPUT_MODE_HTML, OUTPUT_MODE_IDS)
+
+# Vom Modell trotz Anweisung vorangestellte Kennzeichnung des Hinweises
+RE_NOTE_LABEL = re.compile(r"^\**Hinweis:?\**:?\s*", re.IGNORECASE)
+
+# Standardmodus für Modelle ohne eigene Angabe
+DEFAULT_OUTPUT_MODE = os.getenv("SPARFUCHS_OUTPUT_MODE", OUTPUT_MODE_HTML)
+
+@dataclass
+class OfferIdAnswer:
+    """
+    Eine Antwort des Modells im Ausgabemodus "ids".
+
+    Attributes:
+        intro (str): Der einleitende Satz
+        offer_ids (list): Die genannten Angebots-IDs in der Reihenfolge des Modells
+        note (str): Optionaler Hinweis (z.B. Preisvergleich oder nicht gefundene Produkte)
+    """
+    intro: str
+    offer_ids: list = field(default_factory=list)
+    note: str = ""
+
+def output_mode_for(model: dict | None) -> str:
+    """
+    Liefert den Ausgabemodus für ein Modell aus get_available_models().
+
+    Unbekannte Angaben fallen auf den HTML-Modus zurück.
+    """
+    output_mode = (model or {}).get("output_mode", DEFAULT_OUTPUT_MODE)
+    return output_mode if output_mode in OUTPUT_MODES else OUTPUT_MODE_HTML
+
+def get_offer_id_system_prompt():
+    """
+    Erstellt den Systemprompt für den Ausgabemodus "ids".
+
+    Returns:
+        dict: Ein Dictionary mit dem Systemprompt im OpenAI-Format
+    """
+    return {
+        "role": "system",
+        "content": "Du bist ein hilfreicher Einkaufsassistent für SparFuchs.de mit fundiertem Wissen über Lebensmittel und Produktkategorien. " +
+        "Benutze die dir bereitgestellten Produktinformationen, um Anfragen zu beantworten. Jedes Angebot hat eine ID. " +
+        "WICHTIG: Du darfst NUR Angebote nennen, die in den bereitgestellten Daten vorhanden sind. ERFINDE NIEMALS IDs. " +
+        "SEMANTISCHE INTERPRETATION: Wende dein Wissen über Lebensmittelkategorien an (z.B. sind Pasta, Tortelloni, Farfalle " +
+        "und Spaghetti Nudeln), unabhängig von Marke, Kategorie oder Unterkategorie im Datensatz. " +
+        "Bei Kategorie-Anfragen nenne ALLE passenden Angebote. " +
+        "AUSGABEFORMAT - SEHR WICHTIG: Antworte AUSSCHLIESSLICH mit einem JSON-Objekt ohne weiteren Text und ohne Markdown:\n" +
+        "{\"einleitung\": \"Kurzer einleitender Satz auf Deutsch\", \"angebote\": [ID, ID, ...], \"hinweis\": \"\"}\n" +
+        "- \"angebote\": Die IDs der passenden Angebote in sinnvoller Reihenfolge (z.B. günstigstes zuerst). Leer, wenn nichts passt.\n" +
+        "- Wiederhole KEINE Produktnamen, Preise oder Daten der Angebote, die App zeigt sie selbst an.\n" +
+        "- \"hinweis\": Optional ein kurzer Satz, z.B. ein Preisvergleich oder dass es zu einem Produkt keine Angebote gibt. Sonst leer.\n" +
+        "Beispiel: {\"einleitung\": \"Ja, bei Aldi gibt es aktuell Nudeln im Angebot:\", \"angebote\": [412, 97], " +
+        "\"hinweis\": \"Bei Reis habe ich leider keine aktuellen Angebote bei Aldi gefunden.\"}"
+    }
+
+def _to_offer_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def parse_offer_id_answer(response: str) -> OfferIdAnswer | None:
+    """
+    Liest die JSON-Antwort des Modells (auch in einem Markdown-Codeblock).
+
+    Args:
+        response (str): Die Antwort des Modells
+
+    Returns:
+        OfferIdAnswer | None: Die gelesene Antwort oder None, wenn sie kein gültiges JSON-Objekt ist
+    """
+    start, end = response.find("{"), response.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        data = json.loads(response[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("angebote", []), list):
+        return None
+    return OfferIdAnswer(
+        intro=str(data.get("einleitung") or "").strip(),
+        offer_ids=list(dict.fromkeys(data.get("angebote") or [])),
+        note=RE_NOTE_LABEL.sub("", str(data.get("hinweis") or "").strip())
+    )
+
+def render_offer_id_answer(answer: OfferIdAnswer, store) -> tuple[str, list]:
+    """
+    Rendert eine Antwort im Ausgabemodus "ids" aus der Angebotstabelle.
+
+    IDs, die es im Angebotsspeicher nicht gibt, werden ausgelassen.
+
+    Args:
+        answer (OfferIdAnswer): Die gelesene Antwort des Modells
+        store (OfferStore): Der Angebotsspeicher des Durchlaufs, auf dem der Kontext beruhte
+
+    Returns:
+        tuple[str, list]: Der fertige Antworttext und die unbekannten IDs
+    """
+    offer_ids = [_to_offer_id(value) for value in answer.offer_ids]
+    known_ids = [offer_id for offer_id in offer_ids if offer_id is not None]
+    offers = store.rows_to_frame(known_ids)
+    found = [offer_id for offer_id in known_ids if offer_id in offers.index]
+    unknown = [value for value, offer_id in zip(answer.offer_ids, offer_ids) if offer_id is None or offer_id not in offers.index]
+
+    text = f"{answer.intro}\n\n" if answer.intro else ""
+    text += "".join(render_offer(row) for _, row in offers.loc[found].iterrows())
+    if answer.note:
+        text += f"**Hinweis:** {answer.note}"
+    return text.strip(), unknown
@@ -0,0 +1,124 @@
+"""
+Vorberechnung des KI-Kontexts im Hintergrund.
+
+Sobald Eingabetext, Marktauswahl und Rezept-Modus eine kurze Zeit unverändert sind,
+berechnet ein Hintergrund-Thread den gefilterten Kontext (process_query) und wärmt
+dabei Suchindex und Taxonomie auf. Beim Absenden übernimmt app.py das vorberechnete
+Ergebnis, statt die Suche erst dann zu starten.
+"""
+from __future__ import annotations
+import threading
+import streamlit as st
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from .context import process_query
+from ..data import offer_store
+from ..data.context_format import DEFAULT_CONTEXT_FORMAT
+from .offer_id_answers import DEFAULT_OUTPUT_MODE
+
+# Wartezeit, bevor eine Vorberechnung startet (neuere Eingaben verwerfen ältere in dieser Zeit)
+PREFETCH_DEBOUNCE_SECONDS = 0.4
+
+# Maximale Wartezeit beim Absenden auf eine noch laufende Vorberechnung
+PREFETCH_WAIT_SECONDS = 10
+
+# Anzahl gleichzeitiger Vorberechnungen pro Prozess
+PREFETCH_WORKERS = 2
+
+@dataclass
+class PrefetchJob:
+    """
+    Eine laufende oder abgeschlossene Vorberechnung für eine Sitzung.
+
+    Attributes:
+        key (tuple): Eingabe, Marktauswahl, Rezept-Modus, Kontextformat und Ausgabemodus, für die vorberechnet wird
+        future (Future): Datenstand (OfferStore.version) und Ergebnis von process_query oder None, wenn verworfen
+        cancelled (threading.Event): Wird gesetzt, wenn eine neuere Eingabe die Vorberechnung ersetzt
+    """
+    key: tuple
+    future: Future
+    cancelled: threading.Event = field(default_factory=threading.Event)
+
+@st.cache_resource
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    Liefert den prozessweit geteilten Thread-Pool für Vorberechnungen.
+    """
+    return ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="sparfuchs-prefetch")
+
+def _prefetch_key(prompt: str, selected_markets: list[str], recipe_mode: bool, context_format: str, output_mode: str) -> tuple:
+    return prompt.strip(), tuple(sorted(selected_markets or [])), bool(recipe_mode), context_format, output_mode
+
+def _run_prefetch(key: tuple, cancelled: threading.Event, debounce_seconds: float):
+    # Entprellen: nur rechnen, wenn in der Wartezeit keine neuere Eingabe kam
+    if cancelled.wait(debounce_seconds):
+        return None
+    prompt, selected_markets, recipe_mode, context_format, output_mode = key
+    store = offer_store.get_offer_store()
+    return store.version, process_query(prompt, list(selected_markets), recipe_mode, store, context_format, output_mode)
+
+def schedule_prefetch(session_state, prompt: str, selected_markets: list[str], recipe_mode: bool, debounce: bool = True,
+                      context_format: str = DEFAULT_CONTEXT_FORMAT, output_mode: str = DEFAULT_OUTPUT_MODE) -> None:
+    """
+    Startet die Vorberechnung für die aktuelle Eingabe, sofern sie nicht schon läuft.
+
+    Eine Vorberechnung für eine ältere Eingabe derselben Sitzung wird verworfen.
+
+    Args:
+        session_state: Der Streamlit Session State der Sitzung
+        prompt (str): Der aktuelle Eingabetext
+        selected_markets (list[str]): Die ausgewählten Supermärkte
+        recipe_mode (bool): Ob der Rezept-Modus aktiv ist
+        debounce (bool): Ob vor dem Start die Entprellzeit abgewartet wird (False beim Absenden)
+        context_format (str): Kodierung der Angebote im Kontext (siehe context_format.py)
+        output_mode (str): Ausgabemodus des Modells (siehe offer_id_answers.py)
+    """
+    if not prompt or not prompt.strip():
+        return
+    key = _prefetch_key(prompt, selected_markets, recipe_mode, context_format, output_mode)
+    job = session_state.get("prefetch_job")
+    if job is not None and job.key == key:
+        return
+    if job is not None:
+        job.cancelled.set()
+
+    cancelled = threading.Event()
+    future = _get_executor().submit(_run_prefetch, key, cancelled, PREFETCH_DEBOUNCE_SECONDS if debounce else 0)
+    session_state["prefetch_job"] = PrefetchJob(key=key, future=future, cancelled=cancelled)
+
+def take_prefetched(session_state, prompt: str, selected_markets: list[str], recipe_mode: bool, store=None,
+                    context_format: str = DEFAULT_CONTEXT_FORMAT, output_mode: str = DEFAULT_OUTPUT_MODE):
+    """
+    Übernimmt das vorberechnete Ergebnis für eine abgesendete Anfrage.
+
+    Args:
+        session_state: Der Streamlit Session State der Sitzung
+        prompt (str): Die abgesendete Anfrage
+        selected_markets (list[str]): Die ausgewählten Supermärkte
+        recipe_mode (bool): Ob der Rezept-Modus aktiv ist
+        store (OfferStore | None): Der Angebotsspeicher des Durchlaufs; eine Vorberechnung
+                                   auf einem anderen Datenstand wird verworfen
+        context_format (str): Kodierung der Angebote im Kontext (siehe context_format.py)
+        output_mode (str): Ausgabemodus des Modells (siehe offer_id_answers.py)
+
+    Returns:
+        tuple | None: Das Ergebnis von process_query oder None, wenn keine passende
+                      Vorberechnung vorliegt (dann wird wie bisher direkt berechnet)
+    """
+    job = session_state.pop("prefetch_job", None)
+    if job is None:
+        return None
+    if job.key != _prefetch_key(prompt, selected_markets, recipe_mode, context_format, output_mode):
+        job.cancelled.set()
+        return None
+    try:
+        prefetched = job.future.result(timeout=PREFETCH_WAIT_SECONDS)
+    except Exception:
+        return None
+    if prefetched is None:
+        return None
+    version, result = prefetched
+    if store is not None and version != store.version:
+        return None
+    return result
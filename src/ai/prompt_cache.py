@@ -0,0 +1,128 @@
+"""
+Nachrichtenaufbau mit stabilem Präfix und Abrechnung gecachter Prompt-Tokens.
+
+Anbieter wie OpenRouter cachen den Anfang eines Prompts, wenn er sich zwischen
+Anfragen byte-genau wiederholt. Dieses Modul ordnet die Nachrichten deshalb so an,
+dass zuerst die statischen Anweisungen (Systemprompt) und danach der bisherige
+Chatverlauf stehen. Der je Anfrage wechselnde Produkt- bzw. Rezeptkontext folgt
+erst unmittelbar vor der aktuellen Frage. Die vom Anbieter gemeldeten gecachten
+und ungecachten Prompt-Tokens werden je Anfrage im Session State festgehalten.
+"""
+from __future__ import annotations
+import hashlib
+from dataclasses import dataclass
+
+# Maximale Anzahl gespeicherter Einträge je Sitzung
+PROMPT_CACHE_STATS_LIMIT = 50
+
+@dataclass
+class PromptUsage:
+    """
+    Token-Verbrauch einer einzelnen KI-Anfrage.
+
+    Attributes:
+        model (str): Das verwendete Modell
+        prefix_hash (str): Kurzer Hash des statischen Präfixes (Systemprompt)
+        prompt_tokens (int): Alle Prompt-Tokens der Anfrage
+        cached_tokens (int): Davon vom Anbieter aus dem Cache gelesene Tokens
+        completion_tokens (int): Tokens der Antwort
+    """
+    model: str
+    prefix_hash: str
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def uncached_tokens(self) -> int:
+        return max(self.prompt_tokens - self.cached_tokens, 0)
+
+def prefix_hash(system_prompt: dict) -> str:
+    """
+    Berechnet einen kurzen Hash über den statischen Systemprompt.
+
+    Gleiche Hashes über mehrere Anfragen bedeuten ein byte-gleiches Präfix,
+    das der Anbieter aus dem Cache bedienen kann.
+    """
+    return hashlib.sha256(system_prompt["content"].encode("utf-8")).hexdigest()[:12]
+
+def build_messages(system_prompt: dict, context_message: dict, history: list[dict], prompt: str) -> list[dict]:
+    """
+    Stellt die Nachrichten für eine KI-Anfrage in cache-freundlicher Reihenfolge zusammen.
+
+    Reihenfolge: Systemprompt, bisheriger Chatverlauf, Kontextnachricht, aktuelle Frage.
+    Systemnachrichten im Verlauf werden übersprungen, damit der Systemprompt genau
+    einmal und immer an erster Stelle steht.
+
+    Args:
+        system_prompt (dict): Der statische Systemprompt aus get_system_prompt() bzw. get_recipe_system_prompt()
+        context_message (dict): Die anfrageabhängige Kontextnachricht aus process_query()
+        history (list[dict]): Der bisherige Chatverlauf der Sitzung
+        prompt (str): Die aktuelle Anfrage des Benutzers
+
+    Returns:
+        list[dict]: Die Nachrichten im OpenAI-Format
+    """
+    messages = [{"role": system_prompt["role"], "content": system_prompt["content"]}]
+    messages.extend(
+        {"role": m["role"], "content": m["content"]}
+        for m in history if m["role"] != "system"
+    )
+    messages.append({"role": context_message["role"], "content": context_message["content"]})
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+def usage_from_response(usage, model: str, system_prompt: dict) -> PromptUsage | None:
+    """
+    Liest den Token-Verbrauch aus dem usage-Objekt der API-Antwort.
+
+    Anbieter ohne Prompt-Caching liefern keine prompt_tokens_details, dann zählen alle
+    Prompt-Tokens als ungecacht.
+
+    Args:
+        usage: Das usage-Objekt des letzten Stream-Chunks (oder None)
+        model (str): Das verwendete Modell
+        system_prompt (dict): Der gesendete Systemprompt
+
+    Returns:
+        PromptUsage | None: Der Verbrauch oder None, wenn die API keinen gemeldet hat
+    """
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    return PromptUsage(
+        model=model,
+        prefix_hash=prefix_hash(system_prompt),
+        prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+        cached_tokens=(getattr(details, "cached_tokens", 0) or 0) if details is not None else 0,
+        completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+    )
+
+def record_usage(session_state, prompt_usage: PromptUsage | None) -> None:
+    """
+    Speichert den Token-Verbrauch einer Anfrage im Session State ('prompt_cache_stats').
+    """
+    if prompt_usage is None:
+        return
+    stats = session_state.setdefault("prompt_cache_stats", [])
+    stats.append(prompt_usage)
+    del stats[:-PROMPT_CACHE_STATS_LIMIT]
+
+def summarize_usage(session_state) -> dict:
+    """
+    Fasst den Token-Verbrauch der Sitzung zusammen.
+
+    Returns:
+        dict: Anzahl Anfragen, Summen der Prompt-, gecachten und ungecachten Tokens
+              sowie der Anteil gecachter Prompt-Tokens
+    """
+    stats = session_state.get("prompt_cache_stats", [])
+    prompt_tokens = sum(entry.prompt_tokens for entry in stats)
+    cached_tokens = sum(entry.cached_tokens for entry in stats)
+    return {
+        "requests": len(stats),
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "uncached_tokens": prompt_tokens - cached_tokens,
+        "cache_ratio": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+    }
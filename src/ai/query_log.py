@@ -0,0 +1,150 @@
+"""
+Protokoll der gestellten Anfragen.
+
+app.py hängt nach jedem Chat-Durchlauf eine Zeile an eine CSV-Datei an (Zeitpunkt,
+Anfrage, Marktauswahl, Rezept-Modus, Dauer). Der Cache-Wärmer (cache_warmer.py) liest
+daraus die häufigsten Anfragen der letzten Tage und rechnet sie nach einem neuen
+Datenstand vor. Pfad über SPARFUCHS_QUERY_LOG (leer schaltet das Protokoll ab).
+
+Das Protokoll wird täglich rotiert ('anfragen.csv' -> 'anfragen-2025-05-19.csv'). Beim
+Anlegen der Datei eines neuen Tages werden Dateien, die älter als QUERY_LOG_DAYS sind,
+gelöscht; top_queries() liest nur die Dateien des Zeitraums.
+"""
+import csv
+import io
+import os
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from .single_flight import normalize_text
+
+# Pfad des Anfrageprotokolls (leer = kein Protokoll)
+QUERY_LOG_PATH = os.getenv("SPARFUCHS_QUERY_LOG", "data/query_log/anfragen.csv")
+
+# Zeitraum in Tagen, aus dem die häufigsten Anfragen ermittelt werden
+QUERY_LOG_DAYS = int(os.getenv("SPARFUCHS_QUERY_LOG_DAYS", "14"))
+
+QUERY_LOG_COLUMNS = ["Zeitpunkt", "Anfrage", "Märkte", "Rezept", "Dauer_ms"]
+
+# Trennzeichen der Marktauswahl innerhalb der Spalte 'Märkte'
+MARKET_SEPARATOR = "|"
+
+_log_lock = threading.Lock()
+
+def _daily_path(path: str, day: date) -> Path:
+    """
+    Liefert die Protokolldatei eines Tages ('data/query_log/anfragen-2025-05-19.csv').
+    """
+    log_path = Path(path)
+    return log_path.with_name(f"{log_path.stem}-{day.isoformat()}{log_path.suffix}")
+
+def _prune_logs(path: str, today: date, days: int = QUERY_LOG_DAYS) -> None:
+    """
+    Löscht die Protokolldateien der Tage vor dem Zeitraum von top_queries().
+    """
+    log_path = Path(path)
+    oldest = today - timedelta(days=days)
+    for day_path in log_path.parent.glob(f"{log_path.stem}-*{log_path.suffix}"):
+        try:
+            day = date.fromisoformat(day_path.stem[len(log_path.stem) + 1:])
+        except ValueError:
+            continue
+        if day < oldest:
+            day_path.unlink(missing_ok=True)
+
+@dataclass
+class LoggedQuery:
+    """
+    Eine (zusammengefasste) Anfrage aus dem Protokoll.
+
+    Attributes:
+        prompt (str): Die Anfrage in der zuletzt protokollierten Schreibweise
+        selected_markets (list[str]): Die ausgewählten Supermärkte
+        recipe_mode (bool): Ob der Rezept-Modus aktiv war
+        count (int): Wie oft die Anfrage im Zeitraum gestellt wurde
+    """
+    prompt: str
+    selected_markets: list
+    recipe_mode: bool
+    count: int = 1
+
+def log_query(prompt: str, selected_markets: list[str], recipe_mode: bool, latency_seconds: float,
+              path: str = QUERY_LOG_PATH) -> None:
+    """
+    Hängt eine Anfrage an das Protokoll des Tages an. Fehler beim Schreiben werden nur ausgegeben.
+
+    Args:
+        prompt (str): Die Anfrage des Benutzers
+        selected_markets (list[str]): Die ausgewählten Supermärkte
+        recipe_mode (bool): Ob der Rezept-Modus aktiv ist
+        latency_seconds (float): Dauer des Chat-Durchlaufs in Sekunden
+        path (str): Pfad des Protokolls
+    """
+    if not path or not prompt or not prompt.strip():
+        return
+    now = datetime.now()
+    line = io.StringIO()
+    csv.writer(line).writerow([
+        now.isoformat(timespec="seconds"),
+        " ".join(prompt.split()),
+        MARKET_SEPARATOR.join(sorted(selected_markets or [])),
+        int(bool(recipe_mode)),
+        round(latency_seconds * 1000),
+    ])
+    try:
+        log_path = _daily_path(path, now.date())
+        with _log_lock:
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            new_file = not log_path.exists()
+            with open(log_path, "a", encoding="utf-8", newline="") as file:
+                # Kopfzeile und Eintrag in einem Schreibaufruf, damit parallele Prozesse keine Zeilen vermischen
+                file.write((",".join(QUERY_LOG_COLUMNS) + "\r\n" if new_file else "") + line.getvalue())
+            # Erster Eintrag des Tages: abgelaufene Tage entfernen, damit das Protokoll begrenzt bleibt
+            if new_file:
+                _prune_logs(path, now.date())
+    except OSError as e:
+        print(f"Anfrageprotokoll {path} nicht beschreibbar: {e}")
+
+def top_queries(limit: int, days: int = QUERY_LOG_DAYS, path: str = QUERY_LOG_PATH) -> list[LoggedQuery]:
+    """
+    Liefert die häufigsten Anfragen der letzten Tage.
+
+    Anfragen werden nach normalisiertem Text, Marktauswahl und Rezept-Modus zusammengefasst.
+
+    Args:
+        limit (int): Maximale Anzahl der Anfragen
+        days (int): Zeitraum in Tagen
+        path (str): Pfad des Protokolls (ohne Datum, siehe _daily_path)
+
+    Returns:
+        list[LoggedQuery]: Die Anfragen, häufigste zuerst (leer, wenn kein Protokoll vorliegt)
+    """
+    if not path or limit <= 0:
+        return []
+    now = datetime.now()
+    since = (now - timedelta(days=days)).isoformat(timespec="seconds")
+    counts = Counter()
+    latest = {}
+    for offset in range(days, -1, -1):
+        day_path = _daily_path(path, now.date() - timedelta(days=offset))
+        if not day_path.exists():
+            continue
+        try:
+            with open(day_path, encoding="utf-8", newline="") as file:
+                for row in csv.DictReader(file):
+                    # Unvollständige Zeilen (z.B. abgebrochenes Schreiben) überspringen
+                    if not row.get("Anfrage") or row.get("Zeitpunkt", "") < since:
+                        continue
+                    markets = tuple(market for market in (row.get("Märkte") or "").split(MARKET_SEPARATOR) if market)
+                    key = (normalize_text(row["Anfrage"]), markets, row.get("Rezept") == "1")
+                    counts[key] += 1
+                    latest[key] = row["Anfrage"]
+        except (OSError, csv.Error) as e:
+            print(f"Anfrageprotokoll {day_path} nicht lesbar: {e}")
+    return [
+        LoggedQuery(latest[key], list(key[1]), key[2], count)
+        for key, count in counts.most_common(limit)
+    ]
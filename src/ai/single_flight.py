@@ -0,0 +1,249 @@
+"""
+Zusammenfassen gleichzeitiger, identischer KI-Anfragen.
+
+Ist ein Vorschlag aus display_welcome_suggestions() beliebt, senden oft mehrere
+Sitzungen innerhalb einer Sekunde dieselbe Anfrage. Statt für jede Sitzung eine eigene
+Suche und einen eigenen Modellaufruf zu starten, führt nur die erste Sitzung (der
+"Leader") die Arbeit aus. Sitzungen mit demselben normalisierten Schlüssel, die
+währenddessen hinzukommen, warten auf deren Ergebnis:
+
+- SingleFlight.do() teilt ein einfaches Ergebnis (z.B. process_query).
+- SingleFlight.stream() teilt einen Antwort-Stream des Modells. Die Chunks werden
+  zwischengespeichert und an alle Mitleser verteilt, auch an solche, die erst nach
+  den ersten Chunks hinzukommen.
+
+Nach Abschluss wird der Eintrag entfernt; spätere Anfragen starten eine neue Ausführung.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import threading
+import streamlit as st
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+# Maximale Wartezeit eines Mitlesers auf den nächsten Chunk bzw. das Ergebnis in Sekunden
+FLIGHT_WAIT_SECONDS = 120
+
+class FlightAborted(RuntimeError):
+    """
+    Der Leader hat den Stream vor dem Ende abgebrochen.
+    """
+
+@dataclass
+class SingleFlightStats:
+    """
+    Kennzahlen der zusammengefassten Anfragen.
+
+    Attributes:
+        in_flight (int): Aktuell laufende Ausführungen
+        leaders (int): Gestartete Ausführungen
+        followers (int): Anfragen, die eine laufende Ausführung mitgenutzt haben
+    """
+    in_flight: int = 0
+    leaders: int = 0
+    followers: int = 0
+
+def normalize_text(text: str) -> str:
+    """
+    Normalisiert einen Text für Schlüssel (Groß-/Kleinschreibung und Leerraum werden ignoriert).
+    """
+    return " ".join(str(text).split()).casefold()
+
+def messages_fingerprint(messages: list[dict]) -> str:
+    """
+    Bildet einen Fingerabdruck der Nachrichten einer KI-Anfrage.
+
+    Anfragen mit gleichem Verlauf, Kontext und (normalisierter) Frage erhalten denselben Fingerabdruck.
+    """
+    normalized = [(message["role"], normalize_text(message["content"])) for message in messages]
+    return hashlib.sha256(json.dumps(normalized, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class _StreamFlight:
+    """
+    Ein laufender, geteilter Stream: Puffer der bisherigen Chunks und Abschlussstatus.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def publish(self, chunk) -> None:
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, error: Exception | None = None) -> None:
+        with self.condition:
+            if self.done:
+                return
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+class FlightStream:
+    """
+    Iterierbarer Antwort-Stream aus SingleFlight.stream().
+
+    Attributes:
+        leader (bool): Ob dieser Stream den Modellaufruf selbst ausführt. Nur der Leader
+                       verbraucht Tokens beim Anbieter, Mitleser erhalten dieselben Chunks.
+    """
+
+    def __init__(self, flight: _StreamFlight, leader: bool, upstream=None, on_done=None):
+        self.leader = leader
+        self._flight = flight
+        self._upstream = upstream
+        self._on_done = on_done
+        self._iterator = None
+
+    def __iter__(self):
+        if self._iterator is None:
+            self._iterator = self._lead() if self.leader else self._follow()
+        return self._iterator
+
+    def close(self) -> None:
+        """
+        Bricht das Lesen ab. Beim Leader wird auch der Stream beim Anbieter geschlossen,
+        Mitleser erhalten dann FlightAborted.
+        """
+        iter(self).close()
+
+    def _lead(self):
+        error = FlightAborted("Der Stream wurde vor dem Ende abgebrochen")
+        try:
+            for chunk in self._upstream:
+                self._flight.publish(chunk)
+                yield chunk
+            error = None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._flight.finish(error)
+            self._on_done()
+            if error is not None and hasattr(self._upstream, "close"):
+                self._upstream.close()
+
+    def _follow(self):
+        position = 0
+        while True:
+            with self._flight.condition:
+                if position == len(self._flight.chunks) and not self._flight.done:
+                    if not self._flight.condition.wait(FLIGHT_WAIT_SECONDS):
+                        raise TimeoutError("Zeitüberschreitung beim Warten auf die geteilte Antwort")
+                chunks = self._flight.chunks[position:]
+                done, error = self._flight.done, self._flight.error
+            position += len(chunks)
+            yield from chunks
+            if done and position == len(self._flight.chunks):
+                if error is not None:
+                    raise error
+                return
+
+class SingleFlight:
+    """
+    Prozessweite Verwaltung laufender Ausführungen je Schlüssel.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+        self._stats = SingleFlightStats()
+
+    def stats(self) -> SingleFlightStats:
+        """
+        Liefert eine Kopie der aktuellen Kennzahlen.
+        """
+        with self._lock:
+            return SingleFlightStats(**{**vars(self._stats), "in_flight": len(self._calls) + len(self._streams)})
+
+    def do(self, key: tuple, function):
+        """
+        Führt `function` aus oder wartet auf eine laufende Ausführung mit demselben Schlüssel.
+
+        Args:
+            key (tuple): Der normalisierte Schlüssel der Anfrage
+            function (callable): Die auszuführende Funktion ohne Argumente
+
+        Returns:
+            Das Ergebnis von `function` (Ausnahmen werden an alle Wartenden weitergegeben)
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self._stats.leaders += 1
+            else:
+                self._stats.followers += 1
+        if not leader:
+            return future.result(timeout=FLIGHT_WAIT_SECONDS)
+
+        try:
+            result = function()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def follow(self, key: tuple) -> FlightStream | None:
+        """
+        Liest einen laufenden Stream mit demselben Schlüssel mit.
+
+        Returns:
+            FlightStream | None: Der mitgelesene Stream oder None, wenn keiner läuft
+        """
+        with self._lock:
+            flight = self._streams.get(key)
+            if flight is None:
+                return None
+            self._stats.followers += 1
+            return FlightStream(flight, leader=False)
+
+    def stream(self, key: tuple, create) -> FlightStream:
+        """
+        Startet einen Antwort-Stream oder liest einen laufenden mit demselben Schlüssel mit.
+
+        Args:
+            key (tuple): Der normalisierte Schlüssel der Anfrage (z.B. Modell und messages_fingerprint())
+            create (callable): Startet den Stream beim Anbieter (nur für den Leader aufgerufen)
+
+        Returns:
+            FlightStream: Der Stream; bei einem Fehler des Leaders erhalten alle Mitleser dieselbe Ausnahme
+        """
+        with self._lock:
+            flight = self._streams.get(key)
+            if flight is not None:
+                self._stats.followers += 1
+                return FlightStream(flight, leader=False)
+            flight = self._streams[key] = _StreamFlight()
+            self._stats.leaders += 1
+
+        def release():
+            with self._lock:
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+
+        try:
+            upstream = create()
+        except Exception as e:
+            flight.finish(e)
+            release()
+            raise
+        return FlightStream(flight, leader=True, upstream=upstream, on_done=release)
+
+@st.cache_resource
+def get_single_flight() -> SingleFlight:
+    """
+    Liefert die prozessweit geteilte Verwaltung zusammengefasster Anfragen.
+    """
+    return SingleFlight()
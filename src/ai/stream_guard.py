@@ -0,0 +1,101 @@
+"""
+Halluzinationsprüfung während des Streamings.
+
+detect_hallucinations() prüft eine Antwort erst, wenn sie vollständig vorliegt. Eine
+Antwort mit erfundenen Produkten kostet so die volle Antwortlänge und wird danach doch
+durch den Entschuldigungstext ersetzt. Der StreamGuard prüft deshalb jede fettgedruckte
+Stelle, sobald sie im Stream abgeschlossen ist, über denselben Namensindex. Ist eine
+Halluzination bestätigt (nach denselben Regeln wie die abschließende Prüfung, angewendet
+auf den bisherigen Text), bricht app.py den Stream ab und fragt ggf. mit einem
+strengeren Kontext erneut an.
+"""
+import os
+
+from .hallucination import (
+    NOT_FOUND_PHRASES, RE_BOLD_SPAN, RE_SPAN_CLEANUP, get_store_name_index, hallucination_check_applies, resolve_name,
+    VERDICT_UNKNOWN
+)
+
+# Ob Antworten schon während des Streamings geprüft werden
+STREAM_GUARD_ENABLED = os.getenv("SPARFUCHS_STREAM_GUARD", "true").lower() in ["true", "1", "t", "yes"]
+
+# Anzahl unbekannter Produktnamen, ab der eine Antwort abgebrochen wird
+STREAM_GUARD_MAX_UNKNOWN = int(os.getenv("SPARFUCHS_STREAM_GUARD_MAX_UNKNOWN", "1"))
+
+# Wie oft nach einem Abbruch mit strengerem Kontext erneut angefragt wird
+STREAM_GUARD_RETRIES = int(os.getenv("SPARFUCHS_STREAM_GUARD_RETRIES", "1"))
+
+class StreamHallucination(RuntimeError):
+    """
+    Eine Antwort wurde während des Streamings wegen erfundener Produkte abgebrochen.
+    """
+
+    def __init__(self, unknown_names: list[str]):
+        super().__init__(f"Unbekannte Produkte in der Antwort: {', '.join(unknown_names)}")
+        self.unknown_names = unknown_names
+
+class StreamGuard:
+    """
+    Prüft die Chunks einer Antwort fortlaufend auf erfundene Produktnamen.
+
+    Wie bei verify_spans() wird jede fettgedruckte Stelle geprüft, sobald ihr schließendes
+    '**' angekommen ist. Jede Stelle wird genau einmal aufgelöst.
+    """
+
+    def __init__(self, prompt: str, store, max_unknown: int = STREAM_GUARD_MAX_UNKNOWN):
+        self.prompt = prompt
+        self.max_unknown = max(max_unknown, 1)
+        self.unknown_names = []
+        self.tripped = False
+        self._index = get_store_name_index(store)
+        self._text = ""
+        self._scan_from = 0
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, content: str) -> bool:
+        """
+        Nimmt den nächsten Chunk der Antwort auf.
+
+        Returns:
+            bool: True, sobald die Antwort als Halluzination bestätigt ist (dann abbrechen)
+        """
+        self._text += content
+        # Abgeschlossene Stellen ab dem Ende der zuletzt geprüften suchen (wie finditer() über die ganze Antwort)
+        match = RE_BOLD_SPAN.search(self._text, self._scan_from)
+        while match is not None:
+            self._check_span(match.group('span'))
+            self._scan_from = match.end()
+            match = RE_BOLD_SPAN.search(self._text, self._scan_from)
+
+        if not self.tripped and len(self.unknown_names) >= self.max_unknown:
+            text_lower = self._text.lower()
+            self.tripped = (not any(phrase in text_lower for phrase in NOT_FOUND_PHRASES)
+                            and hallucination_check_applies(self.prompt, self._text))
+        return self.tripped
+
+    def _check_span(self, span: str) -> None:
+        name = RE_SPAN_CLEANUP.sub('', span).strip()
+        status, _ = resolve_name(name, self._index)
+        if status == VERDICT_UNKNOWN:
+            self.unknown_names.append(name)
+
+def tighten_context(context_message: dict, unknown_names: list[str]) -> dict:
+    """
+    Erstellt eine strengere Kontextnachricht für die erneute Anfrage nach einem Abbruch.
+
+    Args:
+        context_message (dict): Die bisherige Kontextnachricht aus process_query()
+        unknown_names (list[str]): Die erfundenen Produktnamen der abgebrochenen Antwort
+
+    Returns:
+        dict: Die Kontextnachricht mit vorangestelltem Hinweis
+    """
+    names = ", ".join(f"'{name}'" for name in dict.fromkeys(unknown_names))
+    note = (
+        f"ACHTUNG: {names} gibt es NICHT in den aktuellen Angeboten. Nenne ausschließlich Produkte, die unten "
+        "aufgeführt sind, und übernimm ihre Produktnamen wörtlich. Gibt es keine passenden Angebote, sage das.\n\n"
+    )
+    return {**context_message, "content": note + context_message["content"]}
@@ -0,0 +1,248 @@
+"""
+Deterministische Antworten für strukturierte Anfragen.
+
+Dieses Modul erkennt einfache Nachschlage-Anfragen wie "Was kostet Milch bei Lidl?",
+"Günstigstes Bier bei Aldi" oder "Alle Getränke bei Penny" und beantwortet sie direkt
+aus dem indizierten Angebotsspeicher. Die Antwort wird im selben Format erzeugt, das
+get_system_prompt() von der KI verlangt. Nicht erkannte Anfragen gehen wie bisher
+an das Sprachmodell.
+"""
+from __future__ import annotations
+import re
+import pandas as pd
+from dataclasses import dataclass
+
+from ..data import offer_store
+from ..data.product_data import find_offers, get_validity_window
+from ..utils.text_normalization import query_terms, split_compound, stem_token, tokenize
+from ..utils.unit_price_parser import format_unit_price, rank_by_unit_price
+
+# Absichten, die ohne Sprachmodell beantwortet werden
+INTENT_PRICE = "preis"
+INTENT_CHEAPEST = "guenstigstes"
+INTENT_LIST = "alle"
+
+# Optionale Marktangabe am Ende der Anfrage ("bei Aldi", "im Lidl") und abschließende Satzzeichen
+_MARKET_SUFFIX = r"(?:\s+(?:bei|im|in)\s+(?P<markt>\w+))?\s*[?.!]*$"
+
+# Anfragemuster je Absicht (werden in dieser Reihenfolge geprüft)
+INTENT_PATTERNS = [
+    (INTENT_PRICE, re.compile(
+        r"^(?:was|wie\s*viel)\s+kostet\s+(?:der|die|das|ein|eine)?\s*(?P<produkt>.+?)" + _MARKET_SUFFIX,
+        re.IGNORECASE
+    )),
+    (INTENT_CHEAPEST, re.compile(
+        r"^(?:was\s+ist\s+|wo\s+gibt\s+es\s+|zeig(?:e)?\s+mir\s+)?(?:der|die|das)?\s*"
+        r"(?:günstigst|billigst|preiswertest)(?:e|en|er|es)?\s+(?P<produkt>.+?)" + _MARKET_SUFFIX,
+        re.IGNORECASE
+    )),
+    (INTENT_LIST, re.compile(
+        r"^(?:zeig(?:e)?\s+(?:mir\s+)?)?alle\s+(?P<produkt>.+?)" + _MARKET_SUFFIX,
+        re.IGNORECASE
+    )),
+    (INTENT_LIST, re.compile(
+        r"^welche\s+(?P<produkt>.+?)\s+gibt\s+es(?:\s+(?:aktuell|gerade|heute))?" + _MARKET_SUFFIX,
+        re.IGNORECASE
+    )),
+]
+
+# Produktangaben mit Vergleichen oder Aufzählungen bleiben dem Sprachmodell überlassen
+RE_COMPOUND_REQUEST = re.compile(r"\b(?:und|oder|sowie|vergleich\w*|statt)\b|,", re.IGNORECASE)
+
+# Maximale Anzahl gelisteter Angebote bei Preisanfragen, im Preisvergleich bzw. bei Auflistungen
+PRICE_ANSWER_LIMIT = 10
+CHEAPEST_ANSWER_LIMIT = 5
+LIST_ANSWER_LIMIT = 20
+
+@dataclass
+class StructuredQuery:
+    """
+    Eine als einfache Nachschlage-Anfrage erkannte Benutzeranfrage.
+
+    Attributes:
+        intent (str): Die Absicht (INTENT_PRICE, INTENT_CHEAPEST oder INTENT_LIST)
+        product (str): Der Produktteil der Anfrage (z.B. 'Milch')
+        markets (list[str]): Die zu durchsuchenden Supermärkte (leer = alle)
+    """
+    intent: str
+    product: str
+    markets: list
+
+def classify_intent(prompt: str, selected_markets: list[str], store=None) -> StructuredQuery | None:
+    """
+    Ordnet eine Benutzeranfrage einer der strukturierten Absichten zu.
+
+    Ein in der Anfrage genannter Supermarkt hat Vorrang vor der Marktauswahl in der
+    Oberfläche. Unbekannte Marktnamen und zusammengesetzte Anfragen werden nicht
+    zugeordnet.
+
+    Args:
+        prompt (str): Die Anfrage des Benutzers
+        selected_markets (list[str]): Die in der Oberfläche ausgewählten Supermärkte
+        store (OfferStore | None): Der Angebotsspeicher dieses Durchlaufs (Standard: aktueller Stand)
+
+    Returns:
+        StructuredQuery | None: Die erkannte Anfrage oder None, wenn sie an die KI gehen soll
+    """
+    prompt = prompt.strip()
+    for intent, pattern in INTENT_PATTERNS:
+        match = pattern.match(prompt)
+        if not match:
+            continue
+
+        product = match.group('produkt').strip()
+        if not product or RE_COMPOUND_REQUEST.search(product):
+            return None
+
+        markets = list(selected_markets)
+        named_market = match.group('markt')
+        if named_market:
+            store = store if store is not None else offer_store.get_offer_store()
+            known_markets = {market.lower(): market for market in store.partitions}
+            if named_market.lower() not in known_markets:
+                return None
+            markets = [known_markets[named_market.lower()]]
+        return StructuredQuery(intent=intent, product=product, markets=markets)
+    return None
+
+def _prefer_name_matches(offers: pd.DataFrame, product: str) -> pd.DataFrame | None:
+    """
+    Beschränkt die Treffer auf Angebote, deren Produktname alle Suchbegriffe als Wort enthält.
+
+    Der Suchindex findet 'Milch' auch über die Kategorie 'Milchprodukte'. Für eine
+    Preisfrage sind aber die Produkte mit 'Milch' im Namen gemeint. Verglichen werden die
+    Wortstämme des Namens (samt Grundwort von Komposita wie 'Roséwein'), nicht Teilzeichenketten,
+    damit 'Wein' nicht 'Schwein' trifft. Enthält kein Produktname die Begriffe (z.B. 'Bier'
+    bei 'Krombacher Pils'), wird None zurückgegeben und die Anfrage geht an die KI.
+    """
+    stems = query_terms(product)
+    if not stems or 'Produktname' not in offers.columns:
+        return offers
+    wanted = set(stems)
+
+    def name_stems(name: str) -> set:
+        result = set()
+        for token in tokenize(name):
+            stem = stem_token(token)
+            result.add(stem)
+            result.update(split_compound(stem, wanted))
+        return result
+
+    mask = offers['Produktname'].astype(str).map(lambda name: wanted <= name_stems(name))
+    return offers[mask] if mask.any() else None
+
+def format_price(preis) -> str:
+    """
+    Formatiert einen Preis im deutschen Format ('1.99' -> '1,99 €'), nicht numerische Preise unverändert.
+    """
+    value = pd.to_numeric(str(preis).replace(",", "."), errors='coerce')
+    if pd.isna(value):
+        return str(preis)
+    return f"{value:.2f}".replace(".", ",") + " €"
+
+def format_date(datum) -> str:
+    """
+    Formatiert ein Datum aus den Angebotsdaten als TT.MM.JJJJ.
+    """
+    parsed = pd.to_datetime(datum, errors='coerce')
+    return str(datum) if pd.isna(parsed) else parsed.strftime('%d.%m.%Y')
+
+def render_offer(row) -> str:
+    """
+    Gibt ein Angebot im Antwortformat aus get_system_prompt() aus.
+    """
+    return (
+        f"**{row.get('Produktname', 'N/A')}**: {format_price(row.get('Preis_EUR', 'N/A'))}<br>\n"
+        f"<strong class=\"meta-info\">Gültig:</strong> {format_date(row.get('Startdatum'))} bis {format_date(row.get('Enddatum'))}<br>\n"
+        f"<strong class=\"meta-info\">Supermarkt:</strong> {row.get('Supermarkt', 'N/A')}\n\n"
+    )
+
+def _market_phrase(markets: list[str]) -> str:
+    """
+    Beschreibt die Marktauswahl für den Einleitungssatz ('bei Aldi', 'bei Aldi und Lidl').
+    """
+    if not markets:
+        return "in den Supermärkten"
+    if len(markets) == 1:
+        return f"bei {markets[0]}"
+    return "bei " + ", ".join(markets[:-1]) + f" und {markets[-1]}"
+
+def render_answer(query: StructuredQuery, offers: pd.DataFrame) -> str:
+    """
+    Erzeugt die Antwort zu einer strukturierten Anfrage aus den gefundenen Angeboten.
+
+    Args:
+        query (StructuredQuery): Die erkannte Anfrage
+        offers (DataFrame): Die gefundenen Angebote (nicht leer)
+
+    Returns:
+        str: Die formatierte Antwort
+    """
+    markets = _market_phrase(query.markets)
+
+    if query.intent == INTENT_CHEAPEST:
+        ranked = rank_by_unit_price(offers, CHEAPEST_ANSWER_LIMIT)
+        cheapest = ranked.iloc[0]
+        answer = f"Das sind die günstigsten Angebote für {query.product} {markets}:\n\n"
+        answer += "".join(render_offer(row) for _, row in ranked.iterrows())
+        unit_price = format_unit_price(cheapest)
+        answer += (
+            f"**Preisvergleich:** Das günstigste Produkt ist {cheapest.get('Produktname', 'N/A')} "
+            f"für {format_price(cheapest.get('Preis_EUR', 'N/A'))}"
+        )
+        answer += f" ({unit_price.replace('.', ',')})." if unit_price else "."
+        return answer
+
+    if query.intent == INTENT_PRICE:
+        shown = offers.head(PRICE_ANSWER_LIMIT)
+        answer = f"Für {query.product} habe ich {markets} folgende Angebote gefunden:\n\n"
+        answer += "".join(render_offer(row) for _, row in shown.iterrows())
+        if len(offers) > len(shown):
+            answer += f"**Hinweis:** Es gibt {len(offers) - len(shown)} weitere passende Angebote. Frage gerne spezifischer nach.\n"
+        return answer
+
+    product_phrase = f" passende Angebote für {query.product}" if query_terms(query.product) else " Angebote"
+    shown = offers.head(LIST_ANSWER_LIMIT)
+    answer = f"Aktuell gibt es {markets} {len(offers)}{product_phrase}"
+    answer += ":\n\n" if len(offers) == len(shown) else f", hier die ersten {len(shown)}:\n\n"
+    answer += "".join(render_offer(row) for _, row in shown.iterrows())
+    if len(offers) > len(shown):
+        answer += f"**Hinweis:** Es gibt {len(offers) - len(shown)} weitere Angebote. Frage gerne nach einem bestimmten Produkt oder einer Kategorie.\n"
+    return answer
+
+def answer_structured_query(prompt: str, selected_markets: list[str], store=None) -> str | None:
+    """
+    Beantwortet eine Anfrage ohne Sprachmodell, wenn sie eine einfache Nachschlage-Anfrage ist.
+
+    Gibt None zurück, wenn die Anfrage nicht erkannt wurde oder keine Angebote gefunden
+    wurden. In beiden Fällen geht die Anfrage wie bisher an die KI, die z.B. auch
+    semantisch verwandte Produkte aus dem Gesamtkatalog vorschlagen kann.
+
+    Args:
+        prompt (str): Die Anfrage des Benutzers
+        selected_markets (list[str]): Die in der Oberfläche ausgewählten Supermärkte
+        store (OfferStore | None): Der Angebotsspeicher dieses Durchlaufs (Standard: aktueller Stand)
+
+    Returns:
+        str | None: Die fertige Antwort oder None
+    """
+    store = store if store is not None else offer_store.get_offer_store()
+    query = classify_intent(prompt, selected_markets, store)
+    if query is None:
+        return None
+
+    # Gesucht wird zuerst genau nach dem Produkt, die semantischen Erweiterungen der Taxonomie
+    # nur, wenn das nichts findet (ohne Sprachmodell filtert niemand unpassende Erweiterungen aus)
+    validity_window = get_validity_window(prompt, store)
+    offers = find_offers(query.product, query.markets, validity_window, expand=False, store=store)
+
+    # "Alle Angebote bei Aldi" enthält keinen Produktbegriff und listet das gesamte Sortiment des Markts
+    if offers is None and query.intent == INTENT_LIST:
+        offers = store.frame(query.markets, store.valid_rows(*validity_window))
+    if offers is None or offers.empty:
+        return None
+    if query.intent == INTENT_PRICE:
+        offers = _prefer_name_matches(offers, query.product)
+        if offers is None:
+            return None
+    return render_answer(query, offers)
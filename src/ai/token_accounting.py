@@ -0,0 +1,215 @@
+"""
+Token- und Kostenabrechnung für KI-Anfragen.
+
+Dieses Modul zählt vor jeder Anfrage die Prompt-Tokens je Bestandteil
+(Systemprompt, Produkt- bzw. Rezeptkontext, Chatverlauf, Benutzernachricht),
+warnt, wenn der Prompt die context_length des Modells überschreitet, und
+summiert nach der Antwort Prompt- und Antwort-Tokens samt Kosten je Sitzung
+und je Tag.
+
+Gezählt wird mit tiktoken, falls installiert. Ohne tiktoken wird die Tokenzahl
+aus der Textlänge geschätzt (etwa 4 Zeichen je Token).
+"""
+from __future__ import annotations
+import math
+import threading
+import streamlit as st
+from dataclasses import dataclass, field
+from datetime import date
+
+from .prompt_cache import PromptUsage
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Encoding für die Zählung mit tiktoken (die Modelle auf OpenRouter haben eigene Tokenizer,
+# cl100k_base liegt für deutschen Text nahe genug an deren Zählung)
+TOKEN_ENCODING = "cl100k_base"
+
+# Geschätzte Zeichen je Token, wenn tiktoken nicht installiert ist
+CHARS_PER_TOKEN = 4
+
+# Zusätzliche Tokens je Nachricht für Rolle und Trennzeichen im Chat-Format
+TOKENS_PER_MESSAGE = 4
+
+# Anzahl Tage, für die die Tagessummen im Prozess aufbewahrt werden
+DAILY_USAGE_DAYS = 31
+
+@st.cache_resource
+def _get_encoding():
+    """
+    Lädt das tiktoken-Encoding einmal pro Prozess (None ohne tiktoken).
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception:
+        return None # z.B. ohne Netzwerkzugriff beim ersten Laden
+
+def count_tokens(text: str) -> int:
+    """
+    Zählt die Tokens eines Textes (mit tiktoken oder geschätzt).
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def _message_tokens(message: dict) -> int:
+    return count_tokens(message.get("content", "")) + TOKENS_PER_MESSAGE
+
+@dataclass
+class PromptBudget:
+    """
+    Prompt-Tokens einer Anfrage je Bestandteil.
+
+    Attributes:
+        system_tokens (int): Systemprompt
+        context_tokens (int): Produkt- bzw. Rezeptkontext
+        history_tokens (int): Bisheriger Chatverlauf
+        user_tokens (int): Aktuelle Benutzernachricht
+    """
+    system_tokens: int = 0
+    context_tokens: int = 0
+    history_tokens: int = 0
+    user_tokens: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.system_tokens + self.context_tokens + self.history_tokens + self.user_tokens
+
+def measure_prompt(system_prompt: dict, context_message: dict, history: list[dict], prompt: str) -> PromptBudget:
+    """
+    Zählt die Prompt-Tokens je Bestandteil, in derselben Aufteilung wie build_messages().
+    """
+    return PromptBudget(
+        system_tokens=_message_tokens(system_prompt),
+        context_tokens=_message_tokens(context_message),
+        history_tokens=sum(_message_tokens(m) for m in history if m["role"] != "system"),
+        user_tokens=_message_tokens({"role": "user", "content": prompt}),
+    )
+
+def check_context_length(budget: PromptBudget, model: dict) -> str | None:
+    """
+    Prüft, ob der Prompt in das Kontextfenster des Modells passt.
+
+    Args:
+        budget (PromptBudget): Die gezählten Prompt-Tokens
+        model (dict): Ein Eintrag aus get_available_models()
+
+    Returns:
+        str | None: Eine Warnmeldung mit der Aufteilung nach Bestandteilen oder None, wenn der Prompt passt
+    """
+    context_length = model.get("context_length")
+    if not context_length or budget.total <= context_length:
+        return None
+    return (
+        f"Prompt für {model['id']} hat ca. {budget.total} Tokens und überschreitet die context_length von {context_length} "
+        f"(System: {budget.system_tokens}, Kontext: {budget.context_tokens}, "
+        f"Verlauf: {budget.history_tokens}, Nachricht: {budget.user_tokens})."
+    )
+
+@dataclass
+class UsageTotals:
+    """
+    Aufsummierter Token-Verbrauch und Kosten.
+
+    Attributes:
+        requests (int): Anzahl KI-Anfragen
+        system_tokens, context_tokens, history_tokens, user_tokens (int): Prompt-Tokens je Bestandteil (gezählt)
+        prompt_tokens (int): Vom Anbieter gemeldete Prompt-Tokens (sonst gezählt)
+        completion_tokens (int): Antwort-Tokens
+        cost_usd (float): Kosten laut Preisangaben in get_available_models()
+        context_overflows (int): Anfragen über der context_length des Modells
+    """
+    requests: int = 0
+    system_tokens: int = 0
+    context_tokens: int = 0
+    history_tokens: int = 0
+    user_tokens: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    context_overflows: int = 0
+
+    def add(self, budget: PromptBudget, prompt_tokens: int, completion_tokens: int, cost_usd: float, overflow: bool) -> None:
+        self.requests += 1
+        self.system_tokens += budget.system_tokens
+        self.context_tokens += budget.context_tokens
+        self.history_tokens += budget.history_tokens
+        self.user_tokens += budget.user_tokens
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost_usd += cost_usd
+        self.context_overflows += int(overflow)
+
+@dataclass
+class _DailyUsage:
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    days: dict = field(default_factory=dict)
+
+@st.cache_resource
+def _get_daily_usage() -> _DailyUsage:
+    """
+    Liefert die prozessweiten Tagessummen über alle Sitzungen.
+    """
+    return _DailyUsage()
+
+def request_cost(model: dict, prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Berechnet die Kosten einer Anfrage in USD aus den Preisen je Million Tokens im Modelleintrag.
+    """
+    pricing = model.get("pricing", {})
+    return (
+        prompt_tokens * pricing.get("prompt", 0.0)
+        + completion_tokens * pricing.get("completion", 0.0)
+    ) / 1_000_000
+
+def record_request(session_state, model: dict, budget: PromptBudget, prompt_usage: PromptUsage | None, response: str) -> UsageTotals:
+    """
+    Verbucht eine abgeschlossene KI-Anfrage in den Sitzungs- und Tagessummen.
+
+    Meldet der Anbieter den Verbrauch (usage), werden dessen Prompt- und Antwort-Tokens
+    verbucht, sonst die selbst gezählten.
+
+    Args:
+        session_state: Der Streamlit Session State der Sitzung
+        model (dict): Der verwendete Eintrag aus get_available_models()
+        budget (PromptBudget): Die vor der Anfrage gezählten Prompt-Tokens
+        prompt_usage (PromptUsage | None): Der vom Anbieter gemeldete Verbrauch
+        response (str): Die Antwort des Modells
+
+    Returns:
+        UsageTotals: Die aktualisierten Summen der Sitzung
+    """
+    if prompt_usage is not None and prompt_usage.prompt_tokens:
+        prompt_tokens, completion_tokens = prompt_usage.prompt_tokens, prompt_usage.completion_tokens
+    else:
+        prompt_tokens, completion_tokens = budget.total, count_tokens(response)
+    cost = request_cost(model, prompt_tokens, completion_tokens)
+    overflow = check_context_length(budget, model) is not None
+
+    session_totals = session_state.setdefault("token_usage", UsageTotals())
+    session_totals.add(budget, prompt_tokens, completion_tokens, cost, overflow)
+
+    daily_usage = _get_daily_usage()
+    with daily_usage.lock:
+        today = date.today()
+        daily_usage.days.setdefault(today, UsageTotals()).add(budget, prompt_tokens, completion_tokens, cost, overflow)
+        for day in sorted(daily_usage.days)[:-DAILY_USAGE_DAYS]:
+            del daily_usage.days[day]
+    return session_totals
+
+def get_daily_usage(day: date | None = None) -> UsageTotals:
+    """
+    Liefert die Summen aller Sitzungen dieses Prozesses für einen Tag (Standard: heute).
+    """
+    daily_usage = _get_daily_usage()
+    with daily_usage.lock:
+        totals = daily_usage.days.get(day or date.today())
+        return UsageTotals(**vars(totals)) if totals else UsageTotals()
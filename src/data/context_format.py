@@ -0,0 +1,150 @@
+"""
+Kodierung der Angebote im KI-Kontext.
+
+Zwei Formate stehen zur Wahl:
+
+- "beschriftet": das bisherige Format mit sieben beschrifteten Zeilen je Angebot
+  ("Produkt:", "Kategorie:", ..., "Supermarkt:").
+- "kompakt": Angebote gruppiert nach Supermarkt und Kategorie mit einer Kopfzeile je
+  Gruppe. Je Angebot folgt nur eine kurze Zeile mit Produkt, Preis und Grundpreis,
+  der Gültigkeitszeitraum steht als Bereich im Gruppenkopf und nur bei Abweichungen
+  an der Zeile. Das spart bei gleichem Inhalt einen Großteil der Prompt-Tokens.
+
+Welches Format verwendet wird, lässt sich je Modell festlegen (Schlüssel
+"context_format" in get_available_models()), sonst gilt SPARFUCHS_CONTEXT_FORMAT.
+"""
+from __future__ import annotations
+import os
+import pandas as pd
+
+from ..utils.unit_price_parser import format_unit_price
+
+# Verfügbare Kontextformate
+CONTEXT_FORMAT_LABELLED = "beschriftet"
+CONTEXT_FORMAT_COMPACT = "kompakt"
+CONTEXT_FORMATS = (CONTEXT_FORMAT_LABELLED, CONTEXT_FORMAT_COMPACT)
+
+# Standardformat für Modelle ohne eigene Angabe
+DEFAULT_CONTEXT_FORMAT = os.getenv("SPARFUCHS_CONTEXT_FORMAT", CONTEXT_FORMAT_LABELLED)
+
+# Spaltenkopf des kompakten Formats und Lesehilfe für die Zeiträume
+COMPACT_COLUMNS = "Produkt | Preis € | Grundpreis"
+COMPACT_LEGEND = "Zeiträume: '19.05.-24.05.2025' bedeutet gültig vom 19.05.2025 bis 24.05.2025.\n"
+
+def context_format_for(model: dict | None) -> str:
+    """
+    Liefert das Kontextformat für ein Modell aus get_available_models().
+
+    Unbekannte Angaben fallen auf das beschriftete Format zurück.
+    """
+    context_format = (model or {}).get("context_format", DEFAULT_CONTEXT_FORMAT)
+    return context_format if context_format in CONTEXT_FORMATS else CONTEXT_FORMAT_LABELLED
+
+def format_labelled_offers(df: pd.DataFrame, with_ids: bool = False) -> str:
+    """
+    Gibt die Angebote im beschrifteten Format aus (eine Zeile je Feld).
+
+    Mit `with_ids` steht vor jedem Angebot seine ID (Index-Label), z.B. für den Ausgabemodus "ids".
+    """
+    context = ""
+    for offer_id, row in df.iterrows():
+        if with_ids:
+            context += f"ID: {offer_id}\n"
+        # Zugriff auf die deutschen Spaltenbezeichnungen
+        produkt = row.get('Produktname', 'N/A')
+        kategorie = row.get('Kategorie', 'N/A')
+        unterkategorie = row.get('Unterkategorie', 'N/A')
+        preis = row.get('Preis_EUR', 'N/A')
+        start_datum = row.get('Startdatum', 'N/A')
+        end_datum = row.get('Enddatum', 'N/A')
+        supermarkt = row.get('Supermarkt', 'N/A')
+        grundpreis = format_unit_price(row)
+        grundpreis_info = f"Grundpreis: {grundpreis}\n" if grundpreis else ""
+
+        # Format angepasst, um einfacher in das gewünschte Ausgabeformat umgewandelt werden zu können
+        context += (
+            f"Produkt: {produkt}\n"
+            f"Kategorie: {kategorie}\n"
+            f"Unterkategorie: {unterkategorie}\n"
+            f"Preis: {preis}\n"
+            f"{grundpreis_info}"
+            f"Startdatum: {start_datum}\n"
+            f"Enddatum: {end_datum}\n"
+            f"Supermarkt: {supermarkt}\n\n"
+        )
+    return context
+
+def _date_range(start, end) -> str:
+    """
+    Fasst Start- und Enddatum zu einem Bereich zusammen, z.B. '19.05.-24.05.2025'.
+    """
+    start_day = pd.to_datetime(start, errors='coerce')
+    end_day = pd.to_datetime(end, errors='coerce')
+    if pd.isna(start_day) and pd.isna(end_day):
+        return "ohne Datum"
+    if pd.isna(start_day):
+        return f"bis {end_day:%d.%m.%Y}"
+    if pd.isna(end_day):
+        return f"ab {start_day:%d.%m.%Y}"
+    if start_day.year == end_day.year:
+        return f"{start_day:%d.%m.}-{end_day:%d.%m.%Y}"
+    return f"{start_day:%d.%m.%Y}-{end_day:%d.%m.%Y}"
+
+def _compact_row(row, with_range: str | None, with_market: bool, offer_id=None) -> str:
+    fields = [str(row.get('Produktname', 'N/A')), str(row.get('Preis_EUR', 'N/A')), format_unit_price(row) or "-"]
+    if offer_id is not None:
+        fields.insert(0, str(offer_id))
+    if with_market:
+        fields.append(str(row.get('Supermarkt', 'N/A')))
+    if with_range:
+        fields.append(with_range)
+    return " | ".join(fields) + "\n"
+
+def format_compact_offers(df: pd.DataFrame, ordered: bool = False, with_ids: bool = False) -> str:
+    """
+    Gibt die Angebote im kompakten Format aus.
+
+    Ohne `ordered` werden die Angebote nach Supermarkt und Kategorie gruppiert. Jede
+    Gruppe beginnt mit einer Kopfzeile samt dem häufigsten Gültigkeitszeitraum, Angebote
+    mit abweichendem Zeitraum tragen ihn als letzte Spalte. Mit `ordered` (z.B. nach
+    Grundpreis sortierte Treffer) bleibt die Reihenfolge erhalten, und jede Zeile
+    nennt Supermarkt und Zeitraum selbst.
+
+    Args:
+        df (DataFrame): Die Angebote
+        ordered (bool): Ob die Reihenfolge der Zeilen erhalten bleiben muss
+        with_ids (bool): Ob jede Zeile mit der ID des Angebots (Index-Label) beginnt
+
+    Returns:
+        str: Der Kontexttext
+    """
+    if df.empty:
+        return ""
+    ranges = [_date_range(start, end) for start, end in zip(df.get('Startdatum', [None] * len(df)),
+                                                           df.get('Enddatum', [None] * len(df)))]
+    columns = f"ID | {COMPACT_COLUMNS}" if with_ids else COMPACT_COLUMNS
+    if ordered:
+        context = COMPACT_LEGEND + f"{columns} | Supermarkt | gültig\n"
+        for (offer_id, row), validity in zip(df.iterrows(), ranges):
+            context += _compact_row(row, validity, with_market=True, offer_id=offer_id if with_ids else None)
+        return context
+
+    df = df.assign(_gueltig=ranges)
+    group_columns = [column for column in ('Supermarkt', 'Kategorie', 'Unterkategorie') if column in df.columns]
+    context = COMPACT_LEGEND + f"{columns} [| gültig, falls abweichend vom Gruppenkopf]\n"
+    current_market = None
+    for keys, group in df.groupby(group_columns, sort=True, dropna=False):
+        keys = keys if isinstance(keys, tuple) else (keys,)
+        values = dict(zip(group_columns, keys))
+        market = values.get('Supermarkt')
+        if market != current_market:
+            context += f"\n## {market}\n"
+            current_market = market
+        category = " / ".join(str(values[column]) for column in ('Kategorie', 'Unterkategorie')
+                              if column in values and pd.notna(values[column]))
+        group_range = group['_gueltig'].mode().iloc[0]
+        context += f"# {category or 'Ohne Kategorie'} (gültig {group_range})\n"
+        for (offer_id, row), validity in zip(group.iterrows(), group['_gueltig']):
+            context += _compact_row(row, validity if validity != group_range else None, with_market=False,
+                                    offer_id=offer_id if with_ids else None)
+    return context
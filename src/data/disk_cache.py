@@ -0,0 +1,187 @@
+"""
+Persistenter Zwischenspeicher für Suchergebnisse und KI-Antworten.
+
+Die Speicher im Arbeitsspeicher (retrieval_cache.py) sind nach jedem Neustart oder
+Deployment leer. Dieses Modul legt Suchergebnisse und Antworten des Modells zusätzlich
+in einer lokalen SQLite-Datei ab. Alle Einträge sind nach dem Fingerabdruck der Daten
+(data_fingerprint) getrennt: Ändert sich der Angebotskatalog, die Taxonomie oder der
+Suchcode, werden alte Einträge nicht mehr getroffen und nach und nach verdrängt.
+
+Die Datei ist in der Größe begrenzt; bei Überschreitung werden die am längsten nicht
+genutzten Einträge gelöscht. Beim ersten Zugriff auf einen Datenstand lädt
+product_data die zuletzt genutzten Suchergebnisse in den Arbeitsspeicher.
+Mehrere Worker-Prozesse können dieselbe Datei verwenden (WAL-Modus).
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+import streamlit as st
+from pathlib import Path
+
+# Pfad der Cache-Datei (leer = kein persistenter Cache)
+DISK_CACHE_PATH = os.getenv("SPARFUCHS_DISK_CACHE", "data/cache/sparfuchs.sqlite")
+
+# Maximale Größe der gespeicherten Werte in Bytes
+DISK_CACHE_MAX_BYTES = int(float(os.getenv("SPARFUCHS_DISK_CACHE_MB", "64")) * 1024 * 1024)
+
+# Anzahl der Suchergebnisse, die beim Start in den Arbeitsspeicher geladen werden
+DISK_CACHE_WARM_ENTRIES = int(os.getenv("SPARFUCHS_DISK_CACHE_WARM", "512"))
+
+# Arten von Einträgen
+KIND_ROWS = "suche"
+KIND_RESPONSE = "antwort"
+
+# Dateien, deren Inhalt die Suchergebnisse bestimmt (neben dem Angebotskatalog selbst)
+FINGERPRINT_SOURCES = [
+    Path("data/Taxonomie.csv"),
+    Path(__file__).parent / "product_data.py",
+    Path(__file__).parent / "search_index.py",
+    Path(__file__).parent / "taxonomy.py",
+    Path(__file__).parents[1] / "utils" / "text_normalization.py",
+]
+
+class DiskCache:
+    """
+    Threadsicherer Schlüssel-Wert-Speicher in einer SQLite-Datei mit Verdrängung nach letzter Nutzung.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = DISK_CACHE_MAX_BYTES):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache (kind TEXT, fingerprint TEXT, key TEXT, value TEXT, size INTEGER, "
+            "last_used REAL, PRIMARY KEY (kind, fingerprint, key))"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)")
+
+    def get(self, kind: str, fingerprint: str, key: str) -> str | None:
+        """
+        Liefert den Wert zu einem Schlüssel oder None und vermerkt die Nutzung.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM cache WHERE kind = ? AND fingerprint = ? AND key = ?", (kind, fingerprint, key)
+            ).fetchone()
+            if row is not None:
+                self._connection.execute(
+                    "UPDATE cache SET last_used = ? WHERE kind = ? AND fingerprint = ? AND key = ?",
+                    (time.time(), kind, fingerprint, key)
+                )
+        return row[0] if row is not None else None
+
+    def put(self, kind: str, fingerprint: str, key: str, value: str) -> None:
+        """
+        Speichert einen Wert und verdrängt bei Überschreitung der Maximalgröße die am längsten nicht genutzten Einträge.
+        """
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)", (kind, fingerprint, key, value, size, time.time())
+            )
+            total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            while total > self.max_bytes:
+                # Älteste Einträge blockweise löschen, bis wieder Platz ist
+                oldest = self._connection.execute("SELECT rowid, size FROM cache ORDER BY last_used LIMIT 64").fetchall()
+                if not oldest:
+                    break
+                self._connection.executemany("DELETE FROM cache WHERE rowid = ?", [(rowid,) for rowid, _ in oldest])
+                total -= sum(size for _, size in oldest)
+
+    def recent(self, kind: str, fingerprint: str, limit: int) -> list[tuple[str, str]]:
+        """
+        Liefert die zuletzt genutzten Einträge einer Art und eines Datenstands als (Schlüssel, Wert).
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT key, value FROM cache WHERE kind = ? AND fingerprint = ? ORDER BY last_used DESC LIMIT ?",
+                (kind, fingerprint, limit)
+            ).fetchall()
+
+@st.cache_resource
+def get_disk_cache() -> DiskCache | None:
+    """
+    Liefert den prozessweit geteilten persistenten Cache oder None, wenn er abgeschaltet ist oder nicht geöffnet werden kann.
+    """
+    if not DISK_CACHE_PATH:
+        return None
+    try:
+        return DiskCache(Path(DISK_CACHE_PATH))
+    except (OSError, sqlite3.Error) as e:
+        print(f"Persistenter Cache {DISK_CACHE_PATH} nicht verfügbar: {e}")
+        return None
+
+# Fingerabdrücke je Datenstand (OfferStore.version) dieses Prozesses
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+def data_fingerprint(store) -> str:
+    """
+    Liefert den Fingerabdruck eines Datenstands: Inhalt des Angebotskatalogs (samt Angebots-IDs)
+    und der Dateien in FINGERPRINT_SOURCES.
+
+    Anders als OfferStore.version ist er über Neustarts und Prozesse hinweg gleich, solange
+    sich die Daten nicht ändern. Er wird einmal je Datenstand berechnet.
+    """
+    with _fingerprints_lock:
+        fingerprint = _fingerprints.get(store.version)
+    if fingerprint is not None:
+        return fingerprint
+
+    digest = hashlib.sha256()
+    catalog = store.frame(None)
+    digest.update(",".join(map(str, catalog.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(catalog, index=True).to_numpy().tobytes())
+    for source in FINGERPRINT_SOURCES:
+        digest.update(source.read_bytes() if source.exists() else b"")
+    fingerprint = digest.hexdigest()[:16]
+
+    with _fingerprints_lock:
+        _fingerprints[store.version] = fingerprint
+    return fingerprint
+
+def encode_key(key) -> str:
+    """
+    Wandelt einen Schlüssel aus Tupeln, Texten und Zahlen in einen Text für die Cache-Datei um.
+    """
+    return json.dumps(key, ensure_ascii=False, separators=(",", ":"))
+
+def decode_key(text: str):
+    """
+    Gegenstück zu encode_key(): Listen werden wieder zu Tupeln.
+    """
+    def to_tuple(value):
+        return tuple(to_tuple(item) for item in value) if isinstance(value, list) else value
+    return to_tuple(json.loads(text))
+
+def get_response(store, key) -> str | None:
+    """
+    Liefert eine gespeicherte Antwort des Modells für den Datenstand oder None.
+
+    Args:
+        store (OfferStore): Der Angebotsspeicher des Durchlaufs
+        key: Schlüssel der Anfrage aus Tupeln, Texten und Zahlen (z.B. Modell, Antwortbudget, Nachrichten-Fingerabdruck)
+    """
+    disk = get_disk_cache()
+    if disk is None:
+        return None
+    return disk.get(KIND_RESPONSE, data_fingerprint(store), encode_key(key))
+
+def put_response(store, key, response: str) -> None:
+    """
+    Speichert eine Antwort des Modells für den Datenstand (siehe get_response).
+    """
+    disk = get_disk_cache()
+    if disk is not None and response:
+        disk.put(KIND_RESPONSE, data_fingerprint(store), encode_key(key), response)
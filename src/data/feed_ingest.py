@@ -0,0 +1,354 @@
+"""
+Inkrementeller Import neuer Angebots-Feeds.
+
+Ein neuer Feed (CSV im Format von data/Angebote.csv) wird über den Schlüssel
+(Produktname, Supermarkt, Startdatum) mit dem aktuellen Katalog verglichen. Daraus
+entsteht ein Delta aus neuen, geänderten und abgelaufenen Angeboten. Abgelaufen sind
+nur Angebote der Supermärkte, die im Feed vorkommen, damit ein Feed eines einzelnen
+Markts die anderen Märkte nicht leert.
+
+Jedes Delta wird als nummerierte Version im Verlaufsverzeichnis abgelegt
+(delta-000001.csv, ...; Übersicht in history.csv). Laufende App-Prozesse erkennen eine
+neue Version und wenden nur das Delta auf Katalog, Suchindizes und Gültigkeitsindex an,
+statt alles neu zu laden. Die Taxonomie-Erweiterungen werden erst beim nächsten
+Neustart neu berechnet.
+
+Aufruf (z.B. stündlich):
+
+    python -m src.data.feed_ingest pfad/zum/feed.csv
+"""
+from __future__ import annotations
+import argparse
+import os
+import threading
+import time
+import pandas as pd
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from pathlib import Path
+
+from . import offer_store, product_data
+from .offer_store import MarketPartition, OfferStore
+from .search_index import build_head_vocabulary, build_search_index, update_search_index
+from .feed_validation import ValidationReport, read_validated_csv
+from .validity_index import update_validity_index
+from ..utils.unit_price_parser import add_unit_prices
+
+# Verzeichnis mit Versionsnummer, Deltas und Verlauf
+FEED_HISTORY_DIR = Path(os.getenv("SPARFUCHS_FEED_HISTORY_DIR", "data/feed_history"))
+VERSION_FILE_NAME = "VERSION"
+HISTORY_FILE_NAME = "history.csv"
+
+# Schlüssel eines Angebots über Feeds hinweg
+KEY_COLUMNS = ['Produktname', 'Supermarkt', 'Startdatum']
+
+# Spalte mit der Art der Änderung im Delta
+ACTION_COLUMN = 'Aktion'
+ACTION_INSERT = "neu"
+ACTION_UPDATE = "geändert"
+ACTION_EXPIRE = "abgelaufen"
+
+# Mindestabstand, in dem laufende Prozesse nach einer neuen Version sehen
+FEED_CHECK_INTERVAL_SECONDS = 30
+
+def read_feed(path: Path) -> tuple[pd.DataFrame, ValidationReport]:
+    """
+    Liest einen Feed blockweise geprüft ein, mit allen Werten als Text, damit der Vergleich
+    nicht an Zahlenformaten scheitert.
+
+    Fehlerhafte Zeilen landen in der Quarantäne (siehe feed_validation.py). Mehrfach
+    vorkommende Schlüssel werden auf den letzten Eintrag reduziert.
+
+    Returns:
+        tuple[DataFrame, ValidationReport]: Die gültigen Zeilen und der Prüfbericht
+    """
+    df, report = read_validated_csv(path)
+    return df.drop_duplicates(KEY_COLUMNS, keep='last').reset_index(drop=True), report
+
+def diff_feeds(current: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """
+    Vergleicht einen neuen Feed mit dem aktuellen Katalog.
+
+    Args:
+        current (DataFrame): Der aktuelle Katalog (aus read_feed)
+        new (DataFrame): Der neue Feed (aus read_feed)
+
+    Returns:
+        DataFrame: Das Delta mit den Spalten des Feeds und der Spalte 'Aktion'
+                   (neue und geänderte Angebote mit neuen Werten, abgelaufene mit den bisherigen)
+    """
+    columns = list(new.columns)
+    value_columns = [column for column in columns if column not in KEY_COLUMNS]
+    if current.empty:
+        return new.assign(**{ACTION_COLUMN: ACTION_INSERT})[columns + [ACTION_COLUMN]]
+
+    current = current.reindex(columns=columns, fill_value="")
+    merged = current.merge(new, on=KEY_COLUMNS, how='outer', suffixes=('_alt', ''), indicator=True)
+
+    inserts = merged[merged['_merge'] == 'right_only']
+    both = merged[merged['_merge'] == 'both']
+    changed = pd.Series(False, index=both.index)
+    for column in value_columns:
+        changed |= both[column] != both[f"{column}_alt"]
+    updates = both[changed]
+
+    feed_markets = set(new['Supermarkt'])
+    expiries = merged[(merged['_merge'] == 'left_only') & merged['Supermarkt'].isin(feed_markets)]
+    expiries = expiries.assign(**{column: expiries[f"{column}_alt"] for column in value_columns})
+
+    delta = pd.concat([
+        inserts[columns].assign(**{ACTION_COLUMN: ACTION_INSERT}),
+        updates[columns].assign(**{ACTION_COLUMN: ACTION_UPDATE}),
+        expiries[columns].assign(**{ACTION_COLUMN: ACTION_EXPIRE}),
+    ], ignore_index=True)
+    return delta
+
+def _delta_path(directory: Path, version: int) -> Path:
+    return directory / f"delta-{version:06d}.csv"
+
+def current_version(directory: Path | None = None) -> int:
+    """
+    Liefert die Nummer der zuletzt importierten Feed-Version (0, wenn noch kein Feed importiert wurde).
+    """
+    try:
+        return int(((directory or FEED_HISTORY_DIR) / VERSION_FILE_NAME).read_text(encoding="utf-8").strip())
+    except (OSError, ValueError):
+        return 0
+
+def load_delta(version: int, directory: Path | None = None) -> pd.DataFrame | None:
+    """
+    Lädt das Delta einer Version oder None, wenn es nicht (mehr) vorhanden ist.
+    """
+    path = _delta_path(directory or FEED_HISTORY_DIR, version)
+    if not path.exists():
+        return None
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+def _write_atomic(df: pd.DataFrame, path: Path) -> None:
+    """
+    Schreibt eine CSV-Datei zuerst unter temporärem Namen und ersetzt dann die alte Datei.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+def _merge_into_catalog(current: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    """
+    Wendet ein Delta auf den Katalog im CSV-Format an (bisherige Reihenfolge, neue Angebote am Ende).
+    """
+    columns = [column for column in delta.columns if column != ACTION_COLUMN]
+    if current.empty:
+        return delta.loc[delta[ACTION_COLUMN] != ACTION_EXPIRE, columns].reset_index(drop=True)
+
+    current_keys = pd.MultiIndex.from_frame(current[KEY_COLUMNS])
+    delta_keys = pd.MultiIndex.from_frame(delta[KEY_COLUMNS])
+    replaced = current_keys.isin(delta_keys)
+
+    updated = delta[delta[ACTION_COLUMN] == ACTION_UPDATE].set_index(KEY_COLUMNS)
+    catalog = current.copy()
+    if not updated.empty:
+        positions = current_keys.get_indexer(updated.index)
+        for column in columns:
+            if column not in KEY_COLUMNS:
+                catalog.loc[catalog.index[positions], column] = updated[column].to_numpy()
+        replaced &= ~current_keys.isin(updated.index)
+
+    inserts = delta.loc[delta[ACTION_COLUMN] == ACTION_INSERT, columns]
+    return pd.concat([catalog[~replaced], inserts], ignore_index=True)
+
+def ingest_feed(feed_path: Path, csv_path: Path | None = None, directory: Path | None = None) -> tuple[int, pd.DataFrame, ValidationReport]:
+    """
+    Importiert einen Feed: berechnet das Delta, legt es als neue Version ab und aktualisiert den Katalog.
+
+    Reihenfolge: Delta-Datei, Katalog-CSV, Verlauf, Versionsnummer. Prozesse, die die neue
+    Versionsnummer sehen, finden damit immer auch das Delta. Es darf nur ein Import gleichzeitig laufen.
+
+    Args:
+        feed_path (Path): Der neue Feed
+        csv_path (Path | None): Die Katalog-CSV (Standard: data/Angebote.csv)
+        directory (Path | None): Das Verlaufsverzeichnis (Standard: FEED_HISTORY_DIR)
+
+    Returns:
+        tuple[int, DataFrame, ValidationReport]: Die aktuelle Version, das angewendete Delta
+            (leer, wenn sich nichts geändert hat) und der Prüfbericht des Feeds
+    """
+    csv_path = csv_path or product_data.CSV_FILE_PATH
+    directory = directory or FEED_HISTORY_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+
+    new, report = read_feed(feed_path)
+    current = read_feed(csv_path)[0] if csv_path.exists() else pd.DataFrame(columns=new.columns)
+    delta = diff_feeds(current, new)
+    version = current_version(directory)
+    if delta.empty:
+        return version, delta, report
+
+    version += 1
+    _write_atomic(delta, _delta_path(directory, version))
+    _write_atomic(_merge_into_catalog(current, delta), csv_path)
+
+    counts = delta[ACTION_COLUMN].value_counts()
+    history_entry = pd.DataFrame([{
+        "Version": version,
+        "Zeitpunkt": datetime.now().isoformat(timespec="seconds"),
+        "Quelle": str(feed_path),
+        "Neu": int(counts.get(ACTION_INSERT, 0)),
+        "Geändert": int(counts.get(ACTION_UPDATE, 0)),
+        "Abgelaufen": int(counts.get(ACTION_EXPIRE, 0)),
+    }])
+    history_path = directory / HISTORY_FILE_NAME
+    history_entry.to_csv(history_path, mode='a', header=not history_path.exists(), index=False)
+
+    version_tmp = directory / f"{VERSION_FILE_NAME}.tmp"
+    version_tmp.write_text(str(version), encoding="utf-8")
+    os.replace(version_tmp, directory / VERSION_FILE_NAME)
+    return version, delta, report
+
+def apply_delta(store: OfferStore, delta: pd.DataFrame) -> OfferStore:
+    """
+    Wendet ein Delta auf einen aufgebauten Angebotsspeicher an.
+
+    Nur die betroffenen Zeilen werden neu indiziert. Geänderte Angebote behalten ihr
+    Index-Label, neue erhalten fortlaufende Labels nach dem bisher größten. Das Anwenden
+    ist über den Schlüssel idempotent: ein bereits enthaltenes neues Angebot wird
+    überschrieben, ein bereits entferntes abgelaufenes ignoriert.
+
+    Args:
+        store (OfferStore): Der bisherige Speicher (wird nicht verändert)
+        delta (DataFrame): Das Delta aus diff_feeds() bzw. load_delta()
+
+    Returns:
+        OfferStore: Der aktualisierte Speicher
+    """
+    if delta.empty:
+        return store
+    df = store.df
+    labels_by_key = dict(zip(zip(*(df[column].astype(str) for column in KEY_COLUMNS)), df.index)) if not df.empty else {}
+    next_label = (df.index.max() + 1) if not df.empty else 0
+
+    removed = set()
+    added_labels = []
+    added_positions = []
+    for position, (action, *key) in enumerate(zip(delta[ACTION_COLUMN], *(delta[column] for column in KEY_COLUMNS))):
+        label = labels_by_key.get(tuple(key))
+        if action == ACTION_EXPIRE:
+            if label is not None:
+                removed.add(label)
+            continue
+        if label is None:
+            label = next_label
+            next_label += 1
+            labels_by_key[tuple(key)] = label
+        else:
+            removed.add(label)
+        added_labels.append(label)
+        added_positions.append(position)
+
+    columns = [column for column in delta.columns if column != ACTION_COLUMN]
+    added_df = delta.iloc[added_positions][columns].set_axis(pd.Index(added_labels))
+    added_df = add_unit_prices(added_df) if not added_df.empty else added_df
+    new_df = pd.concat([df.drop(index=list(removed)), added_df]).sort_index() if not df.empty else added_df
+
+    # Grundwort-Wortschatz wächst um die neuen Angebote (verkleinert wird er erst beim Neuaufbau)
+    head_vocabulary = store_vocabulary(store)
+    if not added_df.empty:
+        head_vocabulary = frozenset(head_vocabulary | build_head_vocabulary(added_df))
+
+    touched_markets = set(df.loc[df.index.intersection(list(removed)), 'Supermarkt']) | set(added_df.get('Supermarkt', ()))
+    partitions = {}
+    for market in dict.fromkeys(list(store.partitions) + sorted(touched_markets - set(store.partitions))):
+        partition = store.partitions.get(market)
+        if market not in touched_markets:
+            partitions[market] = replace(partition, index=replace(partition.index, head_vocabulary=head_vocabulary))
+            continue
+        market_df = new_df[new_df['Supermarkt'] == market]
+        if market_df.empty:
+            continue
+        market_added = added_df[added_df['Supermarkt'] == market]
+        if partition is None:
+            index = build_search_index(market_df, head_vocabulary)
+        else:
+            index = update_search_index(partition.index, removed & set(partition.df.index), market_added, head_vocabulary)
+        partitions[market] = MarketPartition(market=market, df=market_df, index=index)
+
+    start_days = pd.to_datetime(new_df['Startdatum'], errors='coerce') if 'Startdatum' in new_df.columns else pd.Series(dtype='datetime64[ns]')
+    latest_start = start_days.max().date() if start_days.notna().any() else None
+    validity = update_validity_index(store.validity, removed, added_df, latest_start)
+    return OfferStore(df=new_df, partitions=partitions, validity=validity)
+
+@dataclass
+class LocalStoreState:
+    """
+    Der prozesslokale Angebotsspeicher mit der Feed-Version, auf deren Stand er ist.
+
+    Attributes:
+        store (OfferStore): Der aktuelle Speicher (wird bei einer neuen Version ersetzt, nie verändert)
+        feed_version (int): Die zuletzt angewendete Feed-Version
+        checked_at (float): Zeitpunkt der letzten Prüfung auf eine neue Version (time.monotonic)
+        lock (threading.Lock): Verhindert, dass mehrere Sitzungen dasselbe Delta gleichzeitig anwenden
+    """
+    store: OfferStore
+    feed_version: int
+    checked_at: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+def refresh_local_store(state: LocalStoreState) -> OfferStore:
+    """
+    Bringt den prozesslokalen Speicher auf die neueste Feed-Version und liefert ihn.
+
+    Höchstens alle FEED_CHECK_INTERVAL_SECONDS wird die Versionsnummer gelesen. Fehlt ein
+    Delta im Verlauf, wird der Speicher aus der Katalog-CSV neu aufgebaut.
+    """
+    now = time.monotonic()
+    if now - state.checked_at < FEED_CHECK_INTERVAL_SECONDS:
+        return state.store
+    state.checked_at = now
+
+    version = current_version()
+    if version <= state.feed_version:
+        return state.store
+
+    with state.lock:
+        store = state.store
+        for pending in range(state.feed_version + 1, version + 1):
+            delta = load_delta(pending)
+            if delta is None:
+                product_data.load_csv_data.clear()
+                store = offer_store.build_offer_store(product_data.load_csv_data(), store_vocabulary(store))
+                break
+            store = apply_delta(store, delta)
+        state.feed_version = max(state.feed_version, version)
+        state.store = replace(store, version=f"feed-{state.feed_version}")
+    return state.store
+
+def store_vocabulary(store: OfferStore) -> frozenset:
+    """
+    Liefert den Grundwort-Wortschatz eines Speichers (für einen Neuaufbau mit gleichem Wortschatz).
+    """
+    return next(iter(store.partitions.values())).index.head_vocabulary if store.partitions else frozenset()
+
+def main():
+    parser = argparse.ArgumentParser(description="Importiert neue Angebots-Feeds als Delta zum aktuellen Katalog.")
+    parser.add_argument("feeds", nargs="+", type=Path, help="CSV-Dateien im Format von data/Angebote.csv")
+    args = parser.parse_args()
+
+    for feed_path in args.feeds:
+        version, delta, report = ingest_feed(feed_path)
+        if report.quarantined_rows:
+            print(report.summary())
+        if delta.empty:
+            print(f"{feed_path}: keine Änderungen (Version {version})")
+            continue
+        counts = delta[ACTION_COLUMN].value_counts()
+        print(
+            f"{feed_path}: Version {version} - {counts.get(ACTION_INSERT, 0)} neu, "
+            f"{counts.get(ACTION_UPDATE, 0)} geändert, {counts.get(ACTION_EXPIRE, 0)} abgelaufen"
+        )
+
+    # Im gemeinsamen Speicher mehrerer Prozesse wird eine neue Generation veröffentlicht
+    from . import shared_store
+    if shared_store.is_enabled():
+        print(f"Generation {shared_store.publish_snapshot(force=True)} veröffentlicht in {shared_store.shared_store_dir()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Blockweises Einlesen und Prüfen von Angebots-CSV-Dateien.
+
+Dieses Modul liest Angebotsdateien zeilenweise in Blöcken fester Größe, statt die
+ganze Datei auf einmal zu laden. Jede Zeile wird geprüft (Produktname vorhanden,
+Preis lesbar und nicht 0, Datumsangaben gültig, bekannter Supermarkt). Fehlerhafte Zeilen werden
+mit Zeilennummer und Grund in eine Quarantänedatei geschrieben und übersprungen,
+sodass einzelne kaputte Zeilen nicht mehr die ganze Datei unbrauchbar machen.
+"""
+from __future__ import annotations
+import csv
+import os
+import pandas as pd
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+# Die unterstützten Supermärkte (auch die Auswahl in der Oberfläche, siehe market_toggles.py)
+MARKETS = ["Aldi", "Lidl", "Penny", "Edeka", "Rewe"]
+
+# Anzahl Zeilen je Block
+CSV_CHUNK_ROWS = 50_000
+
+# Pflichtspalten einer Angebotsdatei
+REQUIRED_COLUMNS = ['Produktname', 'Preis_EUR', 'Startdatum', 'Enddatum', 'Supermarkt']
+
+# Verzeichnis für die Quarantänedateien
+QUARANTINE_DIR = Path(os.getenv("SPARFUCHS_QUARANTINE_DIR", "data/quarantine"))
+
+# Anzahl fehlerhafter Zeilen, die zusätzlich im Bericht aufgeführt werden
+REPORT_EXAMPLES = 5
+
+# Datumsformat der Angebotsdaten
+DATE_FORMAT = "%Y-%m-%d"
+
+@dataclass
+class ValidationReport:
+    """
+    Ergebnis der Prüfung einer Angebotsdatei.
+
+    Attributes:
+        path (Path): Die geprüfte Datei
+        columns (list[str]): Die Spalten laut Kopfzeile
+        valid_rows (int): Anzahl übernommener Zeilen
+        quarantined_rows (int): Anzahl übersprungener Zeilen
+        quarantine_path (Path | None): Die Quarantänedatei (None, wenn alle Zeilen gültig waren)
+        examples (list[tuple[int, str]]): Die ersten fehlerhaften Zeilen als (Zeilennummer, Grund)
+    """
+    path: Path
+    columns: list = field(default_factory=list)
+    valid_rows: int = 0
+    quarantined_rows: int = 0
+    quarantine_path: Path | None = None
+    examples: list = field(default_factory=list)
+
+    def summary(self) -> str:
+        """
+        Beschreibt die übersprungenen Zeilen in einem Satz (leer, wenn alle Zeilen gültig waren).
+        """
+        if not self.quarantined_rows:
+            return ""
+        examples = "; ".join(f"Zeile {line}: {reason}" for line, reason in self.examples)
+        return (
+            f"{self.quarantined_rows} fehlerhafte Zeilen in '{self.path}' wurden übersprungen "
+            f"(Details in '{self.quarantine_path}'). {examples}"
+        )
+
+class _QuarantineWriter:
+    """
+    Schreibt fehlerhafte Zeilen fortlaufend in eine Quarantänedatei, die erst beim ersten Fehler angelegt wird.
+    """
+
+    def __init__(self, report: ValidationReport, header: list, directory: Path):
+        self.report = report
+        self.header = header
+        self.directory = directory
+        self._file = None
+        self._writer = None
+
+    def write(self, line: int, reason: str, values: list) -> None:
+        if self._writer is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.report.quarantine_path = self.directory / f"{self.report.path.stem}-{datetime.now():%Y%m%d-%H%M%S}.csv"
+            self._file = open(self.report.quarantine_path, "w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(["Zeile", "Fehler"] + self.header)
+        self._writer.writerow([line, reason] + list(values))
+        self.report.quarantined_rows += 1
+        if len(self.report.examples) < REPORT_EXAMPLES:
+            self.report.examples.append((line, reason))
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+def _parse_price(values: pd.Series) -> pd.Series:
+    return pd.to_numeric(values.str.strip().str.replace(",", ".", regex=False), errors='coerce')
+
+def _row_errors(chunk: pd.DataFrame) -> pd.Series:
+    """
+    Prüft einen Block zeilenweise und liefert je Zeile die Fehlerbeschreibung (leer = gültig).
+    """
+    errors = pd.Series("", index=chunk.index, dtype=object)
+
+    def flag(mask: pd.Series, reason: str):
+        errors[mask] = errors[mask].map(lambda existing: f"{existing}; {reason}" if existing else reason)
+
+    flag(chunk['Produktname'].str.strip() == "", "Produktname fehlt")
+
+    # Textpreise wie 'Frischepreis im Markt' sind zulässig, Zahlen müssen lesbar und größer als 0 sein
+    prices = chunk['Preis_EUR'].str.strip()
+    numeric_prices = _parse_price(chunk['Preis_EUR'])
+    is_text_price = prices.str.contains(r"[A-Za-zÄÖÜäöüß]{3,}", regex=True)
+    flag(prices == "", "Preis fehlt")
+    flag((prices != "") & numeric_prices.isna() & ~is_text_price, "Preis nicht lesbar")
+    flag(numeric_prices < 0, "Preis negativ")
+    flag(numeric_prices == 0, "Preis 0")
+
+    # Datumsangaben dürfen fehlen, müssen sonst aber gültig sein und dürfen nicht rückwärts laufen
+    dates = {}
+    for column in ('Startdatum', 'Enddatum'):
+        values = chunk[column].str.strip()
+        dates[column] = pd.to_datetime(values, format=DATE_FORMAT, errors='coerce')
+        flag((values != "") & dates[column].isna(), f"{column} ungültig")
+    flag(dates['Enddatum'] < dates['Startdatum'], "Enddatum vor Startdatum")
+
+    # Übernommen werden nur die unterstützten Supermärkte
+    flag(~chunk['Supermarkt'].str.strip().isin(MARKETS), "Supermarkt unbekannt")
+    return errors
+
+def iter_validated_chunks(path: Path, report: ValidationReport | None = None, chunk_rows: int = CSV_CHUNK_ROWS,
+                          quarantine_dir: Path | None = None):
+    """
+    Liest eine Angebotsdatei blockweise und liefert nur die gültigen Zeilen.
+
+    Alle Werte bleiben Text. Die Index-Labels der gelieferten Zeilen sind über alle
+    Blöcke fortlaufend (0, 1, 2, ...), wie bei einem einzelnen pd.read_csv.
+
+    Args:
+        path (Path): Die CSV-Datei
+        report (ValidationReport | None): Wird mit Zählern und Quarantänedatei gefüllt
+        chunk_rows (int): Anzahl Zeilen je Block
+        quarantine_dir (Path | None): Verzeichnis für die Quarantänedatei (Standard: QUARANTINE_DIR)
+
+    Yields:
+        DataFrame: Die gültigen Zeilen eines Blocks
+
+    Raises:
+        ValueError: Wenn Pflichtspalten im Kopf der Datei fehlen
+    """
+    path = Path(path)
+    report = report if report is not None else ValidationReport(path=path)
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return
+        missing = [column for column in REQUIRED_COLUMNS if column not in header]
+        if missing:
+            raise ValueError(f"In '{path}' fehlen die Spalten {', '.join(missing)}")
+        report.columns = header
+
+        quarantine = _QuarantineWriter(report, header, quarantine_dir or QUARANTINE_DIR)
+        try:
+            rows, lines = [], []
+            line = reader.line_num
+            for values in reader:
+                first_line, line = line + 1, reader.line_num
+                if not any(values):
+                    continue
+                if len(values) != len(header):
+                    quarantine.write(first_line, f"{len(values)} statt {len(header)} Felder", values)
+                    continue
+                rows.append(values)
+                lines.append(first_line)
+                if len(rows) >= chunk_rows:
+                    yield _validate_chunk(rows, lines, header, report, quarantine)
+                    rows, lines = [], []
+            if rows:
+                yield _validate_chunk(rows, lines, header, report, quarantine)
+        finally:
+            quarantine.close()
+
+def _validate_chunk(rows: list, lines: list, header: list, report: ValidationReport, quarantine: _QuarantineWriter) -> pd.DataFrame:
+    """
+    Prüft einen Block, schreibt fehlerhafte Zeilen in die Quarantäne und nummeriert die gültigen fortlaufend.
+    """
+    chunk = pd.DataFrame(rows, columns=header, dtype=str)
+    errors = _row_errors(chunk)
+    invalid = errors != ""
+    for position in invalid[invalid].index:
+        quarantine.write(lines[position], errors[position], rows[position])
+
+    valid = chunk[~invalid]
+    valid.index = pd.RangeIndex(report.valid_rows, report.valid_rows + len(valid))
+    report.valid_rows += len(valid)
+    return valid
+
+def read_validated_csv(path: Path, chunk_rows: int = CSV_CHUNK_ROWS, quarantine_dir: Path | None = None,
+                       transform=None) -> tuple[pd.DataFrame, ValidationReport]:
+    """
+    Liest eine Angebotsdatei vollständig, aber blockweise geprüft ein.
+
+    Args:
+        path (Path): Die CSV-Datei
+        chunk_rows (int): Anzahl Zeilen je Block
+        quarantine_dir (Path | None): Verzeichnis für die Quarantänedatei
+        transform (callable | None): Wird auf jeden gültigen Block angewendet (z.B. add_unit_prices)
+
+    Returns:
+        tuple[DataFrame, ValidationReport]: Die gültigen Zeilen und der Prüfbericht
+    """
+    report = ValidationReport(path=Path(path))
+    chunks = [
+        transform(chunk) if transform is not None else chunk
+        for chunk in iter_validated_chunks(path, report, chunk_rows, quarantine_dir)
+        if not chunk.empty
+    ]
+    if not chunks:
+        return pd.DataFrame(columns=report.columns), report
+    return pd.concat(chunks), report
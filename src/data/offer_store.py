@@ -0,0 +1,169 @@
+"""
+Nach Supermärkten partitionierter Angebotsspeicher.
+
+Dieses Modul hält die Angebotsdaten in einer Partition je Supermarkt. Jede Partition
+trägt ihren eigenen Suchindex, sodass eine Anfrage mit Marktauswahl nur die
+Partitionen der ausgewählten Märkte durchsucht, statt erst den ganzen Katalog zu
+durchsuchen und danach per `isin` zu filtern. Ein gemeinsamer Gültigkeitsindex
+schränkt die Treffer zusätzlich auf einen Zeitraum ein (siehe validity_index.py).
+
+Ein einmal aufgebauter Speicher wird nie verändert, neue Feeds erzeugen einen neuen
+Speicher mit neuer Version. app.py holt den Speicher deshalb einmal pro Chat-Durchlauf
+und reicht ihn an alle Funktionen weiter; so arbeitet ein Durchlauf durchgehend auf
+demselben Stand, und die gelieferten DataFrames sind gemeinsam genutzte Ansichten, die
+nicht verändert werden dürfen (vor Änderungen .copy() aufrufen).
+"""
+from __future__ import annotations
+import streamlit as st
+import pandas as pd
+from dataclasses import dataclass, field, replace
+from datetime import date
+
+from . import product_data, taxonomy
+from .search_index import SearchIndex, build_head_vocabulary, build_search_index, find_matching_rows
+from .validity_index import ValidityIndex, build_validity_index
+
+@dataclass
+class MarketPartition:
+    """
+    Die Angebote eines einzelnen Supermarkts mit zugehörigem Suchindex.
+
+    Attributes:
+        market (str): Name des Supermarkts (Wert der Spalte 'Supermarkt')
+        df (DataFrame | None): Die Angebote dieses Supermarkts (Index-Labels wie im Gesamtkatalog),
+            None im gemeinsamen Speicher mehrerer Prozesse (siehe shared_store.py)
+        index (SearchIndex): Der Suchindex über diese Angebote
+    """
+    market: str
+    df: pd.DataFrame | None
+    index: SearchIndex
+
+@dataclass
+class OfferStore:
+    """
+    Der gesamte Angebotskatalog, aufgeteilt in eine Partition je Supermarkt.
+
+    Attributes:
+        df (DataFrame): Der vollständige Angebotskatalog
+        partitions (dict[str, MarketPartition]): Supermarkt -> Partition
+        validity (ValidityIndex): Gültigkeitsindex über den gesamten Katalog
+        version (str): Kennung des Datenstands, z.B. 'feed-3' (lokal) oder 'shared-12' (gemeinsamer Snapshot)
+    """
+    df: pd.DataFrame = field(default_factory=pd.DataFrame)
+    partitions: dict = field(default_factory=dict)
+    validity: ValidityIndex = field(default_factory=ValidityIndex)
+    version: str = ""
+
+    @property
+    def empty(self) -> bool:
+        """
+        Gibt an, ob keine Angebote geladen sind.
+        """
+        return self.df.empty
+
+    def select_partitions(self, selected_markets) -> list:
+        """
+        Liefert die Partitionen der ausgewählten Märkte, bei leerer Auswahl alle Partitionen.
+        """
+        if not selected_markets:
+            return list(self.partitions.values())
+        return [self.partitions[market] for market in selected_markets if market in self.partitions]
+
+    def find_rows(self, search_terms, selected_markets, valid_rows=None) -> set:
+        """
+        Sucht die Zeilen zu normalisierten Suchbegriffen, nur in den Partitionen der ausgewählten Märkte.
+
+        Ist valid_rows angegeben (siehe valid_rows()), werden nur diese Zeilen zurückgegeben.
+        """
+        indexes = [partition.index for partition in self.select_partitions(selected_markets)]
+        rows = find_matching_rows(indexes, search_terms)
+        return rows if valid_rows is None else rows & valid_rows
+
+    def valid_rows(self, start: date, end: date) -> set:
+        """
+        Liefert die Zeilen, die an mindestens einem Tag zwischen start und end gültig sind.
+        """
+        return self.validity.valid_between(start, end)
+
+    def frame(self, selected_markets, valid_rows=None) -> pd.DataFrame:
+        """
+        Liefert die Angebote der ausgewählten Märkte (bei leerer Auswahl den gesamten Katalog),
+        optional eingeschränkt auf die Zeilen aus valid_rows.
+
+        Ohne Einschränkung wird der Katalog selbst ohne Kopie geliefert.
+        """
+        if not selected_markets:
+            df = self.df
+        else:
+            partitions = self.select_partitions(selected_markets)
+            if not partitions:
+                return self.df.iloc[0:0]
+            df = pd.concat([partition.df for partition in partitions]).sort_index()
+        if valid_rows is None:
+            return df
+        return df[df.index.isin(list(valid_rows))]
+
+    def rows_to_frame(self, rows) -> pd.DataFrame:
+        """
+        Wählt die Zeilen mit den angegebenen Index-Labels in Katalogreihenfolge aus.
+        """
+        return self.df.loc[self.df.index.intersection(list(rows), sort=False)]
+
+def build_offer_store(df: pd.DataFrame, extra_vocabulary=()) -> OfferStore:
+    """
+    Teilt die Angebotsdaten nach Supermarkt auf und indiziert jede Partition.
+
+    Der Grundwort-Wortschatz für die Kompositazerlegung wird einmal über den gesamten
+    Katalog gebildet, damit alle Partitionen Komposita gleich zerlegen.
+
+    Args:
+        df (DataFrame): Die Angebotsdaten
+        extra_vocabulary: Zusätzliche normalisierte Begriffe (z.B. aus der Taxonomie)
+
+    Returns:
+        OfferStore: Der partitionierte Angebotsspeicher
+    """
+    if df.empty or 'Supermarkt' not in df.columns:
+        return OfferStore(df=df, validity=build_validity_index(df))
+
+    head_vocabulary = build_head_vocabulary(df, extra_vocabulary)
+    partitions = {
+        market: MarketPartition(market=market, df=market_df, index=build_search_index(market_df, head_vocabulary))
+        for market, market_df in df.groupby('Supermarkt', sort=False)
+    }
+    return OfferStore(df=df, partitions=partitions, validity=build_validity_index(df))
+
+def get_offer_store() -> OfferStore:
+    """
+    Liefert den aktuellen Stand des partitionierten Angebotsspeichers.
+
+    Ist SPARFUCHS_SHARED_STORE_DIR gesetzt, teilen sich alle Worker-Prozesse einen per mmap
+    eingebundenen Snapshot (siehe shared_store.py), sonst baut jeder Prozess ihn selbst auf
+    und wendet neu importierte Feeds als Delta an (siehe feed_ingest.py).
+
+    Der gelieferte Speicher ändert sich nicht mehr. Pro Chat-Durchlauf sollte diese Funktion
+    nur einmal aufgerufen und der Speicher weitergereicht werden (Parameter `store`).
+
+    Returns:
+        OfferStore: Der Speicher über load_csv_data()
+    """
+    # Import erst hier, da shared_store und feed_ingest selbst auf den Klassen dieses Moduls aufbauen
+    from . import feed_ingest, shared_store
+    if shared_store.is_enabled():
+        return shared_store.get_shared_offer_store()
+    return feed_ingest.refresh_local_store(_get_local_offer_store())
+
+@st.cache_resource
+def _get_local_offer_store():
+    """
+    Baut den partitionierten Angebotsspeicher einmalig pro Prozess auf.
+
+    Returns:
+        feed_ingest.LocalStoreState: Der Speicher mit der Feed-Version, auf deren Stand er ist
+    """
+    from . import feed_ingest
+    # Version vor dem Laden lesen: Ein gleichzeitig importiertes Delta wird danach noch einmal
+    # angewendet, was über den Angebotsschlüssel keine Wirkung hat
+    feed_version = feed_ingest.current_version()
+    store = build_offer_store(product_data.load_csv_data(), taxonomy.get_expansion_table().keys())
+    return feed_ingest.LocalStoreState(store=replace(store, version=f"feed-{feed_version}"), feed_version=feed_version)
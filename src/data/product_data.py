@@ -4,15 +4,34 @@ Produktdatenverarbeitung für die SparFuchs.de Anwendung.
 Dieses Modul enthält Funktionen zum Laden, Filtern und Aufbereiten
 der Produktdaten aus CSV-Dateien.
 """
+from __future__ import annotations
+import json
 import streamlit as st
 import pandas as pd
-import re
+from datetime import date, timedelta
 from pathlib import Path
 
+from . import disk_cache, taxonomy, offer_store
+from .context_format import CONTEXT_FORMAT_COMPACT, DEFAULT_CONTEXT_FORMAT, format_compact_offers, format_labelled_offers
+from .feed_validation import read_validated_csv
+from .retrieval_cache import get_retrieval_cache
+from ..utils.text_normalization import query_terms, normalize_phrase
+from ..utils.unit_price_parser import add_unit_prices, rank_by_unit_price
+
 # Konstanten
 CSV_FILE_PATH = Path("data/Angebote.csv")
 RECIPE_CSV_FILE_PATH = Path("data/More_Rezepte.csv")
 
+# Zeitraum ab Stichtag (in Tagen), dessen gültige Angebote in den Kontext aufgenommen werden
+VALIDITY_WINDOW_DAYS = 7
+
+# Anfragen mit diesen Wörtern werden auf die am Stichtag gültigen Angebote beschränkt
+TODAY_QUERY_WORDS = ("heute", "heutig")
+
+# Anfragen nach dem günstigsten Angebot werden nach Grundpreis vorsortiert und gekürzt
+CHEAPEST_QUERY_WORDS = ("günstigst", "billigst", "preiswertest")
+CHEAPEST_CONTEXT_LIMIT = 10
+
 @st.cache_data
 def load_recipes():
     """
@@ -43,14 +62,19 @@ def load_csv_data():
     Lädt die Produktdaten aus der CSV-Datei.
     
     Die Funktion ist mit @st.cache_data dekoriert, um Mehrfachladungen zu vermeiden und die
-    Performance zu verbessern.
+    Performance zu verbessern. Die Datei wird blockweise gelesen und zeilenweise geprüft;
+    fehlerhafte Zeilen landen in der Quarantäne, statt das Laden abzubrechen (siehe
+    feed_validation.py). Beim Laden werden Menge, Einheit und Grundpreise
+    (€/kg, €/l, €/Stück) aus den Produktnamen berechnet (siehe unit_price_parser.py).
     
     Returns:
         DataFrame: Ein Pandas DataFrame mit den Produktdaten oder ein leeres DataFrame, wenn die Datei nicht 
-        gefunden wurde oder leer ist.
+        gefunden wurde oder keine gültigen Zeilen enthält.
     """
     try:
-        df = pd.read_csv(CSV_FILE_PATH)
+        df, report = read_validated_csv(CSV_FILE_PATH, transform=add_unit_prices)
+        if report.quarantined_rows:
+            st.warning(report.summary())
         if df.empty:
             st.warning(f"Die CSV-Datei '{CSV_FILE_PATH}' ist leer. Bitte fügen Sie Produktdaten hinzu.")
             return pd.DataFrame()
@@ -59,220 +83,324 @@ def load_csv_data():
         st.warning(f"Fehler beim Laden der CSV-Datei '{CSV_FILE_PATH}': {str(e)}")
         return pd.DataFrame()
 
-def get_products_context():
+def get_validity_window(user_query: str = "", store=None) -> tuple[date, date]:
+    """
+    Bestimmt den Gültigkeitszeitraum, auf den die Angebote vorab eingeschränkt werden.
+
+    Standard ist die Woche ab dem Stichtag, bei Anfragen wie "Was gibt es heute?" nur der
+    Stichtag selbst. Stichtag ist das heutige Datum, bei einem veralteten Katalog der
+    letzte Tag, an dem noch Angebote gültig sind (siehe ValidityIndex.reference_day).
+
+    Args:
+        user_query (str): Die Anfrage des Benutzers
+        store (OfferStore | None): Der Angebotsspeicher dieses Durchlaufs (siehe offer_store.get_offer_store),
+            standardmäßig der aktuelle Stand
+
+    Returns:
+        tuple[date, date]: Erster und letzter Tag des Zeitraums (einschließlich)
+    """
+    store = store if store is not None else offer_store.get_offer_store()
+    start = store.validity.reference_day(date.today())
+    if any(word in user_query.lower() for word in TODAY_QUERY_WORDS):
+        return start, start
+    return start, start + timedelta(days=VALIDITY_WINDOW_DAYS - 1)
+
+def get_products_context(selected_markets: list[str] | None = None, validity_window: tuple[date, date] | None = None, store=None,
+                         context_format: str = DEFAULT_CONTEXT_FORMAT, with_ids: bool = False):
     """
     Wandelt die Produktdaten in einen formatierten Textstring für den KI-Kontext um.
     
     Die Funktion lädt die Produktdaten und formatiert sie als Textstring, der als
-    Kontext für die KI-Anfragen verwendet wird.
+    Kontext für die KI-Anfragen verwendet wird. Aufgenommen werden nur Angebote,
+    die im Gültigkeitszeitraum gültig sind.
+    
+    Args:
+        selected_markets (list[str] | None): Optional die ausgewählten Supermärkte.
+            Es werden nur deren Partitionen gelesen. Wenn leer, werden alle berücksichtigt.
+        validity_window (tuple[date, date] | None): Optional der Gültigkeitszeitraum,
+            standardmäßig die Woche ab Stichtag (siehe get_validity_window).
+        store (OfferStore | None): Der Angebotsspeicher dieses Durchlaufs (siehe offer_store.get_offer_store),
+            standardmäßig der aktuelle Stand
+        context_format (str): Kodierung der Angebote (siehe context_format.py)
+        with_ids (bool): Ob jedes Angebot mit seiner ID aufgeführt wird (Ausgabemodus "ids")
     
     Returns:
         str: Formatierter Text mit allen Produktinformationen
     """
-    df = load_csv_data()
+    store = store if store is not None else offer_store.get_offer_store()
+    window_start, window_end = validity_window or get_validity_window(store=store)
+    
+    # Der vollständige Kontext hängt nur von Datenstand, Marktauswahl, Zeitraum und Format ab
+    cache_key = ("alle", store.version, tuple(sorted(selected_markets or ())), (window_start, window_end), context_format, with_ids)
+    cache = get_retrieval_cache().contexts
+    context = cache.get(cache_key)
+    if context is not None:
+        return context
+    
+    df = store.frame(selected_markets, store.valid_rows(window_start, window_end))
     if df.empty:
         return "Keine Produktdaten verfügbar."
     
     # Filtere Produkte mit Preis 0.0 oder leeren Preisen heraus
     df = df[df['Preis_EUR'] != 0.0]
     
-    context = "Aktuelle Aldi und Lidl Angebote:\n\n"
-    for _, row in df.iterrows():
-        # Zugriff auf die deutschen Spaltenbezeichnungen
-        produkt = row.get('Produktname', 'N/A')
-        kategorie = row.get('Kategorie', 'N/A')
-        unterkategorie = row.get('Unterkategorie', 'N/A')
-        preis = row.get('Preis_EUR', 'N/A')
-        start_datum = row.get('Startdatum', 'N/A')
-        end_datum = row.get('Enddatum', 'N/A')
-        supermarkt = row.get('Supermarkt', 'N/A')
-        
-        # Format angepasst, um einfacher in das gewünschte Ausgabeformat umgewandelt werden zu können
-        product_info = (
-            f"Produkt: {produkt}\n"
-            f"Kategorie: {kategorie}\n"
-            f"Unterkategorie: {unterkategorie}\n"
-            f"Preis: {preis}\n"
-            f"Startdatum: {start_datum}\n"
-            f"Enddatum: {end_datum}\n"
-            f"Supermarkt: {supermarkt}\n\n"
-        )
-        
-        context += product_info
-    
+    context = f"Aktuelle Aldi und Lidl Angebote (gültig zwischen {window_start:%d.%m.%Y} und {window_end:%d.%m.%Y}):\n\n"
+    if context_format == CONTEXT_FORMAT_COMPACT:
+        context += format_compact_offers(df, with_ids=with_ids)
+    else:
+        context += format_labelled_offers(df, with_ids)
+    cache.put(cache_key, context)
     return context
 
-def get_filtered_products_context(user_query: str, selected_markets: list[str]):
+def find_offers(user_query: str, selected_markets: list[str], validity_window: tuple[date, date], expand: bool = True,
+                store=None) -> pd.DataFrame | None:
     """
-    Filtert die Produktdaten basierend auf der Benutzeranfrage und den ausgewählten Supermärkten
-    und erstellt einen optimierten Kontext.
+    Sucht die zu einer Benutzeranfrage passenden Angebote im indizierten Angebotsspeicher.
     
-    Die Funktion analysiert die Benutzeranfrage semantisch, um relevante Produkte zu identifizieren,
-    und erstellt einen optimierten Kontext für die KI. Sie berücksichtigt dabei:
-    - Semantische Gruppen von Produkten (z.B. "Nudeln" umfasst verschiedene Pasta-Arten)
-    - Spezifische Supermarkt-Filter
-    - Kategorie-basierte Filter
+    Gesucht wird mit den normalisierten Suchbegriffen der Anfrage, ihren semantischen
+    Erweiterungen aus der Taxonomie und als letzter Rückfall mit den Katalogkategorien.
     
     Args:
-        user_query (str): Die Anfrage des Benutzers
-        selected_markets (list[str]): Eine Liste der ausgewählten Supermärkte. Wenn leer, werden alle berücksichtigt.
-        
+        user_query (str): Die Anfrage des Benutzers (oder nur der Produktteil daraus)
+        selected_markets (list[str]): Die ausgewählten Supermärkte. Wenn leer, werden alle berücksichtigt.
+        validity_window (tuple[date, date]): Der Gültigkeitszeitraum (siehe get_validity_window)
+        expand (bool): Ob zuerst mit den semantischen Erweiterungen gesucht wird. Bei False
+            werden die Erweiterungen erst verwendet, wenn die Suchbegriffe selbst nichts finden.
+        store (OfferStore | None): Der Angebotsspeicher dieses Durchlaufs (siehe offer_store.get_offer_store),
+            standardmäßig der aktuelle Stand
+    
     Returns:
-        str: Optimierter Kontext mit gefilterten Produktinformationen
+        DataFrame | None: Die passenden Angebote (ggf. leer) oder None, wenn die Anfrage
+                          keine Suchbegriffe enthält
     """
-    df = load_csv_data()
-    if df.empty:
-        return "Keine Produktdaten verfügbar."
+    store = store if store is not None else offer_store.get_offer_store()
+    found = _find_offer_rows(user_query, selected_markets, validity_window, expand, store)
+    if found is None:
+        return None
+    return _offers_frame(store, found[1])
+
+def _offers_frame(store, rows) -> pd.DataFrame:
+    filtered_df = store.rows_to_frame(rows)
     
     # Filtere Produkte mit Preis 0.0 oder leeren Preisen heraus
-    df = df[df['Preis_EUR'] != 0.0]
+    return filtered_df[filtered_df['Preis_EUR'] != 0.0]
+
+def _find_offer_rows(user_query: str, selected_markets: list[str], validity_window: tuple[date, date], expand: bool,
+                     store) -> tuple[tuple, frozenset] | None:
+    """
+    Sucht die Zeilen zu einer Anfrage (siehe find_offers).
     
-    # Wichtige Produktkategorien für semantische Erweiterungen
-    semantic_groups = {
-        "nudeln": ["pasta", "nudel", "tortelloni", "farfalle", "spaghetti", "penne", "fusilli", "lasagne"],
-        "getränke": ["wasser", "saft", "limo", "limonade", "cola", "bier", "wein", "schnaps", "alkohol", "mineralwasser", "eistee"],
-        "obst": ["apfel", "banane", "orange", "birne", "trauben", "beeren", "früchte"],
-        "gemüse": ["salat", "gurke", "tomate", "kartoffel", "möhre", "paprika", "zwiebel", "karotte", "zucchini"],
-        "fleisch": ["rind", "schwein", "hähnchen", "hühnchen", "pute", "lamm", "wurst"],
-        "süßigkeiten": ["schoko", "schokolade", "bonbon", "keks", "kuchen", "süßware", "gebäck", "riegel"],
-        "milchprodukte": ["käse", "joghurt", "quark", "sahne", "milch", "butter"]
-    }
-    
-    # Liste der möglichen Kategorien - nur für grundlegendste Filterung
-    kategorie_mapping = {
-        "getränke": "Getränke",
-        "lebensmittel": "Lebensmittel",
-        "drogerie": "Drogerie",
-        "haushalt": "Haushalt",
-        "kleidung": "Kleidung",
-        "garten": ["Garten/Pflanzen", "Garten", "Pflanzen"]
-    }
+    Das Ergebnis hängt nur von der erweiterten Begriffsmenge (bei expand=False auch von den
+    ursprünglichen Begriffen), dem Kategorie-Fallback, der Marktauswahl, dem Zeitraum und dem
+    Datenstand ab. Mit diesem Schlüssel wird es im LRU-Speicher abgelegt, sodass verschieden
+    formulierte Anfragen mit gleicher Begriffsmenge ohne erneute Suche beantwortet werden.
     
+    Returns:
+        tuple[tuple, frozenset] | None: Suchschlüssel und gefundene Zeilen oder None, wenn die
+                                        Anfrage keine Suchbegriffe enthält
+    """
     # Normalisiere den Suchbegriff
     user_query_lower = user_query.lower()
     
-    # Extrahiere alle Wörter mit mindestens 3 Zeichen als potenzielle Suchbegriffe
-    query_words = [word for word in re.findall(r'\b\w+\b', user_query_lower) if len(word) >= 3]
+    # Extrahiere die Suchbegriffe (mind. 3 Zeichen, ohne Füllwörter) als normalisierte Wortstämme,
+    # damit z.B. "Äpfel", "Aepfel" und "Tafeläpfel" bzw. "Würste" und "Wurst" zueinander passen
+    # Supermarktnamen ("bei Aldi") sind keine Produktbegriffe und werden nicht gesucht
+    search_terms = set(query_terms(user_query)) - {normalize_phrase(market) for market in store.partitions}
     
-    # Erstelle eine Liste aller möglichen Suchbegriffe
-    search_terms = set(query_words)
-    
-    # Erweitere Suchbegriffe mit semantisch ähnlichen Begriffen
-    expanded_search_terms = set(search_terms)
-    
-    # Prüfe für jeden Begriff in der Anfrage, ob er in einer semantischen Gruppe ist
-    for word in search_terms:
-        for category, related_terms in semantic_groups.items():
-            # Wenn der Begriff in den verwandten Begriffen ist oder der Kategorienname selbst
-            if word in related_terms or word == category:
-                # Füge die Kategorie und alle verwandten Begriffe hinzu
-                expanded_search_terms.add(category)
-                expanded_search_terms.update(related_terms)
-                break
+    # Erweitere Suchbegriffe mit semantisch ähnlichen Begriffen aus der vorberechneten Taxonomie
+    expanded_search_terms = taxonomy.expand_terms(search_terms)
+    if not expanded_search_terms:
+        return None
     
     # Kategorie aus Anfrage extrahieren (wird nur als Fallback verwendet)
     kategorie_filter = None
-    for key, value in kategorie_mapping.items():
+    for key, value in taxonomy.get_category_fallbacks().items():
         if key in user_query_lower:
             kategorie_filter = value
             break
     
-    # Wir versuchen eine breitere Suche mit den erweiterten Begriffen
-    if expanded_search_terms:
-        # Initialisiere leere Maske
-        mask = pd.Series(False, index=df.index)
-        
-        # Erweitere die Maske mit jedem Suchbegriff
-        for term in expanded_search_terms:
-            # Suche in Produktnamen, Kategorie und Unterkategorie
-            name_mask = df['Produktname'].str.contains(term, case=False, na=False)
-            kat_mask = df['Kategorie'].str.contains(term, case=False, na=False)
-            unterkat_mask = df['Unterkategorie'].str.contains(term, case=False, na=False)
-            
-            # Kombiniere die Masken mit OR
-            mask = mask | name_mask | kat_mask | unterkat_mask
-        
-        filtered_df = df[mask]
-        
-        # Wenn nichts gefunden wurde, versuchen wir es mit nur den originalen Suchbegriffen
-        if filtered_df.empty:
-            mask = pd.Series(False, index=df.index)
-            for term in search_terms:
-                name_mask = df['Produktname'].str.contains(term, case=False, na=False)
-                kat_mask = df['Kategorie'].str.contains(term, case=False, na=False)
-                unterkat_mask = df['Unterkategorie'].str.contains(term, case=False, na=False)
-                mask = mask | name_mask | kat_mask | unterkat_mask
-            filtered_df = df[mask]
-        
-        # Wenn immer noch nichts gefunden wurde, versuchen wir es mit einer lediglich nach Kategorie gefilterten Ansicht
-        if filtered_df.empty and kategorie_filter:
-            # Nach Kategorie filtern
-            if isinstance(kategorie_filter, list):
-                mask = pd.Series(False, index=df.index)
-                for kat in kategorie_filter:
-                    kat_mask = df['Kategorie'].str.contains(kat, case=False, na=False)
-                    unterkat_mask = df['Unterkategorie'].str.contains(kat, case=False, na=False)
-                    mask = mask | kat_mask | unterkat_mask
-                filtered_df = df[mask]
-            else:
-                kat_mask = df['Kategorie'].str.contains(kategorie_filter, case=False, na=False)
-                unterkat_mask = df['Unterkategorie'].str.contains(kategorie_filter, case=False, na=False)
-                filtered_df = df[kat_mask | unterkat_mask]
+    # Die erweiterten Begriffe enthalten die ursprünglichen; bei expand=True entscheiden daher nur sie
+    cache_key = (
+        store.version,
+        tuple(sorted(expanded_search_terms)),
+        None if expand else tuple(sorted(search_terms)),
+        tuple(kategorie_filter or ()),
+        tuple(sorted(selected_markets or ())),
+        tuple(day.isoformat() for day in validity_window),
+    )
+    retrieval_cache = get_retrieval_cache()
+    _warm_retrieval_cache(store, retrieval_cache)
+    cache = retrieval_cache.rows
+    rows = cache.get(cache_key)
+    if rows is not None:
+        return cache_key, rows
+    
+    # Danach im persistenten Cache nachsehen (dort ist der Datenstand über den Fingerabdruck bestimmt)
+    disk = disk_cache.get_disk_cache()
+    if disk is not None:
+        fingerprint = disk_cache.data_fingerprint(store)
+        disk_key = disk_cache.encode_key(cache_key[1:])
+        stored = disk.get(disk_cache.KIND_ROWS, fingerprint, disk_key)
+        if stored is not None:
+            rows = frozenset(json.loads(stored))
+            cache.put(cache_key, rows)
+            return cache_key, rows
+    
+    # Abgelaufene und noch nicht gültige Angebote werden vorab über den Gültigkeitsindex ausgeschlossen
+    valid_rows = store.valid_rows(*validity_window)
+    
+    # Wir versuchen eine breitere Suche mit den erweiterten Begriffen, wenn nichts gefunden wurde
+    # mit nur den originalen Suchbegriffen (bzw. bei expand=False in umgekehrter Reihenfolge).
+    # Durchsucht werden nur die Partitionen der ausgewählten Supermärkte (bei leerer Auswahl alle).
+    term_sets = [expanded_search_terms, search_terms] if expand else [search_terms, expanded_search_terms]
+    rows = set()
+    for terms in term_sets:
+        # Suche in Produktnamen, Kategorie und Unterkategorie über den vorberechneten Index
+        rows = store.find_rows(terms, selected_markets, valid_rows)
+        if rows:
+            break
+    
+    # Wenn immer noch nichts gefunden wurde, versuchen wir es mit einer lediglich nach Kategorie gefilterten Ansicht
+    if not rows and kategorie_filter:
+        rows = store.find_rows({normalize_phrase(kat) for kat in kategorie_filter}, selected_markets, valid_rows)
+    
+    rows = frozenset(rows)
+    cache.put(cache_key, rows)
+    if disk is not None:
+        disk.put(disk_cache.KIND_ROWS, fingerprint, disk_key, json.dumps(sorted(int(row) for row in rows)))
+    return cache_key, rows
+
+def _warm_retrieval_cache(store, retrieval_cache) -> None:
+    """
+    Lädt beim ersten Zugriff auf einen Datenstand die zuletzt genutzten Suchergebnisse
+    dieses Datenstands aus dem persistenten Cache in den Arbeitsspeicher.
+    """
+    if store.version in retrieval_cache.warmed_versions:
+        return
+    retrieval_cache.warmed_versions.add(store.version)
+    disk = disk_cache.get_disk_cache()
+    if disk is None or store.empty:
+        return
+    entries = disk.recent(disk_cache.KIND_ROWS, disk_cache.data_fingerprint(store), disk_cache.DISK_CACHE_WARM_ENTRIES)
+    # Älteste zuerst einfügen, damit die zuletzt genutzten im LRU-Speicher am längsten bleiben
+    for key, value in reversed(entries):
+        retrieval_cache.rows.put((store.version,) + disk_cache.decode_key(key), frozenset(json.loads(value)))
+
+def count_context_offers(user_query: str, selected_markets: list[str], store=None) -> int | None:
+    """
+    Schätzt, wie viele Angebote get_filtered_products_context() für eine Anfrage in den Kontext aufnimmt.
+    
+    Nutzt dieselbe (zwischengespeicherte) Suche und ist daher nach der ersten Suche praktisch kostenlos.
+    
+    Args:
+        user_query (str): Die Anfrage des Benutzers
+        selected_markets (list[str]): Die ausgewählten Supermärkte
+        store (OfferStore | None): Der Angebotsspeicher dieses Durchlaufs, standardmäßig der aktuelle Stand
+    
+    Returns:
+        int | None: Die Anzahl der Angebote oder None, wenn der vollständige Katalog in den Kontext geht
+    """
+    store = store if store is not None else offer_store.get_offer_store()
+    if store.empty:
+        return 0
+    found = _find_offer_rows(user_query, selected_markets, get_validity_window(user_query, store), True, store)
+    if found is None or (not found[1] and not selected_markets):
+        return None
+    count = len(found[1])
+    if any(word in user_query.lower() for word in CHEAPEST_QUERY_WORDS):
+        count = min(count, CHEAPEST_CONTEXT_LIMIT)
+    return count
+
+def get_filtered_products_context(user_query: str, selected_markets: list[str], store=None,
+                                  context_format: str = DEFAULT_CONTEXT_FORMAT, with_ids: bool = False):
+    """
+    Filtert die Produktdaten basierend auf der Benutzeranfrage und den ausgewählten Supermärkten
+    und erstellt einen optimierten Kontext.
+    
+    Die Funktion analysiert die Benutzeranfrage semantisch, um relevante Produkte zu identifizieren,
+    und erstellt einen optimierten Kontext für die KI. Sie berücksichtigt dabei:
+    - Semantische Gruppen von Produkten (z.B. "Nudeln" umfasst verschiedene Pasta-Arten),
+      vorberechnet aus `data/Taxonomie.csv` und den Katalogkategorien (siehe taxonomy.py)
+    - Spezifische Supermarkt-Filter (es werden nur die Partitionen der ausgewählten Märkte durchsucht)
+    - Kategorie-basierte Filter
+    - Den Gültigkeitszeitraum (nur Angebote, die heute bzw. in dieser Woche gültig sind)
+    - Anfragen nach dem günstigsten Angebot (Vorsortierung nach Grundpreis)
+    
+    Args:
+        user_query (str): Die Anfrage des Benutzers
+        selected_markets (list[str]): Eine Liste der ausgewählten Supermärkte. Wenn leer, werden alle berücksichtigt.
+        store (OfferStore | None): Der Angebotsspeicher dieses Durchlaufs (siehe offer_store.get_offer_store),
+            standardmäßig der aktuelle Stand
+        context_format (str): Kodierung der Angebote (siehe context_format.py)
+        with_ids (bool): Ob jedes Angebot mit seiner ID aufgeführt wird (Ausgabemodus "ids")
         
-        # Wenn immer noch nichts gefunden wurde, geben wir den vollständigen Kontext zurück
-        if filtered_df.empty:
-            return get_products_context()
-            
-        # NEU: Nach ausgewählten Supermärkten filtern, wenn welche ausgewählt wurden
-        if selected_markets: # Prüft, ob die Liste nicht leer ist
-            filtered_df = filtered_df[filtered_df['Supermarkt'].isin(selected_markets)]
-            
-            # Wenn nach dem Filtern keine Produkte mehr übrig sind, geben wir einen Hinweis zurück,
-            # anstatt den gesamten Kontext.
-            if filtered_df.empty:
-                return f"Keine Produkte in den ausgewählten Supermärkten ({', '.join(selected_markets)}) gefunden, die zur Anfrage '{user_query}' passen."
-    
-    # Alle Produkte einbeziehen, wenn keine spezifische Kategorie oder Produkt erwähnt wird
-    else:
-        # Vollständigen Kontext zurückgeben
-        return get_products_context()
+    Returns:
+        str: Optimierter Kontext mit gefilterten Produktinformationen
+    """
+    store = store if store is not None else offer_store.get_offer_store()
+    if store.empty:
+        return "Keine Produktdaten verfügbar."
     
-    # Wenn keine passenden Produkte gefunden wurden, alle Produkte zurückgeben
-    if filtered_df.empty:
-        return get_products_context()
+    # Abgelaufene und noch nicht gültige Angebote werden vorab über den Gültigkeitsindex ausgeschlossen
+    validity_window = get_validity_window(user_query, store)
+    found = _find_offer_rows(user_query, selected_markets, validity_window, True, store)
+    
+    # Alle Produkte (der ausgewählten Supermärkte) einbeziehen, wenn keine spezifische Kategorie oder Produkt erwähnt wird
+    if found is None:
+        return get_products_context(selected_markets, validity_window, store, context_format, with_ids)
+    rows_key, rows = found
+    
+    # Bei Fragen nach dem günstigsten Angebot reicht eine kleine, nach Grundpreis sortierte Auswahl
+    cheapest_query = any(word in user_query.lower() for word in CHEAPEST_QUERY_WORDS)
     
     # Kontext erstellen mit Suchbegriffen und Hinweisen für die KI
-    context = f"Gefilterte Angebote basierend auf der Anfrage '{user_query}':\n\n"
+    header = f"Gefilterte Angebote basierend auf der Anfrage '{user_query}' (gültig zwischen {validity_window[0]:%d.%m.%Y} und {validity_window[1]:%d.%m.%Y}):\n\n"
     
+    # Alles nach der Kopfzeile hängt nur von den gefundenen Zeilen ab und wird wiederverwendet
+    cache_key = ("gefiltert", rows_key, cheapest_query, context_format, with_ids)
+    cache = get_retrieval_cache().contexts
+    body = cache.get(cache_key)
+    if body is not None:
+        return header + body
+    
+    filtered_df = _offers_frame(store, rows)
+    if filtered_df.empty:
+        # Bei ausgewählten Supermärkten geben wir einen Hinweis zurück, anstatt den gesamten Kontext.
+        if selected_markets:
+            return f"Keine Produkte in den ausgewählten Supermärkten ({', '.join(selected_markets)}) gefunden, die zur Anfrage '{user_query}' passen."
+        # Ohne Marktauswahl geben wir den vollständigen Kontext zurück
+        return get_products_context(validity_window=validity_window, store=store, context_format=context_format, with_ids=with_ids)
+    
+    if cheapest_query:
+        filtered_df = rank_by_unit_price(filtered_df, CHEAPEST_CONTEXT_LIMIT)
+    
+    body = _filtered_context_body(filtered_df, cheapest_query, context_format, with_ids)
+    cache.put(cache_key, body)
+    return header + body
+
+def _filtered_context_body(filtered_df: pd.DataFrame, cheapest_query: bool, context_format: str, with_ids: bool) -> str:
+    """
+    Erstellt den Teil des gefilterten Kontexts nach der Kopfzeile (Hinweise und Angebote).
+    """
+    # Im kompakten Format genügt ein kurzer Hinweis zur semantischen Verarbeitung
+    if context_format == CONTEXT_FORMAT_COMPACT:
+        context = "Beachte semantische Beziehungen (z.B. Pasta, Tortelloni und Spaghetti sind Nudeln), unabhängig von Marke und Kategorie.\n"
+        if cheapest_query:
+            context += "Die Produkte sind bereits nach Grundpreis sortiert, das erste Produkt ist das günstigste.\n"
+        return context + "\n" + format_compact_offers(filtered_df, ordered=cheapest_query, with_ids=with_ids)
+
     # Hinzufügen von hilfreichen Informationen für die KI zur semantischen Verarbeitung
-    context += "WICHTIG FÜR SEMANTISCHE INTERPRETATION: Berücksichtige, dass die folgenden Produkte für die Anfrage relevant sein könnten, auch wenn sie nicht exakt dem Suchbegriff entsprechen. Denke über mögliche semantische Beziehungen nach, wie z.B.:\n"
+    context = "WICHTIG FÜR SEMANTISCHE INTERPRETATION: Berücksichtige, dass die folgenden Produkte für die Anfrage relevant sein könnten, auch wenn sie nicht exakt dem Suchbegriff entsprechen. Denke über mögliche semantische Beziehungen nach, wie z.B.:\n"
     context += "- 'Nudeln' umfasst auch Pasta, Tortelloni, Farfalle, Spaghetti, Penne usw. - jegliche Art von Pasta ist eine Form von Nudeln.\n"
     context += "- 'Getränke' umfasst Wasser, Saft, Limonade, Cola, Bier, Wein, etc.\n"
     context += "- 'Süßigkeiten' umfasst Schokolade, Kekse, Fruchtgummi, etc.\n"
     context += "- 'Fleisch' umfasst verschiedene Fleischsorten wie Rind, Schwein, Geflügel, etc.\n"
     context += "- 'Bio-Pasta' und ähnliche Produkte sind definitiv Nudeln, auch wenn sie unter einer speziellen Marke (wie GUT BIO) verkauft werden.\n\n"
     context += "Verwende dein Wissen über Lebensmittelkategorien, um relevante Produkte zu identifizieren, auch wenn sie nicht exakt mit dem Suchbegriff übereinstimmen. Schau über Marken und Unterkategorien hinweg und konzentriere dich auf das eigentliche Produkt.\n\n"
+    if cheapest_query:
+        context += "Die Produkte sind bereits nach Grundpreis sortiert, das erste Produkt ist das günstigste.\n\n"
     context += "HIER SIND DIE PRODUKTE:\n\n"
     
-    for _, row in filtered_df.iterrows():
-        produkt = row.get('Produktname', 'N/A')
-        kategorie = row.get('Kategorie', 'N/A')
-        unterkategorie = row.get('Unterkategorie', 'N/A')
-        preis = row.get('Preis_EUR', 'N/A')
-        start_datum = row.get('Startdatum', 'N/A')
-        end_datum = row.get('Enddatum', 'N/A')
-        supermarkt = row.get('Supermarkt', 'N/A')
-        
-        product_info = (
-            f"Produkt: {produkt}\n"
-            f"Kategorie: {kategorie}\n"
-            f"Unterkategorie: {unterkategorie}\n"
-            f"Preis: {preis}\n"
-            f"Startdatum: {start_datum}\n"
-            f"Enddatum: {end_datum}\n"
-            f"Supermarkt: {supermarkt}\n\n"
-        )
-        
-        context += product_info
+    context += format_labelled_offers(filtered_df, with_ids)
     
-    return context 
\ No newline at end of file
+    return context
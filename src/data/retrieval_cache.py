@@ -0,0 +1,125 @@
+"""
+Zwischenspeicher für Suchergebnisse und fertige Kontexte.
+
+Unterschiedlich formulierte Anfragen ("Nudeln bei Aldi", "welche nudeln gibt es",
+"Pasta Angebote") ergeben oft dieselbe erweiterte Begriffsmenge. Dieses Modul merkt
+sich je Begriffsmenge, Marktauswahl, Gültigkeitszeitraum und Datenstand die gefundenen
+Zeilen sowie den daraus erzeugten Kontexttext. Beide Speicher sind in der Größe
+begrenzt und verdrängen den am längsten nicht genutzten Eintrag (LRU). Trefferquoten
+liefert RetrievalCache.stats().
+"""
+import os
+import threading
+import streamlit as st
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+# Maximale Anzahl gespeicherter Suchergebnisse (Zeilenmengen)
+RETRIEVAL_CACHE_SIZE = int(os.getenv("SPARFUCHS_RETRIEVAL_CACHE_SIZE", "1024"))
+
+# Maximale Anzahl gespeicherter Kontexttexte (deutlich größer je Eintrag)
+CONTEXT_CACHE_SIZE = int(os.getenv("SPARFUCHS_CONTEXT_CACHE_SIZE", "256"))
+
+@dataclass
+class CacheStats:
+    """
+    Kennzahlen eines LRU-Speichers.
+
+    Attributes:
+        size (int): Aktuelle Anzahl Einträge
+        max_size (int): Maximale Anzahl Einträge
+        hits (int): Treffer
+        misses (int): Fehlschläge
+        evictions (int): Verdrängte Einträge
+    """
+    size: int = 0
+    max_size: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Anteil der Treffer an allen Abfragen (0.0, solange nichts abgefragt wurde).
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+class LRUCache:
+    """
+    Threadsicherer, in der Größe begrenzter Speicher mit Verdrängung des am längsten nicht genutzten Eintrags.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max(max_size, 0)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats(max_size=self.max_size)
+
+    def get(self, key):
+        """
+        Liefert den Eintrag zu key oder None und zählt Treffer bzw. Fehlschlag.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        """
+        Speichert einen Eintrag und verdrängt bei Bedarf den am längsten nicht genutzten.
+        """
+        if self.max_size == 0 or value is None:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> CacheStats:
+        """
+        Liefert eine Kopie der aktuellen Kennzahlen.
+        """
+        with self._lock:
+            return CacheStats(**{**vars(self._stats), "size": len(self._entries)})
+
+@dataclass
+class RetrievalCache:
+    """
+    Die prozessweiten Speicher für Suchergebnisse und Kontexttexte.
+
+    Die Schlüssel enthalten die Version des Angebotsspeichers (OfferStore.version), sodass
+    Einträge eines älteren Datenstands nie mehr getroffen und nach und nach verdrängt werden.
+
+    Attributes:
+        rows (LRUCache): Suchschlüssel -> gefundene Zeilen (frozenset der Index-Labels)
+        contexts (LRUCache): Kontextschlüssel -> fertiger Kontexttext
+        warmed_versions (set): Datenstände, für die schon Suchergebnisse aus dem persistenten Cache geladen wurden
+    """
+    rows: LRUCache
+    contexts: LRUCache
+    warmed_versions: set = field(default_factory=set)
+
+    def stats(self) -> dict:
+        """
+        Liefert die Kennzahlen beider Speicher ({'rows': CacheStats, 'contexts': CacheStats}).
+        """
+        return {"rows": self.rows.stats(), "contexts": self.contexts.stats()}
+
+@st.cache_resource
+def get_retrieval_cache() -> RetrievalCache:
+    """
+    Liefert die prozessweit geteilten Speicher für Suchergebnisse und Kontexte.
+    """
+    return RetrievalCache(rows=LRUCache(RETRIEVAL_CACHE_SIZE), contexts=LRUCache(CONTEXT_CACHE_SIZE))
@@ -0,0 +1,220 @@
+"""
+Invertierter Suchindex über den Angebotskatalog.
+
+Dieses Modul baut einen Index Wortstamm -> Angebotszeilen auf.
+Produktname, Kategorie und Unterkategorie werden dabei mit derselben Normalisierung
+wie die Benutzeranfrage verarbeitet (siehe utils/text_normalization.py), inklusive
+Zerlegung von Komposita. Die Suche besteht damit aus Tabellenzugriffen statt aus
+Teilstring-Vergleichen über alle Zeilen.
+"""
+import pandas as pd
+from bisect import bisect_left
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from ..utils.text_normalization import tokenize, stem_token, split_compound
+
+# Spalten, die in den Index aufgenommen werden
+INDEXED_COLUMNS = ['Produktname', 'Kategorie', 'Unterkategorie']
+
+# Ab dieser Länge wird ein Suchstamm zusätzlich als Präfix gesucht ('schoko' -> 'schokolad')
+MIN_PREFIX_LENGTH = 4
+
+# Grundwörter eines Kompositums müssen so lang sein, außer sie stammen aus der Taxonomie ('eis')
+MIN_VOCABULARY_HEAD_LENGTH = 4
+
+@dataclass
+class SearchIndex:
+    """
+    Invertierter Index von Wortstämmen auf Zeilen (Index-Labels) des Angebots-DataFrames.
+
+    Attributes:
+        postings (dict[str, frozenset]): Wortstamm -> Menge der Zeilen, in denen er vorkommt
+        vocabulary (list[str]): Sortierte Liste aller Wortstämme für die Präfixsuche
+        head_vocabulary (frozenset): Bekannte Grundwort-Stämme für die Zerlegung von Suchbegriffen
+    """
+    postings: dict = field(default_factory=dict)
+    vocabulary: list = field(default_factory=list)
+    head_vocabulary: frozenset = frozenset()
+
+    def lookup_stem(self, stem: str) -> set:
+        """
+        Liefert alle Zeilen zu einem Wortstamm, bei längeren Stämmen inklusive Präfixtreffern.
+        """
+        rows = set(self.postings.get(stem, ()))
+        if len(stem) >= MIN_PREFIX_LENGTH:
+            position = bisect_left(self.vocabulary, stem)
+            while position < len(self.vocabulary) and self.vocabulary[position].startswith(stem):
+                rows.update(self.postings[self.vocabulary[position]])
+                position += 1
+        return rows
+
+    def lookup_phrase(self, phrase: str) -> set:
+        """
+        Liefert die Zeilen, die alle Wortstämme eines normalisierten Begriffs enthalten.
+        """
+        stems = phrase.split()
+        if not stems:
+            return set()
+        rows = self.lookup_stem(stems[0])
+        for stem in stems[1:]:
+            if not rows:
+                break
+            rows &= self.lookup_stem(stem)
+        return rows
+
+    def search(self, phrases) -> set:
+        """
+        Liefert die Vereinigung der Treffer aller normalisierten Begriffe.
+        """
+        rows = set()
+        for phrase in phrases:
+            rows |= self.lookup_phrase(phrase)
+        return rows
+
+    def decompose(self, stem: str) -> list[str]:
+        """
+        Zerlegt einen unbekannten Suchstamm anhand des Katalogwortschatzes ('tafelapfel' -> 'tafel', 'apfel').
+        """
+        return split_compound(stem, self.head_vocabulary or self.postings)
+
+def _row_tokens(df: pd.DataFrame) -> dict:
+    """
+    Zerlegt die indizierten Spalten jeder Zeile in gefaltete Wörter (Index-Label -> Wortmenge).
+    """
+    columns = [column for column in INDEXED_COLUMNS if column in df.columns]
+    row_tokens: dict = {}
+    for row_id, *values in df[columns].itertuples():
+        tokens = set()
+        for value in values:
+            tokens.update(tokenize(value))
+        row_tokens[row_id] = tokens
+    return row_tokens
+
+def build_head_vocabulary(df: pd.DataFrame, extra_vocabulary=()) -> set:
+    """
+    Sammelt die Wortstämme, die als Grundwort eines Kompositums erkannt werden.
+
+    Args:
+        df (DataFrame): Die Angebotsdaten (in der Regel der gesamte Katalog)
+        extra_vocabulary: Zusätzliche normalisierte Begriffe (z.B. aus der Taxonomie)
+
+    Returns:
+        set: Die bekannten Grundwort-Stämme
+    """
+    head_vocabulary = {
+        stem_token(token)
+        for tokens in _row_tokens(df).values()
+        for token in tokens
+        if len(token) >= MIN_VOCABULARY_HEAD_LENGTH and not token.isdigit()
+    }
+    head_vocabulary.update(term for term in extra_vocabulary if " " not in term)
+    return head_vocabulary
+
+def build_search_index(df: pd.DataFrame, head_vocabulary) -> SearchIndex:
+    """
+    Baut den invertierten Index über die Angebotsdaten auf.
+
+    Jedes Wort wird gefaltet und gestemmt. Komposita werden zusätzlich in ihre
+    Bestandteile zerlegt, sofern das Grundwort im Wortschatz vorkommt
+    ('Tafeläpfel' ist danach auch unter 'apfel' auffindbar).
+
+    Args:
+        df (DataFrame): Die zu indizierenden Angebotsdaten
+        head_vocabulary: Bekannte Grundwort-Stämme (siehe build_head_vocabulary)
+
+    Returns:
+        SearchIndex: Der aufgebaute Index
+    """
+    if df.empty:
+        return SearchIndex()
+
+    postings: dict = defaultdict(set)
+    for row_id, tokens in _row_tokens(df).items():
+        for token in tokens:
+            postings[stem_token(token)].add(row_id)
+            if not token.isdigit():
+                for part in split_compound(token, head_vocabulary):
+                    postings[part].add(row_id)
+
+    frozen_postings = {stem: frozenset(rows) for stem, rows in postings.items()}
+    return SearchIndex(
+        postings=frozen_postings,
+        vocabulary=sorted(frozen_postings),
+        head_vocabulary=frozenset(head_vocabulary)
+    )
+
+def update_search_index(index: SearchIndex, removed_rows, added_df: pd.DataFrame, head_vocabulary=None) -> SearchIndex:
+    """
+    Aktualisiert einen Index um entfernte und hinzugekommene Zeilen, ohne ihn neu aufzubauen.
+
+    Nur die Wortstämme der betroffenen Zeilen werden neu berechnet; alle übrigen
+    Einträge werden aus dem bisherigen Index übernommen. Geänderte Zeilen werden
+    als entfernt und neu hinzugekommen übergeben.
+
+    Args:
+        index (SearchIndex): Der bisherige Index
+        removed_rows: Index-Labels der zu entfernenden Zeilen
+        added_df (DataFrame): Die hinzuzufügenden Zeilen
+        head_vocabulary: Grundwort-Stämme für die Zerlegung (Standard: die des bisherigen Index)
+
+    Returns:
+        SearchIndex: Der aktualisierte Index
+    """
+    head_vocabulary = frozenset(head_vocabulary if head_vocabulary is not None else index.head_vocabulary)
+    postings = dict(index.postings)
+
+    removed_rows = frozenset(removed_rows)
+    if removed_rows:
+        # Über die Postings statt über die Wortstämme der alten Zeilen, da sich die Zerlegung
+        # mit einem gewachsenen Grundwort-Wortschatz ändern kann
+        for stem, rows in index.postings.items():
+            if not rows.isdisjoint(removed_rows):
+                remaining = rows - removed_rows
+                if remaining:
+                    postings[stem] = remaining
+                else:
+                    del postings[stem]
+
+    if not added_df.empty:
+        added: dict = defaultdict(set)
+        for row_id, tokens in _row_tokens(added_df).items():
+            for token in tokens:
+                added[stem_token(token)].add(row_id)
+                if not token.isdigit():
+                    for part in split_compound(token, head_vocabulary):
+                        added[part].add(row_id)
+        for stem, rows in added.items():
+            postings[stem] = frozenset(postings.get(stem, frozenset()) | rows)
+
+    vocabulary = index.vocabulary if postings.keys() == index.postings.keys() else sorted(postings)
+    return SearchIndex(postings=postings, vocabulary=vocabulary, head_vocabulary=head_vocabulary)
+
+def find_matching_rows(indexes, search_terms) -> set:
+    """
+    Sucht die Zeilen zu normalisierten Suchbegriffen einer Anfrage in einem oder mehreren Indizes.
+
+    Begriffe, die in keinem der Indizes direkt vorkommen, werden als Kompositum zerlegt
+    ('hahnchenbrust' -> 'hahnch', 'brust') und über ihre Bestandteile gesucht. Die
+    Entscheidung fällt über alle Indizes gemeinsam, damit z.B. bei nach Supermärkten
+    aufgeteilten Indizes nicht ein Markt zerlegt sucht, während ein anderer direkt trifft.
+
+    Args:
+        indexes: Ein SearchIndex oder eine Liste von SearchIndex-Objekten
+        search_terms: Normalisierte Begriffe (Wortstämme oder mehrteilige Begriffe)
+
+    Returns:
+        set: Die Index-Labels der passenden Zeilen
+    """
+    if isinstance(indexes, SearchIndex):
+        indexes = [indexes]
+    rows = set()
+    for term in search_terms:
+        term_rows = set()
+        for index in indexes:
+            term_rows |= index.lookup_phrase(term)
+        if not term_rows and " " not in term:
+            for index in indexes:
+                term_rows |= index.search(index.decompose(term))
+        rows |= term_rows
+    return rows
@@ -0,0 +1,558 @@
+"""
+Gemeinsamer, schreibgeschützter Angebotsspeicher für mehrere Worker-Prozesse.
+
+Laufen mehrere Streamlit-Prozesse auf einem Host, hält sonst jeder Prozess eigene
+Kopien des Angebotskatalogs und der daraus berechneten Indizes. Dieses Modul schreibt
+Katalog, Suchindizes, Gültigkeitsindex, Erweiterungstabelle und den Namensindex der
+Halluzinationsprüfung einmalig als spaltenweisen Snapshot (NumPy-Dateien) in ein
+Verzeichnis. Alle Worker binden die Dateien per mmap schreibgeschützt ein, das
+Betriebssystem hält die Seiten nur einmal im Speicher. Zeilen und Einträge werden erst
+beim Zugriff für die jeweilige Anfrage dekodiert; ein neuer Worker muss beim Start
+nichts aus den CSV-Dateien neu berechnen.
+
+Jeder Snapshot trägt eine Generationsnummer. Ein neuer Snapshot wird vollständig in
+ein eigenes Verzeichnis geschrieben und erst danach über die Datei CURRENT atomar
+aktiviert. Worker prüfen die Generation bei jedem Zugriff und wechseln ohne Neustart.
+Vor dem Einbinden einer Generation wird geprüft, ob sie im aktuellen Format
+(SNAPSHOT_FORMAT) und aus den aktuellen Quelldateien (SNAPSHOT_SOURCES) geschrieben
+wurde; ein veralteter Snapshot wird durch eine neue Generation ersetzt.
+
+Aktiviert wird der gemeinsame Speicher über die Umgebungsvariable
+SPARFUCHS_SHARED_STORE_DIR. Einen neuen Snapshot (z.B. nach einem Datenupdate)
+veröffentlicht `python -m src.data.shared_store`.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+import pandas as pd
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+
+from . import product_data, taxonomy
+from ..ai.hallucination import ProductNameIndex, build_name_index
+from .offer_store import OfferStore, MarketPartition, build_offer_store
+from .search_index import SearchIndex
+from .validity_index import ValidityIndex
+
+# Umgebungsvariable mit dem Verzeichnis des gemeinsamen Speichers (leer = jeder Prozess lädt selbst)
+SHARED_STORE_ENV = "SPARFUCHS_SHARED_STORE_DIR"
+
+# Datei mit der aktiven Generationsnummer
+CURRENT_FILE_NAME = "CURRENT"
+
+# Sperrdatei, damit nur ein Prozess gleichzeitig einen Snapshot schreibt
+LOCK_FILE_NAME = "publish.lock"
+LOCK_TIMEOUT_SECONDS = 60
+
+# So viele Generationen bleiben erhalten (Worker können noch die vorherige eingebunden haben)
+KEEP_GENERATIONS = 2
+
+# Formatversion der Snapshot-Dateien (bei Änderungen am Aufbau erhöhen)
+SNAPSHOT_FORMAT = 2
+
+# Dateien, aus denen der Snapshot berechnet wird; ändert sich eine davon, ist er veraltet
+SNAPSHOT_SOURCES = [
+    product_data.CSV_FILE_PATH,
+    taxonomy.TAXONOMY_CSV_FILE_PATH,
+    Path(__file__).parent / "product_data.py",
+    Path(__file__).parent / "search_index.py",
+    Path(__file__).parent / "taxonomy.py",
+    Path(__file__).parent / "validity_index.py",
+    Path(__file__).parents[1] / "ai" / "hallucination.py",
+    Path(__file__).parents[1] / "utils" / "text_normalization.py",
+]
+
+def is_enabled() -> bool:
+    """
+    Prüft, ob der gemeinsame Speicher über SPARFUCHS_SHARED_STORE_DIR aktiviert ist.
+    """
+    return bool(os.getenv(SHARED_STORE_ENV))
+
+def shared_store_dir() -> Path:
+    """
+    Liefert das Verzeichnis des gemeinsamen Speichers.
+    """
+    return Path(os.getenv(SHARED_STORE_ENV, "data/shared_store"))
+
+def source_fingerprint() -> str:
+    """
+    Liefert den Fingerabdruck der Quelldateien in SNAPSHOT_SOURCES.
+    """
+    digest = hashlib.sha256()
+    for source in SNAPSHOT_SOURCES:
+        digest.update(source.read_bytes() if source.exists() else b"")
+    return digest.hexdigest()[:16]
+
+def _generation_dir(directory: Path, generation: int) -> Path:
+    return directory / f"gen-{generation:06d}"
+
+def current_generation(directory: Path) -> int | None:
+    """
+    Liest die aktive Generationsnummer oder None, wenn noch kein Snapshot veröffentlicht wurde.
+    """
+    try:
+        return int((directory / CURRENT_FILE_NAME).read_text(encoding="utf-8").strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+# --- Schreibgeschützte Sichten auf die per mmap eingebundenen Dateien ---
+
+class _StringArray:
+    """
+    Folge von Strings über einem UTF-8-Puffer mit Offsets. Elemente werden erst beim Zugriff dekodiert.
+    """
+    def __init__(self, directory: Path, name: str):
+        self._data = np.load(directory / f"{name}.str.npy", mmap_mode="r")
+        self._offsets = np.load(directory / f"{name}.off.npy", mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        return bytes(self._data[self._offsets[position]:self._offsets[position + 1]]).decode("utf-8")
+
+class _SortedStringArray(_StringArray):
+    """
+    Sortierte Folge von Strings mit binärer Suche (Wortschatz der Suchindizes).
+    """
+    def find(self, value: str) -> int:
+        """
+        Liefert die Position eines Strings oder -1, wenn er nicht enthalten ist.
+        """
+        position = bisect_left(self, value)
+        return position if position < len(self) and self[position] == value else -1
+
+    def __contains__(self, value) -> bool:
+        return self.find(value) >= 0
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+class _RowGroups:
+    """
+    Folge von Zeilenmengen im CSR-Format (Offsets und aneinandergehängte Zeilennummern).
+    """
+    def __init__(self, directory: Path, name: str):
+        self._offsets = np.load(directory / f"{name}.grp.npy", mmap_mode="r")
+        self._rows = np.load(directory / f"{name}.rows.npy", mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def rows(self, position: int) -> list[int]:
+        return self._rows[self._offsets[position]:self._offsets[position + 1]].tolist()
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        return frozenset(self.rows(position))
+
+class _SharedPostings:
+    """
+    Nachschlagetabelle Wortstamm -> Zeilen mit derselben Schnittstelle wie das Dictionary in SearchIndex.
+    """
+    def __init__(self, vocabulary: _SortedStringArray, groups: _RowGroups):
+        self._vocabulary = vocabulary
+        self._groups = groups
+
+    def get(self, stem: str, default=None):
+        position = self._vocabulary.find(stem)
+        return default if position < 0 else self._groups.rows(position)
+
+    def __getitem__(self, stem: str) -> list[int]:
+        rows = self.get(stem)
+        if rows is None:
+            raise KeyError(stem)
+        return rows
+
+    def __contains__(self, stem) -> bool:
+        return stem in self._vocabulary
+
+    def __len__(self) -> int:
+        return len(self._vocabulary)
+
+    def __iter__(self):
+        return iter(self._vocabulary)
+
+class _SharedRowMap(_SharedPostings):
+    """
+    Nachschlagetabelle wie _SharedPostings, deren Werte beim Zugriff mit `convert` umgewandelt
+    werden (z.B. in ein frozenset wie im Namensindex der Halluzinationsprüfung).
+    """
+    def __init__(self, vocabulary: _SortedStringArray, groups: _RowGroups, convert):
+        super().__init__(vocabulary, groups)
+        self._convert = convert
+
+    def get(self, key: str, default=None):
+        rows = super().get(key)
+        return default if rows is None else self._convert(rows)
+
+    def keys(self):
+        return iter(self._vocabulary)
+
+class _DateArray:
+    """
+    Folge von Kalendertagen, gespeichert als Ordinalzahlen.
+    """
+    def __init__(self, values: np.ndarray):
+        self._values = values
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        return date.fromordinal(int(self._values[position]))
+
+class SharedOfferTable:
+    """
+    Spaltenweise gespeicherter Angebotskatalog. Zeilennummern entsprechen den Index-Labels.
+    """
+    def __init__(self, directory: Path, columns: list):
+        self.columns = [name for name, _ in columns]
+        self._values = {}
+        self._missing = {}
+        for position, (name, kind) in enumerate(columns):
+            if kind == "str":
+                self._values[name] = _StringArray(directory, f"col{position}")
+                self._missing[name] = np.load(directory / f"col{position}.na.npy", mmap_mode="r")
+            else:
+                self._values[name] = np.load(directory / f"col{position}.npy", mmap_mode="r")
+        self._length = len(self._values[self.columns[0]]) if self.columns else 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def take(self, rows) -> pd.DataFrame:
+        """
+        Dekodiert die angegebenen Zeilen in ein DataFrame (Reihenfolge wie im Katalog).
+        """
+        positions = sorted(rows)
+        data = {}
+        for name in self.columns:
+            values = self._values[name]
+            if isinstance(values, _StringArray):
+                missing = self._missing[name]
+                data[name] = [None if missing[p] else values[p] for p in positions]
+            else:
+                data[name] = np.asarray(values[positions]) if positions else np.asarray(values[:0])
+        return pd.DataFrame(data, index=pd.Index(positions, dtype="int64"), columns=self.columns)
+
+@dataclass
+class SharedOfferStore(OfferStore):
+    """
+    Angebotsspeicher über einem per mmap eingebundenen Snapshot.
+
+    Die Partitionen tragen keine eigenen DataFrames. Angebote werden bei Bedarf
+    aus der gemeinsamen Tabelle dekodiert.
+
+    Attributes:
+        table (SharedOfferTable | None): Der spaltenweise gespeicherte Katalog
+        partition_rows (dict[str, np.ndarray]): Supermarkt -> Zeilennummern der Partition
+        expansion_table (Mapping[str, frozenset]): Die Erweiterungstabelle der Taxonomie
+        name_index (ProductNameIndex | None): Der Namensindex der Halluzinationsprüfung
+        generation (int): Die Generationsnummer des Snapshots
+    """
+    table: SharedOfferTable | None = None
+    partition_rows: dict = field(default_factory=dict)
+    expansion_table: dict = field(default_factory=dict)
+    name_index: ProductNameIndex | None = None
+    generation: int = 0
+
+    @property
+    def empty(self) -> bool:
+        return self.table is None or len(self.table) == 0
+
+    def frame(self, selected_markets, valid_rows=None) -> pd.DataFrame:
+        if self.table is None:
+            return pd.DataFrame()
+        if not selected_markets:
+            rows = set(range(len(self.table)))
+        else:
+            rows = set()
+            for partition in self.select_partitions(selected_markets):
+                rows.update(self.partition_rows[partition.market].tolist())
+        if valid_rows is not None:
+            rows &= valid_rows
+        return self.table.take(rows)
+
+    def rows_to_frame(self, rows) -> pd.DataFrame:
+        if self.table is None:
+            return pd.DataFrame()
+        # Unbekannte Zeilennummern (z.B. vom Modell genannte IDs) werden wie im lokalen Speicher übergangen
+        return self.table.take({row for row in rows if 0 <= row < len(self.table)})
+
+# --- Schreiben eines Snapshots ---
+
+def _save_strings(directory: Path, name: str, values) -> None:
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded], dtype=np.int64)
+    # Ein leerer Puffer lässt sich nicht per mmap einbinden, daher mindestens ein Füllbyte
+    data = np.frombuffer(b"".join(encoded) or b"\0", dtype=np.uint8)
+    np.save(directory / f"{name}.off.npy", offsets)
+    np.save(directory / f"{name}.str.npy", data)
+
+def _save_groups(directory: Path, name: str, groups) -> None:
+    groups = [sorted(group) for group in groups]
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(group) for group in groups], dtype=np.int64)
+    rows = np.fromiter((row for group in groups for row in group), dtype=np.int64, count=int(offsets[-1]))
+    np.save(directory / f"{name}.grp.npy", offsets)
+    np.save(directory / f"{name}.rows.npy", rows if len(rows) else np.zeros(1, dtype=np.int64))
+
+def _save_table(directory: Path, df: pd.DataFrame) -> list:
+    columns = []
+    for position, name in enumerate(df.columns):
+        series = df[name]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            np.save(directory / f"col{position}.npy", series.to_numpy())
+            columns.append([name, "num"])
+        else:
+            missing = series.isna().to_numpy()
+            _save_strings(directory, f"col{position}", ["" if is_missing else str(value) for value, is_missing in zip(series, missing)])
+            np.save(directory / f"col{position}.na.npy", missing)
+            columns.append([name, "str"])
+    return columns
+
+def _save_mapping(directory: Path, name: str, mapping: dict) -> None:
+    keys = sorted(mapping)
+    _save_strings(directory, f"{name}.keys", keys)
+    _save_groups(directory, f"{name}.values", [mapping[key] for key in keys])
+
+def _load_mapping(directory: Path, name: str, convert) -> _SharedRowMap:
+    return _SharedRowMap(_SortedStringArray(directory, f"{name}.keys"), _RowGroups(directory, f"{name}.values"), convert)
+
+def _write_snapshot(directory: Path, store: OfferStore, expansion_table: dict, sources: str) -> None:
+    directory.mkdir(parents=True)
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "sources": sources,
+        "columns": _save_table(directory, store.df),
+        "markets": list(store.partitions),
+    }
+
+    for position, partition in enumerate(store.partitions.values()):
+        prefix = f"p{position}"
+        np.save(directory / f"{prefix}.members.npy", partition.df.index.to_numpy(dtype=np.int64))
+        vocabulary = list(partition.index.vocabulary)
+        _save_strings(directory, f"{prefix}.vocab", vocabulary)
+        _save_groups(directory, f"{prefix}.post", [partition.index.postings[stem] for stem in vocabulary])
+
+    first_partition = next(iter(store.partitions.values()), None)
+    head_vocabulary = sorted(first_partition.index.head_vocabulary) if first_partition else []
+    _save_strings(directory, "heads", head_vocabulary)
+
+    validity = store.validity
+    np.save(directory / "validity.days.npy", np.array([day.toordinal() for day in validity.boundaries] or [0], dtype=np.int64))
+    _save_groups(directory, "validity.buckets", validity.buckets)
+    np.save(directory / "validity.undated.npy", np.array(sorted(validity.undated) or [-1], dtype=np.int64))
+    meta["validity"] = {
+        "boundaries": len(validity.boundaries),
+        "undated": len(validity.undated),
+        "latest_start": validity.latest_start.toordinal() if validity.latest_start else None,
+    }
+
+    # Erweiterungstabelle: Begriff -> Positionen im sortierten Wortschatz aller Erweiterungen
+    expansion_vocabulary = sorted(set().union(*expansion_table.values())) if expansion_table else []
+    positions = {term: position for position, term in enumerate(expansion_vocabulary)}
+    _save_strings(directory, "expansion.vocab", expansion_vocabulary)
+    _save_mapping(directory, "expansion", {
+        term: [positions[expansion] for expansion in expansions] for term, expansions in expansion_table.items()
+    })
+
+    # Namensindex der Halluzinationsprüfung (Angebots-IDs sind die Zeilennummern des Katalogs)
+    name_index = build_name_index(store.df)
+    _save_mapping(directory, "names", name_index.names)
+    _save_mapping(directory, "names.tokens", name_index.tokens)
+    _save_strings(directory, "names.terms", sorted(name_index.terms))
+
+    with open(directory / "meta.json", "w", encoding="utf-8") as file:
+        json.dump(meta, file, ensure_ascii=False)
+
+@contextmanager
+def _publish_lock(directory: Path):
+    """
+    Exklusive Sperre über eine Sperrdatei (plattformunabhängig, ohne fcntl).
+    """
+    lock_path = directory / LOCK_FILE_NAME
+    deadline = time.monotonic() + LOCK_TIMEOUT_SECONDS
+    while True:
+        try:
+            handle = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                # Sperre eines abgestürzten Prozesses übernehmen
+                lock_path.unlink(missing_ok=True)
+                deadline = time.monotonic() + LOCK_TIMEOUT_SECONDS
+            time.sleep(0.1)
+    try:
+        yield
+    finally:
+        os.close(handle)
+        lock_path.unlink(missing_ok=True)
+
+def publish_snapshot(directory: Path | None = None, force: bool = False, stale_generation: int | None = None) -> int:
+    """
+    Baut Katalog und Indizes aus den CSV-Dateien und veröffentlicht sie als neue Generation.
+
+    Args:
+        directory (Path | None): Verzeichnis des gemeinsamen Speichers (Standard: shared_store_dir())
+        force (bool): Auch dann eine neue Generation schreiben, wenn bereits eine aktiv ist
+        stale_generation (int | None): Nur dann eine neue Generation schreiben, wenn noch diese
+                                       (veraltete) Generation aktiv ist; hat ein anderer Prozess
+                                       sie bereits ersetzt, bleibt es bei dessen Generation
+
+    Returns:
+        int: Die aktive Generationsnummer
+    """
+    directory = directory or shared_store_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    with _publish_lock(directory):
+        generation = current_generation(directory)
+        if generation is not None and not force and generation != stale_generation:
+            return generation
+
+        # Fingerabdruck vor dem Laden: Ändert sich eine Quelle währenddessen, gilt der Snapshot danach als veraltet
+        sources = source_fingerprint()
+        # Die Quellen neu einlesen: Die gecachten Stände dieses Prozesses stammen ggf. noch aus den alten Dateien
+        product_data.load_csv_data.clear()
+        taxonomy.load_taxonomy.clear()
+        offers_df = product_data.load_csv_data().reset_index(drop=True)
+        expansion_table = taxonomy.build_expansion_table(offers_df, taxonomy.load_taxonomy())
+        store = build_offer_store(offers_df, expansion_table.keys())
+
+        generation = (generation or 0) + 1
+        _write_snapshot(_generation_dir(directory, generation), store, expansion_table, sources)
+
+        # Umschalten erst, wenn der Snapshot vollständig geschrieben ist
+        current_tmp = directory / f"{CURRENT_FILE_NAME}.tmp"
+        current_tmp.write_text(str(generation), encoding="utf-8")
+        os.replace(current_tmp, directory / CURRENT_FILE_NAME)
+
+        # Alte Generationen entfernen (unter Windows ggf. noch eingebunden, dann beim nächsten Mal)
+        for old_generation in range(1, generation - KEEP_GENERATIONS + 1):
+            shutil.rmtree(_generation_dir(directory, old_generation), ignore_errors=True)
+        return generation
+
+# --- Einbinden eines Snapshots ---
+
+def _read_meta(directory: Path, generation: int) -> dict:
+    with open(_generation_dir(directory, generation) / "meta.json", encoding="utf-8") as file:
+        return json.load(file)
+
+def is_current(directory: Path, generation: int) -> bool:
+    """
+    Prüft, ob eine Generation im aktuellen Format und aus den aktuellen Quelldateien geschrieben wurde.
+    """
+    try:
+        meta = _read_meta(directory, generation)
+    except (OSError, ValueError):
+        return False
+    return meta.get("format") == SNAPSHOT_FORMAT and meta.get("sources") == source_fingerprint()
+
+def attach_snapshot(directory: Path, generation: int) -> SharedOfferStore:
+    """
+    Bindet einen veröffentlichten Snapshot schreibgeschützt per mmap ein.
+
+    Args:
+        directory (Path): Verzeichnis des gemeinsamen Speichers
+        generation (int): Die einzubindende Generation
+
+    Returns:
+        SharedOfferStore: Der Angebotsspeicher über dem Snapshot
+    """
+    generation_dir = _generation_dir(directory, generation)
+    meta = _read_meta(directory, generation)
+    expansion_vocabulary = _StringArray(generation_dir, "expansion.vocab")
+    expansion_table = _load_mapping(
+        generation_dir, "expansion", lambda positions: frozenset(expansion_vocabulary[p] for p in positions)
+    )
+    name_index = ProductNameIndex(
+        names=_load_mapping(generation_dir, "names", tuple),
+        tokens=_load_mapping(generation_dir, "names.tokens", frozenset),
+        terms=frozenset(_StringArray(generation_dir, "names.terms")[:])
+    )
+
+    head_vocabulary = _SortedStringArray(generation_dir, "heads")
+    partitions = {}
+    partition_rows = {}
+    for position, market in enumerate(meta["markets"]):
+        prefix = f"p{position}"
+        vocabulary = _SortedStringArray(generation_dir, f"{prefix}.vocab")
+        index = SearchIndex(
+            postings=_SharedPostings(vocabulary, _RowGroups(generation_dir, f"{prefix}.post")),
+            vocabulary=vocabulary,
+            head_vocabulary=head_vocabulary
+        )
+        partitions[market] = MarketPartition(market=market, df=None, index=index)
+        partition_rows[market] = np.load(generation_dir / f"{prefix}.members.npy", mmap_mode="r")
+
+    validity_meta = meta["validity"]
+    days = np.load(generation_dir / "validity.days.npy", mmap_mode="r")[:validity_meta["boundaries"]]
+    undated = np.load(generation_dir / "validity.undated.npy", mmap_mode="r")[:validity_meta["undated"]]
+    validity = ValidityIndex(
+        boundaries=_DateArray(days),
+        buckets=_RowGroups(generation_dir, "validity.buckets"),
+        undated=frozenset(undated.tolist()),
+        latest_start=date.fromordinal(validity_meta["latest_start"]) if validity_meta["latest_start"] else None
+    )
+
+    return SharedOfferStore(
+        partitions=partitions,
+        validity=validity,
+        table=SharedOfferTable(generation_dir, meta["columns"]),
+        partition_rows=partition_rows,
+        expansion_table=expansion_table,
+        name_index=name_index,
+        generation=generation,
+        version=f"shared-{generation}"
+    )
+
+# Prozessweit eingebundener Snapshot (Verzeichnis -> SharedOfferStore)
+_attached_stores: dict = {}
+_attach_lock = threading.Lock()
+
+def get_shared_offer_store() -> SharedOfferStore:
+    """
+    Liefert den Angebotsspeicher der aktiven Generation und wechselt bei einer neuen Generation.
+
+    Ist noch kein Snapshot vorhanden oder ist er veraltet (siehe is_current), veröffentlicht
+    der erste Worker einen neuen.
+
+    Returns:
+        SharedOfferStore: Der eingebundene Angebotsspeicher
+    """
+    directory = shared_store_dir()
+    generation = current_generation(directory)
+    if generation is None:
+        generation = publish_snapshot(directory)
+
+    with _attach_lock:
+        store = _attached_stores.get(directory)
+        if store is None or store.generation != generation:
+            # Geprüft wird nur beim Wechsel der Generation, nicht bei jedem Zugriff
+            if not is_current(directory, generation):
+                generation = publish_snapshot(directory, stale_generation=generation)
+            store = attach_snapshot(directory, generation)
+            _attached_stores[directory] = store
+    return store
+
+if __name__ == "__main__":
+    print(f"Generation {publish_snapshot(force=True)} veröffentlicht in {shared_store_dir()}")
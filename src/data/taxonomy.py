@@ -0,0 +1,235 @@
+"""
+Synonym- und Taxonomie-Speicher für die SparFuchs.de Anwendung.
+
+Dieses Modul lädt die semantischen Produktgruppen und Kategorie-Zuordnungen
+aus `data/Taxonomie.csv`, ergänzt sie um automatisch aus dem Katalog
+gewonnene Kategorie/Unterkategorie-Beziehungen und stellt daraus eine
+einmalig berechnete Nachschlagetabelle (Begriff -> Erweiterungen) bereit.
+"""
+import streamlit as st
+import pandas as pd
+import re
+from collections import defaultdict
+from pathlib import Path
+
+from . import product_data
+from ..utils.text_normalization import normalize_phrase
+
+# Konstanten
+TAXONOMY_CSV_FILE_PATH = Path("data/Taxonomie.csv")
+
+# Trennzeichen für Begriffslisten innerhalb einer CSV-Zelle (wie in More_Rezepte.csv)
+LIST_SEPARATOR = ";"
+
+# Ab so vielen verschiedenen Oberbegriffen gilt ein Kategoriesegment als Eigenschaft (z.B. 'Snacks')
+FACET_PARENT_THRESHOLD = 5
+
+@st.cache_data
+def load_taxonomy():
+    """
+    Lädt die gepflegten Synonymgruppen und Kategorie-Zuordnungen aus der CSV-Datei.
+
+    Returns:
+        DataFrame: Ein Pandas DataFrame mit den Spalten 'Typ', 'Schluessel' und 'Begriffe'
+                   oder ein leeres DataFrame, wenn die Datei nicht geladen werden konnte.
+    """
+    try:
+        df = pd.read_csv(TAXONOMY_CSV_FILE_PATH)
+        if df.empty:
+            st.warning(f"Die Taxonomie-Datei '{TAXONOMY_CSV_FILE_PATH}' ist leer.")
+            return pd.DataFrame()
+        return df
+    except FileNotFoundError:
+        st.warning(f"Die Taxonomie-Datei '{TAXONOMY_CSV_FILE_PATH}' wurde nicht gefunden. Es werden nur Katalogbegriffe verwendet.")
+        return pd.DataFrame()
+    except Exception as e:
+        st.warning(f"Fehler beim Laden der Taxonomie-Datei '{TAXONOMY_CSV_FILE_PATH}': {str(e)}")
+        return pd.DataFrame()
+
+def _split_list(value) -> list[str]:
+    """
+    Zerlegt eine mit Semikolon getrennte CSV-Zelle in eine bereinigte Liste.
+    """
+    if not isinstance(value, str):
+        return []
+    return [part.strip() for part in value.split(LIST_SEPARATOR) if part.strip()]
+
+def _clean_segment(segment: str) -> str:
+    """
+    Entfernt Zusätze in Klammern (z.B. '(Bio)') und normalisiert die Schreibweise eines Kategoriesegments.
+    """
+    return re.sub(r"\(.*?\)", "", segment).strip().lower()
+
+def _segment_terms(segment: str) -> set[str]:
+    """
+    Wandelt ein bereinigtes Kategoriesegment (z.B. 'reis & nudeln') in Suchbegriffe um.
+
+    Mit '&' verbundene Teile werden zusätzlich einzeln aufgenommen.
+    """
+    if not segment:
+        return set()
+    terms = {segment}
+    terms.update(part.strip() for part in segment.split("&") if len(part.strip()) >= 3)
+    return terms
+
+def mine_category_relations(offers_df: pd.DataFrame) -> dict[str, set[str]]:
+    """
+    Leitet Ober-/Unterbegriffe aus dem gemeinsamen Auftreten von Kategorie und Unterkategorie ab.
+
+    Jeder Kategoriepfad (z.B. 'Getränke' > 'Alkoholische Getränke' > 'Bier') wird entlang
+    seiner Segmente aufgeteilt. Ein Begriff wird auf alle Begriffe erweitert, die im
+    Katalog unterhalb von ihm vorkommen ('getränke' -> 'bier', 'wein', ...), nicht umgekehrt.
+
+    Nicht als Unterbegriff übernommen werden:
+    - Segmente, die unter vielen verschiedenen Oberbegriffen auftreten (z.B. 'Fertiggerichte',
+      'Snacks'). Sie beschreiben eine Eigenschaft statt einer Unterart.
+    - Segmente, die an anderer Stelle selbst eine eigene Hauptgruppe bilden
+      (z.B. 'Milchprodukte' in 'Kaffeegetränke/Milchprodukte'). Das ist eine Doppelzuordnung.
+
+    Args:
+        offers_df (DataFrame): Die Angebotsdaten mit den Spalten 'Kategorie' und 'Unterkategorie'
+
+    Returns:
+        dict[str, set[str]]: Zuordnung Begriff -> Menge der untergeordneten Begriffe
+    """
+    relations: dict[str, set[str]] = defaultdict(set)
+    if offers_df.empty or not {'Kategorie', 'Unterkategorie'}.issubset(offers_df.columns):
+        return relations
+
+    paths = offers_df[['Kategorie', 'Unterkategorie']].dropna().drop_duplicates()
+    segment_paths = []
+    for kategorie, unterkategorie in paths.itertuples(index=False):
+        segments = [_clean_segment(segment) for segment in str(kategorie).split('/') + str(unterkategorie).split('/')]
+        segment_paths.append([segment for segment in segments if segment])
+
+    # Zähle die Oberbegriffe je Segment und sammle die Hauptgruppen (Segmente mit eigenen Unterbegriffen)
+    parents_per_segment: dict[str, set[str]] = defaultdict(set)
+    main_groups: set[str] = set()
+    for segments in segment_paths:
+        for position, (parent, child) in enumerate(zip(segments, segments[1:])):
+            parents_per_segment[child].add(parent)
+            if position <= 1:
+                main_groups.add(parent)
+
+    for segments in segment_paths:
+        descendant_terms = []
+        for position, segment in enumerate(segments):
+            is_facet = len(parents_per_segment[segment]) >= FACET_PARENT_THRESHOLD
+            is_double_assignment = position >= 2 and segment in main_groups
+            descendant_terms.append(set() if is_facet or is_double_assignment else _segment_terms(segment))
+
+        for position, segment in enumerate(segments):
+            own_terms = _segment_terms(segment)
+            descendants = set().union(*descendant_terms[position + 1:]) - own_terms
+            for term in own_terms:
+                relations[term].update(descendants)
+    return relations
+
+def build_expansion_table(offers_df: pd.DataFrame, taxonomy_df: pd.DataFrame) -> dict[str, frozenset[str]]:
+    """
+    Baut die Nachschlagetabelle Begriff -> semantische Erweiterungen auf.
+
+    Alle Begriffe werden wie Katalog und Anfrage normalisiert (siehe normalize_phrase),
+    sodass Schlüssel und Erweiterungen direkt im Suchindex nachgeschlagen werden können.
+    Gepflegte Gruppen aus der Taxonomie-Datei wirken symmetrisch: Jeder Begriff einer
+    Gruppe wird auf die gesamte Gruppe erweitert (wie bisher 'pasta' -> alle Nudelsorten).
+    Die aus dem Katalog gewonnenen Kategoriebeziehungen wirken nur von oben nach unten.
+
+    Args:
+        offers_df (DataFrame): Die Angebotsdaten
+        taxonomy_df (DataFrame): Die gepflegte Taxonomie (Spalten 'Typ', 'Schluessel', 'Begriffe')
+
+    Returns:
+        dict[str, frozenset[str]]: Normalisierter Begriff -> normalisierte Erweiterungen (inklusive des Begriffs selbst)
+    """
+    table: dict[str, set[str]] = defaultdict(set)
+
+    if not taxonomy_df.empty:
+        groups = taxonomy_df[taxonomy_df['Typ'] == 'gruppe']
+        for schluessel, begriffe in groups[['Schluessel', 'Begriffe']].itertuples(index=False):
+            members = {normalize_phrase(str(schluessel))}
+            members.update(normalize_phrase(term) for term in _split_list(begriffe))
+            members.discard("")
+            for member in members:
+                table[member].update(members)
+
+    for term, descendants in mine_category_relations(offers_df).items():
+        key = normalize_phrase(term)
+        if not key:
+            continue
+        table[key].add(key)
+        table[key].update(filter(None, (normalize_phrase(descendant) for descendant in descendants)))
+
+    return {term: frozenset(expansions) for term, expansions in table.items()}
+
+def build_category_fallbacks(taxonomy_df: pd.DataFrame) -> dict[str, list[str]]:
+    """
+    Liest die Zuordnung Suchwort -> Katalogkategorien für die kategoriebasierte Rückfallsuche.
+
+    Args:
+        taxonomy_df (DataFrame): Die gepflegte Taxonomie
+
+    Returns:
+        dict[str, list[str]]: Suchwort -> Liste der passenden Kategorienamen
+    """
+    if taxonomy_df.empty:
+        return {}
+    fallbacks = taxonomy_df[taxonomy_df['Typ'] == 'kategorie']
+    return {
+        str(schluessel).strip().lower(): _split_list(begriffe)
+        for schluessel, begriffe in fallbacks[['Schluessel', 'Begriffe']].itertuples(index=False)
+    }
+
+def get_expansion_table() -> dict[str, frozenset[str]]:
+    """
+    Liefert die prozessweit einmalig berechnete Erweiterungstabelle.
+
+    Alle Sitzungen teilen dieselbe Tabelle. Im gemeinsamen Speicher mehrerer
+    Worker-Prozesse (siehe shared_store.py) stammt sie aus dem aktiven Snapshot.
+
+    Returns:
+        dict[str, frozenset[str]]: Begriff -> semantische Erweiterungen
+    """
+    # Import erst hier, da shared_store beim Veröffentlichen selbst dieses Modul verwendet
+    from . import shared_store
+    if shared_store.is_enabled():
+        return shared_store.get_shared_offer_store().expansion_table
+    return _get_local_expansion_table()
+
+@st.cache_resource
+def _get_local_expansion_table() -> dict[str, frozenset[str]]:
+    """
+    Berechnet die Erweiterungstabelle einmalig pro Prozess.
+
+    Die Funktion ist mit @st.cache_resource dekoriert, damit alle Sitzungen dieselbe
+    Tabelle teilen und sie nicht bei jedem Cache-Treffer kopiert wird.
+    """
+    return build_expansion_table(product_data.load_csv_data(), load_taxonomy())
+
+@st.cache_resource
+def get_category_fallbacks() -> dict[str, list[str]]:
+    """
+    Liefert die prozessweit einmalig geladene Zuordnung Suchwort -> Kategorien.
+
+    Returns:
+        dict[str, list[str]]: Suchwort -> Liste der passenden Kategorienamen
+    """
+    return build_category_fallbacks(load_taxonomy())
+
+def expand_terms(terms) -> set[str]:
+    """
+    Erweitert Suchbegriffe um ihre semantisch verwandten Begriffe.
+
+    Jeder Begriff wird mit einem einzigen Tabellenzugriff (O(1)) erweitert.
+
+    Args:
+        terms: Iterierbare Menge normalisierter Suchbegriffe (siehe text_normalization.query_terms)
+
+    Returns:
+        set[str]: Die ursprünglichen Begriffe zusammen mit allen normalisierten Erweiterungen
+    """
+    table = get_expansion_table()
+    expanded = set(terms)
+    for term in terms:
+        expanded.update(table.get(term, ()))
+    return expanded
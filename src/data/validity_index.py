@@ -0,0 +1,185 @@
+"""
+Gültigkeitsindex über den Angebotskatalog.
+
+Dieses Modul baut aus Startdatum und Enddatum der Angebote einen nach Tagen
+gegliederten Intervallindex auf. Die Frage "Welche Angebote sind heute bzw. in
+dieser Woche gültig?" wird damit per binärer Suche über die sortierten
+Stichtage beantwortet, statt alle Zeilen zu vergleichen.
+"""
+from __future__ import annotations
+import pandas as pd
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+@dataclass
+class ValidityIndex:
+    """
+    Intervallindex über die Gültigkeitszeiträume der Angebote.
+
+    Die sortierten Stichtage teilen die Zeitachse in Abschnitte, in denen sich die Menge
+    der gültigen Angebote nicht ändert. Jeder Abschnitt speichert diese Menge einmal.
+
+    Attributes:
+        boundaries (list[date]): Sortierte Stichtage (Startdaten und Tage nach einem Enddatum)
+        buckets (list[frozenset]): buckets[i] = Zeilen, die von boundaries[i] bis vor boundaries[i + 1] gültig sind
+        undated (frozenset): Zeilen ohne lesbaren Gültigkeitszeitraum (werden immer berücksichtigt)
+        latest_start (date | None): Das späteste Startdatum (Beginn des neuesten Prospekts)
+    """
+    boundaries: list = field(default_factory=list)
+    buckets: list = field(default_factory=list)
+    undated: frozenset = frozenset()
+    latest_start: date | None = None
+
+    def valid_between(self, start: date, end: date) -> set:
+        """
+        Liefert die Zeilen, die an mindestens einem Tag zwischen start und end (einschließlich) gültig sind.
+        """
+        rows = set(self.undated)
+        if not self.boundaries or end < start:
+            return rows
+        first = max(bisect_right(self.boundaries, start) - 1, 0)
+        last = bisect_right(self.boundaries, end)
+        for bucket in self.buckets[first:last]:
+            rows |= bucket
+        return rows
+
+    def valid_on(self, day: date) -> set:
+        """
+        Liefert die Zeilen, die an einem bestimmten Tag gültig sind.
+        """
+        return self.valid_between(day, day)
+
+    def reference_day(self, today: date) -> date:
+        """
+        Zieht einen Stichtag in den Zeitraum des Katalogs.
+
+        Liegt der Tag nach dem letzten Enddatum (veralteter Katalog), wird das späteste
+        Startdatum verwendet, also der Beginn des neuesten Prospekts. Einzelne länger
+        laufende Angebote verschieben den Stichtag damit nicht. Liegt der Tag vor dem
+        ersten Startdatum, wird dieses verwendet. So bleibt der Kontext nicht leer.
+        """
+        if not self.boundaries:
+            return today
+        if today >= self.boundaries[-1]:
+            return self.latest_start or self.boundaries[0]
+        return max(today, self.boundaries[0])
+
+def _parse_dates(values: pd.Series) -> pd.Series:
+    """
+    Wandelt eine Datumsspalte (ISO-Strings wie '2025-05-19') in date-Objekte um, ungültige Werte in NaT.
+    """
+    return pd.to_datetime(values, errors='coerce').dt.date
+
+def build_validity_index(df: pd.DataFrame) -> ValidityIndex:
+    """
+    Baut den Gültigkeitsindex über die Spalten 'Startdatum' und 'Enddatum' auf.
+
+    Fehlt eines der beiden Daten, gilt das Angebot in dieser Richtung bis zum Rand des Katalogzeitraums.
+    Fehlen beide oder ist keines lesbar, wird die Zeile als undatiert immer berücksichtigt.
+
+    Args:
+        df (DataFrame): Die Angebotsdaten
+
+    Returns:
+        ValidityIndex: Der aufgebaute Index
+    """
+    if df.empty or not {'Startdatum', 'Enddatum'}.issubset(df.columns):
+        return ValidityIndex(undated=frozenset(df.index))
+
+    starts = _parse_dates(df['Startdatum'])
+    ends = _parse_dates(df['Enddatum'])
+
+    intervals = []
+    undated = set()
+    for row_id, start, end in zip(df.index, starts, ends):
+        start = None if pd.isna(start) else start
+        end = None if pd.isna(end) else end
+        if start is None and end is None:
+            undated.add(row_id)
+        else:
+            intervals.append((row_id, start, end))
+
+    if not intervals:
+        return ValidityIndex(undated=frozenset(undated))
+
+    known_days = [day for _, start, end in intervals for day in (start, end) if day is not None]
+    first_day, last_day = min(known_days), max(known_days)
+
+    boundaries = sorted(
+        {start or first_day for _, start, _ in intervals}
+        | {(end or last_day) + timedelta(days=1) for _, _, end in intervals}
+    )
+    buckets = [set() for _ in boundaries]
+    for row_id, start, end in intervals:
+        first = bisect_left(boundaries, start or first_day)
+        last = bisect_left(boundaries, (end or last_day) + timedelta(days=1))
+        for position in range(first, last):
+            buckets[position].add(row_id)
+
+    start_days = [start for _, start, _ in intervals if start is not None]
+    return ValidityIndex(
+        boundaries=boundaries,
+        buckets=[frozenset(bucket) for bucket in buckets],
+        undated=frozenset(undated),
+        latest_start=max(start_days) if start_days else None
+    )
+
+def update_validity_index(index: ValidityIndex, removed_rows, added_df: pd.DataFrame, latest_start: date | None) -> ValidityIndex:
+    """
+    Aktualisiert den Gültigkeitsindex um entfernte und hinzugekommene Zeilen.
+
+    Neue Start- bzw. Folgetage nach einem Enddatum werden als zusätzliche Stichtage
+    eingefügt; der geteilte Abschnitt übernimmt dabei die Zeilen des bisherigen.
+    Fehlende Daten gelten wie beim Aufbau bis zum Rand des bisherigen Katalogzeitraums.
+
+    Args:
+        index (ValidityIndex): Der bisherige Index
+        removed_rows: Index-Labels der zu entfernenden Zeilen (auch geänderte Zeilen)
+        added_df (DataFrame): Die hinzuzufügenden Zeilen mit 'Startdatum' und 'Enddatum'
+        latest_start (date | None): Das späteste Startdatum des aktualisierten Katalogs
+
+    Returns:
+        ValidityIndex: Der aktualisierte Index
+    """
+    removed_rows = frozenset(removed_rows)
+    boundaries = list(index.boundaries)
+    buckets = [bucket - removed_rows if not bucket.isdisjoint(removed_rows) else bucket for bucket in index.buckets]
+    undated = set(index.undated - removed_rows)
+
+    if not added_df.empty and {'Startdatum', 'Enddatum'}.issubset(added_df.columns):
+        starts = _parse_dates(added_df['Startdatum'])
+        ends = _parse_dates(added_df['Enddatum'])
+        additions: dict = {}
+        for row_id, start, end in zip(added_df.index, starts, ends):
+            start = None if pd.isna(start) else start
+            end = None if pd.isna(end) else end
+            if start is None and end is None:
+                undated.add(row_id)
+                continue
+            first_day = start or (boundaries[0] if boundaries else end)
+            stop_day = end + timedelta(days=1) if end is not None else max(boundaries[-1] if boundaries else start, start + timedelta(days=1))
+            for day in (first_day, stop_day):
+                position = bisect_left(boundaries, day)
+                if position == len(boundaries) or boundaries[position] != day:
+                    # Neuer Stichtag teilt einen Abschnitt, beide Hälften haben zunächst dieselben Zeilen
+                    boundaries.insert(position, day)
+                    buckets.insert(position, buckets[position - 1] if position > 0 else frozenset())
+            additions[row_id] = (first_day, stop_day)
+
+        changed = defaultdict(set)
+        for row_id, (first_day, stop_day) in additions.items():
+            for position in range(bisect_left(boundaries, first_day), bisect_left(boundaries, stop_day)):
+                changed[position].add(row_id)
+        for position, rows in changed.items():
+            buckets[position] = buckets[position] | rows
+    elif not added_df.empty:
+        undated.update(added_df.index)
+
+    return ValidityIndex(
+        boundaries=boundaries,
+        buckets=buckets,
+        undated=frozenset(undated),
+        latest_start=latest_start
+    )
@@ -4,6 +4,7 @@ Layout-Funktionen für die SparFuchs.de Benutzeroberfläche.
 Dieses Modul enthält Funktionen zum Erstellen und Anzeigen der
 verschiedenen UI-Elemente der Anwendung.
 """
+from __future__ import annotations
 import streamlit as st
 
 def display_logo():
@@ -51,6 +52,29 @@ def display_chat_container():
     
     return spinner_placeholder
 
+def show_search_spinner(placeholder, queue_position: int | None = None):
+    """
+    Zeigt die Ladeanimation im Spinner-Platzhalter an.
+
+    Args:
+        placeholder: Der Spinner-Platzhalter aus display_chat_container()
+        queue_position (int | None): Position in der Warteschlange für KI-Anfragen,
+                                     None, sobald die Anfrage bearbeitet wird
+    """
+    if queue_position is None:
+        icon, text = "🔍", "Suche läuft"
+    else:
+        icon, text = "⏳", f"Viele Anfragen gerade – du bist auf Platz {queue_position} der Warteschlange"
+    placeholder.markdown(f"""
+    <div class="search-spinner-box">
+        <div class="loader-container">
+            <span class="search-icon">{icon}</span> 
+            <span class="loading-text">{text}</span>
+            <span class="loading-dots">...</span>
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
 def create_chat_input(disabled: bool = False):
     """
     Erstellt das Chat-Eingabefeld und den Submit-Button.
@@ -120,9 +144,8 @@ def create_chat_input(disabled: bool = False):
         has_ai_responses = any(message["role"] == "assistant" for message in st.session_state.messages)
         if has_ai_responses:
             if st.button("🔄 Chat zurücksetzen", key="reset_chat", type="secondary", use_container_width=True, disabled=disabled):
-                # System-Nachricht behalten, Rest löschen
-                system_message = st.session_state.messages[0]
-                st.session_state.messages = [system_message]
+                # Chatverlauf löschen
+                st.session_state.messages = []
                 
                 # Supermarktauswahl zurücksetzen, indem der Key aus dem Session State gelöscht wird.
                 if "market_segment_control" in st.session_state:
@@ -145,6 +168,16 @@ def create_chat_input(disabled: bool = False):
     
     return None
 
+def get_draft_input() -> str:
+    """
+    Liefert den aktuellen, noch nicht abgesendeten Text des Chat-Eingabefelds.
+
+    Returns:
+        str: Der Text im Eingabefeld oder ein leerer String
+    """
+    current_key = f"custom_chat_input_{st.session_state.get('key_counter', 0)}"
+    return st.session_state.get(current_key) or ""
+
 def display_suggestions_row(suggestions):
     """
     Zeigt mehrere Vorschläge in einer Reihe an.
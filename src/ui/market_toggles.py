@@ -1,7 +1,6 @@
 import streamlit as st
 
-# Liste der Supermärkte
-MARKETS = ["Aldi", "Lidl", "Penny", "Edeka", "Rewe"]
+from ..data.feed_validation import MARKETS
 
 def render_market_toggles() -> list[str]:
     """
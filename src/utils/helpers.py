@@ -19,21 +19,9 @@ def initialize_session_state(session_state):
     """
     # Session State für Chatverlauf initialisieren
     if "messages" not in session_state:
-        # Systemnachricht, die im Hintergrund verwendet wird
-        session_state.messages = [
-            {"role": "system", "content": "Du bist ein hilfreicher Einkaufsassistent für SparFuchs.de. " +
-            "Benutze AUSSCHLIESSLICH die dir bereitgestellten Produktinformationen, um Anfragen zu beantworten. " +
-            "EXTREM WICHTIG: Du darfst NUR Produkte erwähnen, die in den bereitgestellten Daten vorhanden sind. " +
-            "ERFINDE NIEMALS Produkte oder Angebote. Wenn du ein Produkt nicht in den Daten findest, sage klar, " +
-            "dass du keine Information darüber hast. " +
-            "WICHTIG: Antworte IMMER auf Deutsch, unabhängig von der Sprache der Anfrage. " +
-            "Wenn du nach Produkten gefragt wirst, die nicht in der Datenbank sind, sage deutlich, " +
-            "dass du keine Informationen zu diesen Produkten hast. " +
-            "WICHTIG: Verweise NIEMALS auf Angebotsbroschüren oder externe Quellen. " +
-            "Antworte ausschließlich mit den Daten, die dir zur Verfügung gestellt werden. " + 
-            "WICHTIG: Antworte erst, wenn du alle Informationen analysiert hast, um eine korrekte Antwort zu geben. " +
-            "FORMATIERUNGSANWEISUNG: Formatiere deine Antworten zu Produkten immer mit dem HTML <br> Tag für Zeilenumbrüche."}
-        ]
+        # Nur der Chatverlauf (user/assistant). Der Systemprompt kommt bei jeder Anfrage
+        # aus get_system_prompt() bzw. get_recipe_system_prompt(), damit das Präfix stabil bleibt.
+        session_state.messages = []
 
     # Initialisiere eine Key-Zähler-Variable für eindeutige Streamlit-Widget-Keys
     if "key_counter" not in session_state:
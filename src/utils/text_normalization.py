@@ -0,0 +1,154 @@
+"""
+Textnormalisierung für die Produktsuche.
+
+Dieses Modul enthält die gemeinsame Normalisierungskette für Katalog und Anfrage:
+Kleinschreibung (casefold), Umlaut- und Akzentfaltung, leichtes deutsches Stemming
+und die Zerlegung von Komposita (z.B. 'Tafeläpfel' -> 'tafel' + 'apfel').
+"""
+import re
+import unicodedata
+
+# Wörter mit mindestens zwei Zeichen (Buchstaben und Ziffern, inkl. Umlaute)
+RE_WORD = re.compile(r"\w{2,}")
+
+# Minimale Wortlänge für Suchbegriffe aus der Anfrage (wie bisher: 3 Zeichen)
+MIN_QUERY_WORD_LENGTH = 3
+
+# Minimale Länge eines Kompositumbestandteils
+MIN_COMPOUND_PART_LENGTH = 4
+
+# Minimale Länge eines Wortstamms nach dem Abtrennen einer Endung
+MIN_STEM_LENGTH = 4
+
+# Vokale (gefaltet); ein 'n' nach einem Vokal oder Diphthong gehört zum Stamm ('wein', 'bein')
+VOWELS = "aeiouy"
+
+# Häufige Füllwörter in Anfragen, die nicht als Suchbegriff verwendet werden
+QUERY_STOPWORDS = {
+    "aber", "alle", "allen", "aller", "alles", "als", "also", "auch", "auf", "aus", "bei", "bin", "bis",
+    "bitte", "das", "dem", "den", "der", "des", "die", "diese", "dieser", "dieses", "doch",
+    "ein", "eine", "einem", "einen", "einer", "eines", "es", "etwas", "für", "gibt", "gerne", "gern",
+    "habe", "haben", "hast", "hat", "ich", "ihr", "im", "in", "ist", "jetzt", "kann", "kannst", "kein",
+    "keine", "mal", "mehr", "mich", "mir", "mit", "möchte", "nach", "nicht", "noch", "nur", "oder",
+    "sind", "sie", "und", "uns", "von", "was", "welche", "welcher", "welches", "wer", "wie", "wir",
+    "wo", "woche", "zum", "zur", "zu", "aktuell", "aktuelle", "aktuellen", "angebot", "angebote",
+    "angeboten", "günstig", "günstige", "günstiges", "günstigste", "günstigsten", "gerade", "heute",
+    "suche", "zeig", "zeige", "liste", "finde", "preis", "preise", "kostet", "kosten",
+}
+
+def fold_text(text: str) -> str:
+    """
+    Faltet einen Text in eine vergleichbare Schreibweise.
+
+    Kleinschreibung per casefold ('ß' -> 'ss'), Entfernen von Umlautpunkten und Akzenten
+    ('Äpfel' -> 'apfel', 'Crème' -> 'creme') sowie Vereinheitlichung der
+    Umschreibungen 'ae', 'oe', 'ue' ('Aepfel' -> 'apfel').
+
+    Args:
+        text (str): Beliebiger Text
+
+    Returns:
+        str: Der gefaltete Text
+    """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return text.replace("ae", "a").replace("oe", "o").replace("ue", "u")
+
+def stem_token(token: str) -> str:
+    """
+    Reduziert ein gefaltetes Wort auf einen leichten Wortstamm.
+
+    Der Stemmer orientiert sich an CISTEM, trennt aber nur eine einzige Endung ab: 'em', 'er',
+    'en', 'nd' (bei Wörtern über fünf Zeichen) bzw. 'e', 's', 'n' ('wurste' -> 'wurst',
+    'nudeln' -> 'nudel', 'birnen' -> 'birn'). Der verbleibende Stamm muss mindestens vier
+    Zeichen lang sein, und ein 'n' nach einem Vokal oder Diphthong bleibt stehen, damit z.B.
+    'wein', 'wiener' oder 'wasser' nicht auf 'wei', 'wie' oder 'was' schrumpfen. Die Endung
+    't' bleibt erhalten, da nach dem casefold nicht mehr zwischen Substantiven und Verben
+    unterschieden werden kann. Zahlen bleiben unverändert.
+
+    Args:
+        token (str): Ein bereits mit fold_text gefaltetes Wort
+
+    Returns:
+        str: Der Wortstamm
+    """
+    if token.isdigit():
+        return token
+    if len(token) > 5 and token[-2:] in ("em", "er", "en", "nd"):
+        stem = token[:-2]
+    elif token[-1:] in ("e", "s") or (token[-1:] == "n" and token[-2:-1] not in VOWELS):
+        stem = token[:-1]
+    else:
+        return token
+    return stem if len(stem) >= MIN_STEM_LENGTH else token
+
+def tokenize(text: str) -> list[str]:
+    """
+    Zerlegt einen Text in gefaltete Einzelwörter (ohne Stemming).
+
+    Args:
+        text (str): Beliebiger Text
+
+    Returns:
+        list[str]: Gefaltete Wörter mit mindestens zwei Zeichen
+    """
+    if not isinstance(text, str):
+        return []
+    return RE_WORD.findall(fold_text(text))
+
+def normalize_phrase(text: str) -> str:
+    """
+    Normalisiert einen (ggf. mehrteiligen) Begriff zu einer Folge von Wortstämmen.
+
+    Beispiel: 'Alkoholische Getränke' -> 'alkoholisch getrank'
+
+    Args:
+        text (str): Ein Begriff aus Taxonomie oder Anfrage
+
+    Returns:
+        str: Die durch Leerzeichen getrennten Wortstämme
+    """
+    return " ".join(stem_token(token) for token in tokenize(text))
+
+def query_terms(user_query: str) -> list[str]:
+    """
+    Extrahiert die normalisierten Suchbegriffe einer Benutzeranfrage.
+
+    Berücksichtigt werden Wörter mit mindestens drei Zeichen, die keine Füllwörter sind.
+
+    Args:
+        user_query (str): Die Anfrage des Benutzers
+
+    Returns:
+        list[str]: Die Wortstämme der Suchbegriffe in Reihenfolge ihres Auftretens (ohne Duplikate)
+    """
+    terms = []
+    for word in re.findall(r"\b\w+\b", user_query.casefold()):
+        if len(word) < MIN_QUERY_WORD_LENGTH or word in QUERY_STOPWORDS:
+            continue
+        terms.extend(stem_token(token) for token in tokenize(word))
+    return list(dict.fromkeys(terms))
+
+def split_compound(token: str, vocabulary) -> list[str]:
+    """
+    Zerlegt ein gefaltetes Kompositum anhand eines bekannten Wortschatzes.
+
+    Gesucht wird das längste Grundwort am Wortende, dessen Stamm im Wortschatz vorkommt
+    ('tafelapfel' -> Grundwort 'apfel'). Das Bestimmungswort davor wird ebenfalls als
+    Stamm zurückgegeben, sofern es lang genug ist.
+
+    Args:
+        token (str): Ein bereits mit fold_text gefaltetes Wort
+        vocabulary: Menge bekannter Wortstämme (z.B. aus dem Katalog)
+
+    Returns:
+        list[str]: Die Stämme der Bestandteile oder eine leere Liste, wenn keine Zerlegung möglich ist
+    """
+    for split_at in range(MIN_COMPOUND_PART_LENGTH, len(token) - MIN_COMPOUND_PART_LENGTH + 1):
+        head = stem_token(token[split_at:])
+        if len(head) < MIN_COMPOUND_PART_LENGTH or head not in vocabulary:
+            continue
+        # Das Stemming entfernt dabei auch gängige Fugenelemente ('s', 'n', 'e')
+        modifier = stem_token(token[:split_at])
+        return [modifier, head] if len(modifier) >= MIN_COMPOUND_PART_LENGTH else [head]
+    return []
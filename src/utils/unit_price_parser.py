@@ -0,0 +1,153 @@
+"""
+Grundpreisberechnung für die Angebotsdaten.
+
+Dieses Modul liest Menge und Einheit aus dem freien Text des Produktnamens
+(z.B. '900-g-Schale', 'je 6x0.5l', 'Kl. I je Stück') und berechnet daraus beim
+Laden der Daten einheitliche Grundpreise in €/kg, €/l und €/Stück.
+"""
+from __future__ import annotations
+import re
+import pandas as pd
+
+# Mengenangabe mit Gewichts- oder Volumeneinheit, optional mit Multiplikator ('6x0.5l', '14x 2.75 g', '900-g-Schale')
+# Bei Alternativen wie '140/125/100 g' zählt die erste Zahl
+RE_MEASURE = re.compile(
+    r"(?:(\d+)\s*[x×]\s*)?(\d+(?:[.,]\d+)?)(?:/\d+(?:[.,]\d+)?)*\s*-?\s*(kg|g|ml|cl|liter|l)(?![a-zäöüß])",
+    re.IGNORECASE
+)
+
+# Lose Ware mit Kilopreis ('kg-Preis', 'je kg')
+RE_PER_KILO = re.compile(r"\bkg-preis\b|\bje kg\b", re.IGNORECASE)
+
+# Stückzahl ('20 Rollen', '4er-Pack', '10 Stück')
+RE_PIECE_COUNT = re.compile(r"(\d+)\s*(?:er\b|stück|stk|rollen|beutel|tabs|kapseln|pads)", re.IGNORECASE)
+
+# Einzelstück ohne Zahl ('(Stück)', 'je St.', 'je Topf')
+RE_SINGLE_PIECE = re.compile(r"\b(?:stück|stk|st\.|topf)(?![a-zäöüß])", re.IGNORECASE)
+
+# Umrechnung der Einheiten in die Basiseinheiten kg und l
+UNIT_FACTORS = {
+    "kg": ("kg", 1.0),
+    "g": ("kg", 0.001),
+    "l": ("l", 1.0),
+    "liter": ("l", 1.0),
+    "ml": ("l", 0.001),
+    "cl": ("l", 0.01),
+}
+
+# Spaltennamen der Grundpreise je Basiseinheit
+UNIT_PRICE_COLUMNS = {
+    "kg": "Preis_pro_kg_EUR",
+    "l": "Preis_pro_l_EUR",
+    "Stück": "Preis_pro_Stueck_EUR",
+}
+
+def _to_float(number: str) -> float:
+    """
+    Wandelt eine Zahl mit Komma oder Punkt als Dezimaltrennzeichen in float um.
+    """
+    return float(number.replace(",", "."))
+
+def parse_quantity(product_name: str) -> tuple[float, str] | None:
+    """
+    Extrahiert die Packungsmenge aus einem Produktnamen.
+
+    Gewichts- und Volumenangaben haben Vorrang vor Stückzahlen. Bei mehreren Angaben
+    (z.B. '(105g Pckg.) oder Portionen (108g Pckg.)') zählt die erste.
+
+    Beispiele:
+        'POPP Brotaufstrich 250-g-Becher' -> (0.25, 'kg')
+        "BECK'S Pils (je 6x0.5l)" -> (3.0, 'l')
+        'Avocado angereift (Kl. I je Stück)' -> (1.0, 'Stück')
+        'Zucchini Lose Ware Klasse 1 kg-Preis' -> (1.0, 'kg')
+
+    Args:
+        product_name (str): Der Produktname aus den Angebotsdaten
+
+    Returns:
+        tuple[float, str] | None: Menge in der Basiseinheit ('kg', 'l' oder 'Stück')
+                                  oder None, wenn keine Menge erkannt wurde
+    """
+    if not isinstance(product_name, str):
+        return None
+
+    if RE_PER_KILO.search(product_name):
+        return 1.0, "kg"
+
+    measure = RE_MEASURE.search(product_name)
+    if measure:
+        count, amount, unit = measure.groups()
+        base_unit, factor = UNIT_FACTORS[unit.lower()]
+        quantity = _to_float(amount) * factor * (int(count) if count else 1)
+        return (quantity, base_unit) if quantity > 0 else None
+
+    pieces = RE_PIECE_COUNT.search(product_name)
+    if pieces and int(pieces.group(1)) > 0:
+        return float(pieces.group(1)), "Stück"
+
+    if RE_SINGLE_PIECE.search(product_name):
+        return 1.0, "Stück"
+    return None
+
+def add_unit_prices(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Ergänzt die Angebotsdaten um Menge, Einheit und Grundpreise.
+
+    Neue Spalten: 'Menge', 'Einheit' sowie 'Preis_pro_kg_EUR', 'Preis_pro_l_EUR' und
+    'Preis_pro_Stueck_EUR'. Je Zeile ist höchstens eine der Grundpreisspalten gefüllt.
+    Nicht numerische Preise (z.B. 'Frischepreis im Markt') ergeben keinen Grundpreis.
+
+    Args:
+        df (DataFrame): Die Angebotsdaten mit den Spalten 'Produktname' und 'Preis_EUR'
+
+    Returns:
+        DataFrame: Die Angebotsdaten mit den zusätzlichen Spalten
+    """
+    if df.empty or not {'Produktname', 'Preis_EUR'}.issubset(df.columns):
+        return df
+
+    df = df.copy()
+    quantities = [parse_quantity(name) or (None, None) for name in df['Produktname']]
+    df['Menge'] = pd.to_numeric(pd.Series([quantity for quantity, _ in quantities], index=df.index), errors='coerce')
+    df['Einheit'] = pd.Series([unit for _, unit in quantities], index=df.index, dtype=object)
+
+    prices = pd.to_numeric(df['Preis_EUR'].astype(str).str.replace(",", ".", regex=False), errors='coerce')
+    unit_prices = (prices / df['Menge']).round(2)
+    for unit, column in UNIT_PRICE_COLUMNS.items():
+        df[column] = unit_prices.where(df['Einheit'] == unit)
+    return df
+
+def format_unit_price(row) -> str | None:
+    """
+    Formatiert den Grundpreis einer Angebotszeile, z.B. '3.32 €/kg', oder None ohne Grundpreis.
+    """
+    for unit, column in UNIT_PRICE_COLUMNS.items():
+        value = row.get(column)
+        if value is not None and pd.notna(value):
+            return f"{value:.2f} €/{unit}"
+    return None
+
+def rank_by_unit_price(df: pd.DataFrame, limit: int) -> pd.DataFrame:
+    """
+    Sortiert Angebote nach Grundpreis (günstigstes zuerst) und behält die ersten `limit` Zeilen.
+
+    Verglichen wird in der häufigsten Einheit der Treffer (z.B. €/kg bei Nudeln).
+    Angebote ohne Grundpreis in dieser Einheit folgen danach, sortiert nach Preis.
+
+    Args:
+        df (DataFrame): Angebotsdaten mit den Spalten aus add_unit_prices
+        limit (int): Maximale Anzahl zurückgegebener Angebote
+
+    Returns:
+        DataFrame: Die nach Grundpreis sortierten günstigsten Angebote
+    """
+    if df.empty or 'Einheit' not in df.columns or df['Einheit'].isna().all():
+        return df.head(limit)
+
+    unit = df['Einheit'].mode().iloc[0]
+    ranking = pd.DataFrame({
+        'unit_price': df[UNIT_PRICE_COLUMNS[unit]],
+        'price': pd.to_numeric(df['Preis_EUR'].astype(str).str.replace(",", ".", regex=False), errors='coerce'),
+    }, index=df.index)
+    order = ranking.sort_values(['unit_price', 'price'], na_position='last', kind='stable').index
+    return df.loc[order[:limit]]